@@ -1,9 +1,13 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
 from django.contrib import admin
-from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import StreamingHttpResponse
 from django.template.response import TemplateResponse
 from django.urls import path
-from django.utils import timezone
 from django.shortcuts import redirect
 from django.contrib import messages
 
@@ -11,13 +15,23 @@ from .models import (
     Quiz,
     Question,
     CoursePage,
-    ChapterPage,
     SegmentPage,
     SegmentProgress,
     ChapterProgress,
     CourseProgress,
 )
-from .views import _is_chapter_complete, _is_course_complete
+from .reconcile import (
+    CHAPTER,
+    COURSE,
+    PROBLEM_LABELS,
+    Structure,
+    describe,
+    fix_worker,
+    issue_cursor,
+    iter_issues,
+)
+
+RECONCILE_PAGE_SIZE = 200
 
 
 @admin.register(Quiz)
@@ -55,139 +69,110 @@ class CourseProgressAdmin(admin.ModelAdmin):
         return custom_urls + urls
 
     def reconcile_view(self, request):
-        """Generate a report of progress records that need fixing."""
-        User = get_user_model()
-        users = User.objects.all()
-        courses = CoursePage.objects.live()
-
-        issues = []
-
-        for user in users:
-            for course in courses:
-                chapters = course.get_children().type(ChapterPage).live()
-
-                # Check chapters
-                for chapter in chapters:
-                    should_be_completed = _is_chapter_complete(user, chapter)
-                    if should_be_completed:
-                        cp = ChapterProgress.objects.filter(
-                            user=user, chapter=chapter
-                        ).first()
-                        if not cp:
-                            issues.append({
-                                "user": user.email,
-                                "type": "Chapter",
-                                "item": chapter.title,
-                                "course": course.title,
-                                "issue": "Missing record",
-                            })
-                        elif not cp.completed:
-                            issues.append({
-                                "user": user.email,
-                                "type": "Chapter",
-                                "item": chapter.title,
-                                "course": course.title,
-                                "issue": "Not marked complete",
-                            })
-
-                # Check course
-                should_course_be_completed = _is_course_complete(user, course)
-                if should_course_be_completed:
-                    cprog = CourseProgress.objects.filter(
-                        user=user, course=course
-                    ).first()
-                    if not cprog:
-                        issues.append({
-                            "user": user.email,
-                            "type": "Course",
-                            "item": course.title,
-                            "course": course.title,
-                            "issue": "Missing record",
-                        })
-                    elif not cprog.completed:
-                        issues.append({
-                            "user": user.email,
-                            "type": "Course",
-                            "item": course.title,
-                            "course": course.title,
-                            "issue": "Not marked complete",
-                        })
+        """Report progress records that need fixing: a page at a time, or
+        streamed as CSV or NDJSON with ?format=."""
+        structure = Structure()
+        filters = _reconcile_filters(request, structure)
+
+        export = request.GET.get("format")
+        if export in REPORT_FORMATS:
+            issues = iter_issues(structure, **filters)
+            content_type, lines = REPORT_FORMATS[export]
+            response = StreamingHttpResponse(
+                _stream(lines(describe(structure, issues))), content_type=content_type
+            )
+            response["Content-Disposition"] = (
+                f'attachment; filename="progress-reconciliation.{export}"'
+            )
+            return response
+
+        issues = list(
+            islice(
+                iter_issues(structure, after=request.GET.get("after"), **filters),
+                RECONCILE_PAGE_SIZE + 1,
+            )
+        )
+        page, has_next = issues[:RECONCILE_PAGE_SIZE], len(issues) > RECONCILE_PAGE_SIZE
 
         context = {
             **self.admin_site.each_context(request),
             "title": "Progress Reconciliation Report",
-            "issues": issues,
-            "issue_count": len(issues),
+            "issues": list(describe(structure, page)),
+            "next_cursor": issue_cursor(structure, page[-1]) if has_next else None,
+            "is_first_page": not request.GET.get("after"),
+            "applying": fix_worker.busy,
+            "courses": structure.course_titles.items(),
+            "selected": {key: request.GET.get(key, "") for key in ("course", "type", "issue")},
         }
         return TemplateResponse(
             request, "admin/courses/courseprogress/reconcile.html", context
         )
 
     def reconcile_apply_view(self, request):
-        """Apply fixes to progress records."""
+        """Apply every fix in the background."""
         if request.method != "POST":
             return redirect("admin:courses_courseprogress_reconcile")
 
-        User = get_user_model()
-        users = User.objects.all()
-        courses = CoursePage.objects.live()
-
-        chapter_created = 0
-        chapter_updated = 0
-        course_created = 0
-        course_updated = 0
-
-        for user in users:
-            for course in courses:
-                chapters = course.get_children().type(ChapterPage).live()
-
-                # Fix chapters
-                for chapter in chapters:
-                    should_be_completed = _is_chapter_complete(user, chapter)
-                    if should_be_completed:
-                        cp, created = ChapterProgress.objects.get_or_create(
-                            user=user,
-                            chapter=chapter,
-                            defaults={
-                                "completed": True,
-                                "completed_at": timezone.now(),
-                            },
-                        )
-                        if created:
-                            chapter_created += 1
-                        elif not cp.completed:
-                            cp.completed = True
-                            cp.completed_at = timezone.now()
-                            cp.save()
-                            chapter_updated += 1
-
-                # Fix course
-                should_course_be_completed = _is_course_complete(user, course)
-                if should_course_be_completed:
-                    cprog, created = CourseProgress.objects.get_or_create(
-                        user=user,
-                        course=course,
-                        defaults={
-                            "completed": True,
-                            "completed_at": timezone.now(),
-                        },
-                    )
-                    if created:
-                        course_created += 1
-                    elif not cprog.completed:
-                        cprog.completed = True
-                        cprog.completed_at = timezone.now()
-                        cprog.save()
-                        course_updated += 1
-
-        total = chapter_created + chapter_updated + course_created + course_updated
-        messages.success(
+        fix_worker.wake()
+        messages.info(
             request,
-            f"Reconciliation complete: {chapter_created} chapters created, "
-            f"{chapter_updated} chapters updated, {course_created} courses created, "
-            f"{course_updated} courses updated. Total: {total} changes.",
+            "Applying the fixes in the background. Reload the report in a few "
+            "minutes to see what is left.",
         )
-        return redirect("admin:courses_courseprogress_changelist")
+        return redirect("admin:courses_courseprogress_reconcile")
+
+
+def _reconcile_filters(request, structure):
+    """``iter_issues`` arguments for the report's course and issue filters."""
+    filters = {}
+    course = request.GET.get("course", "")
+    if course.isdigit() and int(course) in structure.course_titles:
+        filters["course_ids"] = [int(course)]
+    if request.GET.get("type") in (CHAPTER, COURSE):
+        filters["kinds"] = (request.GET["type"],)
+    if request.GET.get("issue") in PROBLEM_LABELS:
+        filters["problems"] = (request.GET["issue"],)
+    return filters
+
+
+REPORT_COLUMNS = ("user", "user_id", "type", "course", "course_id", "item", "item_id", "issue")
+
+
+class _Echo:
+    """A file-like object for csv.writer that hands back what it's given."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(REPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in REPORT_COLUMNS])
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+REPORT_FORMATS = {
+    "csv": ("text/csv", _csv_lines),
+    "ndjson": ("application/x-ndjson", _ndjson_lines),
+}
+
+
+async def _stream(lines, batch=500):
+    """
+    Serve ``lines`` from an async iterator. The site runs under ASGI, where
+    Django would read a synchronous streaming body into memory before
+    sending it; this pulls a batch at a time from the sync generator (which
+    queries the database) in the sync thread instead.
+    """
+    take = sync_to_async(lambda: "".join(islice(lines, batch)))
+    while chunk := await take():
+        yield chunk
 
 
 @admin.action(description="Update missing metadata (duration/aspect ratio) from Vimeo")
@@ -197,7 +182,7 @@ def update_missing_metadata(modeladmin, request, queryset):
     segment_count = 0
     for course in queryset:
         segments = (
-            SegmentPage.objects.filter(path__startswith=course.path, live=True)
+            SegmentPage.objects.filter(course=course, live=True)
             .exclude(video_url="")
             .filter(quizzes__isnull=True)
             .filter(Q(duration__isnull=True) | Q(aspect_ratio=0))
@@ -218,7 +203,7 @@ def update_all_metadata(modeladmin, request, queryset):
     segment_count = 0
     for course in queryset:
         segments = (
-            SegmentPage.objects.filter(path__startswith=course.path, live=True)
+            SegmentPage.objects.filter(course=course, live=True)
             .exclude(video_url="")
             .filter(quizzes__isnull=True)
         )
@@ -237,7 +222,7 @@ def fetch_missing_transcripts(modeladmin, request, queryset):
     fetched_count = 0
     for course in queryset:
         segments = (
-            SegmentPage.objects.filter(path__startswith=course.path, live=True)
+            SegmentPage.objects.filter(course=course, live=True)
             .exclude(video_url="")
             .filter(quizzes__isnull=True)
             .filter(transcript=[])
@@ -263,6 +248,9 @@ class CourseDurationAdmin(admin.ModelAdmin):
     class Media:
         js = ("courses/admin/transcript_progress.js",)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).light()
+
     def has_add_permission(self, request):
         return False
 
@@ -291,13 +279,11 @@ class CourseListFilter(admin.SimpleListFilter):
     parameter_name = "course"
 
     def lookups(self, request, model_admin):
-        return [(c.pk, c.title) for c in CoursePage.objects.order_by("title")]
+        return list(CoursePage.objects.order_by("title").values_list("pk", "title"))
 
     def queryset(self, request, queryset):
         if self.value():
-            course = CoursePage.objects.filter(pk=self.value()).first()
-            if course:
-                return queryset.filter(path__startswith=course.path)
+            return queryset.filter(course_id=self.value())
         return queryset
 
 
@@ -305,6 +291,7 @@ class CourseListFilter(admin.SimpleListFilter):
 class SegmentPageAdmin(admin.ModelAdmin):
     list_display = ("title", "course", "video_url", "has_transcript")
     list_filter = (CourseListFilter,)
+    list_select_related = ("course",)
     actions = [redownload_transcript]
 
     class Media:
@@ -314,9 +301,23 @@ class SegmentPageAdmin(admin.ModelAdmin):
     def course(self, obj):
         return obj.course_title or "—"
 
+    def get_queryset(self, request):
+        # The list never shows the transcript itself, only whether there is one
+        return (
+            super()
+            .get_queryset(request)
+            .light()
+            .defer(*(f"course__{field}" for field in CoursePage.heavy_fields))
+            .annotate(
+                transcript_present=ExpressionWrapper(
+                    ~Q(transcript=[]), output_field=BooleanField()
+                )
+            )
+        )
+
     @admin.display(boolean=True, description="Has transcript")
     def has_transcript(self, obj):
-        return bool(obj.transcript)
+        return obj.transcript_present
 
     def has_add_permission(self, request):
         return False
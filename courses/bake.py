@@ -0,0 +1,298 @@
+"""
+Static bake
+===========
+Pre-renders the public HTML of the site so the front end can serve it
+without reaching Django: the home page, the courses index, and every live
+chapter and segment page of each course that isn't "coming soon".
+
+Pages are rendered through the normal middleware and Wagtail routing, as an
+anonymous GET, and written to the "baked" storage (see STORAGES: a local
+directory, or the AZURE_CONTAINER_BAKED container) as ``<url>/index.html``.
+A response that isn't shareable with every visitor (not a 200, or it uses
+a CSRF token or a cookie, see ova/page_cache.py) isn't written, and any
+earlier copy is deleted so the front end falls back to Django.
+
+Baking is incremental. ``manifest.json`` in the same storage records, per
+page, a fingerprint of what the page was rendered from: its latest
+revision, its course's latest revision and a digest of the course outline
+(chapter and segment titles, URLs, numbers, durations and quizzes). Only
+pages whose fingerprint changed are re-rendered, and files are only
+rewritten when the HTML changed. The home page and courses index list
+every course, so they are rendered on every run. Edits that none of this
+covers (instructor profiles, tags) need ``bake_pages --force``.
+
+Renders run on a process pool (``--jobs``). With BAKE_ON_PUBLISH, publishing
+or unpublishing a page wakes an in-process worker that runs an incremental
+bake once the transaction commits.
+"""
+
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import django
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.db.models import Q
+from wagtail.models import Page, PageViewRestriction, Site
+
+from ova.background import BackgroundWorker
+from ova.page_cache import is_shareable
+
+from .models import CoursePage, CoursesIndexPage
+from .outline import get_course_outline
+
+logger = logging.getLogger(__name__)
+
+STORAGE_ALIAS = "baked"
+MANIFEST_NAME = "manifest.json"
+
+# Bump when the rendering setup changes, to re-render everything once
+BAKE_FORMAT = 1
+
+
+def baked_storage():
+    return storages[STORAGE_ALIAS]
+
+
+def file_name(url):
+    """Storage name of the baked copy of the page at ``url``."""
+    path = urlsplit(url).path.strip("/")
+    return f"{path}/index.html" if path else "index.html"
+
+
+def _outline_digest(outline):
+    return hashlib.sha256(repr(outline.chapters).encode()).hexdigest()[:16]
+
+
+def bake_targets():
+    """
+    ``(page id, url, fingerprint)`` for every page the bake covers. A
+    fingerprint of None means the page is rendered on every run.
+    """
+    HomePage = apps.get_model("home", "HomePage")
+    restricted = tuple(
+        PageViewRestriction.objects.values_list("page__path", flat=True)
+    )
+
+    def public(path):
+        return not path.startswith(restricted) if restricted else True
+
+    targets = []
+    for model in (HomePage, CoursesIndexPage):
+        for page in model.objects.live().only("id", "path", "url_path", "depth"):
+            url = page.get_url()
+            if url and public(page.path):
+                targets.append((page.id, url, None))
+
+    courses = CoursePage.objects.live().filter(
+        Q(coming_soon="") | Q(coming_soon__isnull=True)
+    ).only("id", "path", "latest_revision_id")
+    entries = []
+    for course in courses:
+        if not public(course.path):
+            continue
+        outline = get_course_outline(course.id)
+        digest = _outline_digest(outline)
+        for chapter in outline.chapters:
+            for entry in (chapter, *chapter.segments):
+                if entry.url and public(entry.path):
+                    entries.append((entry, course.latest_revision_id, digest))
+
+    revisions = dict(
+        Page.objects.filter(id__in=[entry.id for entry, _, _ in entries]).values_list(
+            "id", "latest_revision_id"
+        )
+    )
+    for entry, course_revision, digest in entries:
+        fingerprint = (
+            f"{BAKE_FORMAT}:{revisions.get(entry.id)}:{course_revision}:{digest}"
+        )
+        targets.append((entry.id, entry.url, fingerprint))
+    return targets
+
+
+def read_manifest(storage):
+    if not storage.exists(MANIFEST_NAME):
+        return {}
+    with storage.open(MANIFEST_NAME) as f:
+        manifest = json.load(f)
+    return manifest.get("pages", {})
+
+
+def _write(storage, name, content):
+    # Storages pick a new name rather than overwrite an existing file
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def _delete(storage, name):
+    if storage.exists(name):
+        storage.delete(name)
+
+
+class _Handler(BaseHandler):
+    """The project's middleware stack, for rendering pages outside a request."""
+
+    def __init__(self):
+        super().__init__()
+        self.load_middleware()
+
+
+_handler = None
+
+
+def render(url, host):
+    """Render ``url`` as an anonymous GET. Returns (request, response)."""
+    global _handler
+    if _handler is None:
+        _handler = _Handler()
+
+    parts = urlsplit(url)
+    hostname, port, scheme = host
+    request = WSGIRequest(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": parts.path,
+            "SCRIPT_NAME": "",
+            "QUERY_STRING": "",
+            "SERVER_NAME": hostname,
+            "SERVER_PORT": str(port),
+            "HTTP_HOST": hostname if port in (80, 443) else f"{hostname}:{port}",
+            "wsgi.url_scheme": scheme,
+            "wsgi.input": BytesIO(),
+        }
+    )
+    # Tells the page cache to stay out of the way
+    request.is_dummy = True
+    return request, _handler.get_response(request)
+
+
+def _bake_one(job):
+    """Render one page and write it if its HTML changed. Returns
+    ``(page id, content digest or None, whether the file was written)``."""
+    page_id, url, host, previous_digest = job
+    storage = baked_storage()
+    name = file_name(url)
+
+    request, response = render(url, host)
+    if not is_shareable(request, response):
+        logger.warning(
+            "Not baking %s: status %s or per-visitor content", url, response.status_code
+        )
+        _delete(storage, name)
+        return page_id, None, False
+
+    digest = hashlib.sha256(response.content).hexdigest()
+    if digest == previous_digest:
+        return page_id, digest, False
+    _write(storage, name, response.content)
+    return page_id, digest, True
+
+
+def _init_worker():
+    # Needed when the pool spawns rather than forks
+    django.setup()
+
+
+def _run(jobs, processes):
+    if processes <= 1 or len(jobs) <= 1:
+        return [_bake_one(job) for job in jobs]
+
+    # Forked workers must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        return list(pool.map(_bake_one, jobs, chunksize=8))
+
+
+def _site_host():
+    site = Site.objects.filter(is_default_site=True).first()
+    if site is None:
+        return ("localhost", 80, "http")
+    return (site.hostname, site.port, "https" if site.port == 443 else "http")
+
+
+def bake_pages(force=False, processes=1, dry_run=False):
+    """
+    Bring the baked copy of the site up to date. Returns counts of pages
+    ``rendered``, ``written`` (HTML changed), ``skipped`` (fingerprint
+    unchanged), ``failed`` (not shareable) and ``removed`` (no longer live).
+    With ``dry_run`` nothing is rendered or written; ``rendered`` is the
+    number of pages that would be.
+    """
+    storage = baked_storage()
+    manifest = read_manifest(storage)
+    host = _site_host()
+
+    jobs = []
+    fingerprints = {}
+    new_manifest = {}
+    for page_id, url, fingerprint in bake_targets():
+        key = str(page_id)
+        old = manifest.get(key)
+        same_url = old is not None and old["url"] == url
+        if not force and fingerprint and same_url and old["fingerprint"] == fingerprint:
+            new_manifest[key] = old
+            continue
+        fingerprints[key] = (url, fingerprint)
+        jobs.append((page_id, url, host, old["digest"] if same_url else None))
+
+    stale = [
+        entry["url"]
+        for key, entry in manifest.items()
+        if key not in new_manifest
+        and (key not in fingerprints or fingerprints[key][0] != entry["url"])
+    ]
+    counts = {
+        "rendered": len(jobs),
+        "written": 0,
+        "skipped": len(new_manifest),
+        "failed": 0,
+        "removed": len(stale),
+    }
+    if dry_run:
+        return counts
+
+    for url in stale:
+        _delete(storage, file_name(url))
+
+    for page_id, digest, written in _run(jobs, processes):
+        key = str(page_id)
+        if digest is None:
+            counts["failed"] += 1
+            continue
+        url, fingerprint = fingerprints[key]
+        new_manifest[key] = {"url": url, "fingerprint": fingerprint, "digest": digest}
+        counts["written"] += written
+
+    _write(
+        storage,
+        MANIFEST_NAME,
+        json.dumps({"format": BAKE_FORMAT, "pages": new_manifest}, indent=1).encode(),
+    )
+    return counts
+
+
+class BakeWorker(BackgroundWorker):
+    """
+    Runs an incremental bake in a background thread after pages are
+    published (BAKE_ON_PUBLISH). Publishes that arrive while a bake is
+    running are picked up by one more run.
+    """
+
+    name = "static-bake"
+    error_message = "Failed to bake published pages"
+
+    def work(self):
+        bake_pages()
+
+
+bake_worker = BakeWorker()
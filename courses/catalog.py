@@ -0,0 +1,209 @@
+"""
+Course catalog
+
+The course grid on the home page and the courses index
+(``partials/courses.html``) is the same for every visitor apart from the
+"Completed" badges. ``Catalog`` holds that shared part as plain tuples:
+one ``CatalogCourse`` per live course (title, URL, coming-soon label, image
+and instructor thumbnail URLs, sorted tags, topics, formatted duration),
+the sorted tag list and the topic vocabulary. It is built once and cached
+per courses index.
+
+The home page's instructor and contributor panels (``partials/people.html``)
+are cached the same way by ``get_people_panels``: one ``Person`` per
+instructor or contributor with their image rendition URL, stored social
+links and courses.
+
+Like the course outline, cache keys are versioned: ``invalidate_catalog``
+bumps the version (for both, see ova/cache_versions.py), and the receivers in signals.py call it when
+a course, tag, topic, instructor, role or image changes. Badges are applied
+per request by ``build_courses_listing_context`` from one CourseProgress
+query.
+"""
+
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from ova.cache_versions import bump_version, current_version
+
+from .models import (
+    CoursePage,
+    Instructor,
+    InstructorsOrderable,
+    Topic,
+    sort_tags_by_importance,
+)
+from .page_urls import page_urls
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bump when the pickled shape of the catalog changes
+CATALOG_FORMAT = 1
+PEOPLE_FORMAT = 1
+
+VERSION_KEY = "courses:catalog-version"
+
+CatalogTopic = namedtuple("CatalogTopic", "slug name")
+CatalogInstructor = namedtuple("CatalogInstructor", "name image_url")
+CatalogCourse = namedtuple(
+    "CatalogCourse",
+    "id title url coming_soon image_url instructors sorted_tags topics "
+    "formatted_duration completed",
+)
+
+Person = namedtuple(
+    "Person", "id name tagline bio image_url image_alt social_links courses"
+)
+PersonCourse = namedtuple("PersonCourse", "title url coming_soon")
+
+
+class Catalog:
+    def __init__(self, index_id, version, courses, all_tags, all_topics):
+        self.index_id = index_id
+        self.version = version
+        self.courses = tuple(courses)
+        self.all_tags = tuple(all_tags)
+        self.all_topics = tuple(all_topics)
+
+    def __repr__(self):
+        return f"<Catalog index={self.index_id} v{self.version}: {len(self.courses)} courses>"
+
+    def with_completed(self, course_ids):
+        """The course cards with ``completed`` set for ``course_ids``."""
+        return [
+            course._replace(completed=True) if course.id in course_ids else course
+            for course in self.courses
+        ]
+
+
+def _rendition_url(image, spec):
+    return image.get_rendition(spec).url if image else None
+
+
+def build_catalog(courses_index, version=0):
+    """Build the catalog for ``courses_index`` from the database (no cache)."""
+    courses = (
+        CoursePage.objects.child_of(courses_index)
+        .live()
+        .light()
+        .order_by("path")
+        .select_related("image")
+        .prefetch_related(
+            "tags",
+            "topics",
+            Prefetch(
+                "course_instructors",
+                queryset=InstructorsOrderable.objects.select_related(
+                    "instructor__image"
+                ),
+            ),
+        )
+    )
+
+    courses = list(courses)
+    # For courses without a first segment to link to
+    page_url = dict(
+        zip(
+            (course.id for course in courses),
+            page_urls(course.url_path for course in courses),
+        )
+    )
+
+    cards = []
+    tags = set()
+    for course in courses:
+        sorted_tags = course.sorted_tags
+        tags.update(sorted_tags)
+        cards.append(
+            CatalogCourse(
+                id=course.id,
+                title=course.title,
+                url=course._entry_url() or page_url[course.id],
+                coming_soon=course.coming_soon,
+                image_url=_rendition_url(course.image, "original"),
+                instructors=tuple(
+                    CatalogInstructor(
+                        link.instructor.name,
+                        _rendition_url(link.instructor.image, "fill-48x48"),
+                    )
+                    for link in course.course_instructors.all()
+                ),
+                sorted_tags=tuple(sorted_tags),
+                topics=tuple(
+                    CatalogTopic(topic.slug, topic.name) for topic in course.sorted_topics
+                ),
+                formatted_duration=course.formatted_duration,
+                completed=False,
+            )
+        )
+
+    return Catalog(
+        courses_index.id,
+        version,
+        cards,
+        sort_tags_by_importance(tags),
+        [CatalogTopic(topic.slug, topic.name) for topic in Topic.objects.all()],
+    )
+
+
+def invalidate_catalog():
+    bump_version(VERSION_KEY)
+
+
+def get_catalog(courses_index):
+    """The cached catalog for ``courses_index``."""
+    version = current_version(VERSION_KEY)
+    key = f"courses:catalog:{CATALOG_FORMAT}:{courses_index.id}:{version}"
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog(courses_index, version)
+        cache.set(key, catalog, CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+def build_people_panels():
+    """Instructors and contributors for the home page, by name."""
+    people = (
+        Instructor.objects.filter(role__name__in=["instructor", "contributor"])
+        .order_by("name")
+        .select_related("role", "image")
+        .prefetch_related(
+            Prefetch(
+                "instructor_course",
+                queryset=InstructorsOrderable.objects.select_related("page").defer(
+                    *(f"page__{field}" for field in CoursePage.heavy_fields)
+                ),
+            )
+        )
+    )
+
+    panels = {"instructors": [], "contributors": []}
+    for person in people:
+        panels[person.role.name + "s"].append(
+            Person(
+                id=person.id,
+                name=person.name,
+                tagline=person.tagline,
+                bio=person.bio,
+                image_url=_rendition_url(person.image, "fill-480x480"),
+                image_alt=(person.image.description if person.image else "") or "Profile",
+                social_links=tuple(person.processed_social_links),
+                courses=tuple(
+                    PersonCourse(link.page.title, link.page.url, link.page.coming_soon)
+                    for link in person.instructor_course.all()
+                ),
+            )
+        )
+    return panels
+
+
+def get_people_panels():
+    """The cached ``instructors`` and ``contributors`` lists."""
+    key = f"courses:people:{PEOPLE_FORMAT}:{current_version(VERSION_KEY)}"
+    panels = cache.get(key)
+    if panels is None:
+        panels = build_people_panels()
+        cache.set(key, panels, CATALOG_CACHE_TIMEOUT)
+    return panels
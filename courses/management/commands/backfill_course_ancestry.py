@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import CoursePage
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-sync the denormalised tree columns with the page tree: the '
+        'chapter/course of chapters and segments, and each course\'s first segment'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--course',
+            type=int,
+            action='append',
+            help='Only this course id (repeatable; default: all courses)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many rows are out of sync without changing them',
+        )
+
+    def handle(self, *args, **options):
+        courses = CoursePage.objects.order_by('path')
+        if options['course']:
+            courses = courses.filter(id__in=options['course'])
+
+        dry_run = options['dry_run']
+        total = 0
+        for course in courses:
+            changed = course.sync_ancestry(dry_run=dry_run)
+            if not dry_run:
+                changed += course.refresh_first_segment()
+            if changed:
+                self.stdout.write(f'{course.title}: {changed} rows')
+            total += changed
+
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING(f'{total} rows out of sync (dry run)')
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Updated {total} rows'))
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses.bake import bake_pages
+
+
+class Command(BaseCommand):
+    help = 'Pre-render public pages to the "baked" storage (see courses/bake.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=settings.BAKE_JOBS,
+            help=f'Render processes (default: BAKE_JOBS, {settings.BAKE_JOBS})',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render every page, even if its fingerprint is unchanged',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many pages would be rendered without rendering them',
+        )
+
+    def handle(self, *args, **options):
+        counts = bake_pages(
+            force=options['force'],
+            processes=options['jobs'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{counts["rendered"]} pages to render, {counts["skipped"]} '
+                    f'unchanged, {counts["removed"]} to remove (dry run)'
+                )
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rendered {counts["rendered"]} pages ({counts["written"]} changed), '
+                f'skipped {counts["skipped"]} unchanged, removed {counts["removed"]}'
+            )
+        )
+        if counts["failed"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{counts["failed"]} pages were not shareable and were not baked'
+                )
+            )
@@ -0,0 +1,127 @@
+"""
+Management command: benchmark_progress
+
+Compares concurrent-request throughput of the sync (update_progress) and
+async (update_progress_async) heartbeat views. Requests are sent through
+Django's ASGI handler in-process, the same path Daphne takes, so sync views
+pay the sync_to_async hop exactly as they do in production.
+
+USAGE
+
+  python manage.py benchmark_progress --requests 2000 --concurrency 100
+
+Notes:
+- Runs against the configured database; point it at a copy, not production
+- Temporary users are created for the run and deleted afterwards, along
+  with the progress rows they wrote
+- Heartbeats stay below 100% so no completion is recorded
+"""
+
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.urls import reverse
+
+from courses.models import SegmentPage, SegmentProgress
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent throughput of the sync and async progress views"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Heartbeats sent to each view (default: 1000)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=50,
+            help="Heartbeats in flight at once (default: 50)",
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=10,
+            help="Temporary users the heartbeats are spread over (default: 10)",
+        )
+        parser.add_argument(
+            "--segment",
+            type=int,
+            help="Segment id to heartbeat (default: the first live segment)",
+        )
+
+    def handle(self, *args, **options):
+        segments = SegmentPage.objects.live()
+        if options["segment"]:
+            segments = segments.filter(id=options["segment"])
+        segment_id = segments.values_list("id", flat=True).first()
+        if segment_id is None:
+            raise CommandError("No live segment to benchmark against")
+
+        users = [
+            User.objects.create_user(email=f"progress-bench-{i}@example.invalid")
+            for i in range(options["users"])
+        ]
+        try:
+            for name in ("update_progress", "update_progress_async"):
+                # Fresh rows per view so both start from the same state
+                SegmentProgress.objects.filter(user__in=users).delete()
+                result = async_to_sync(self._run)(
+                    reverse(name),
+                    users,
+                    segment_id,
+                    options["requests"],
+                    options["concurrency"],
+                )
+                self._report(name, result)
+        finally:
+            User.objects.filter(id__in=[u.id for u in users]).delete()
+
+    async def _run(self, url, users, segment_id, total, concurrency):
+        clients = []
+        for user in users:
+            client = AsyncClient()
+            await client.aforce_login(user)
+            clients.append(client)
+
+        gate = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def heartbeat(i):
+            nonlocal errors
+            # Rising percentages so most heartbeats really write
+            body = json.dumps(
+                {"segment_id": segment_id, "percent_watched": 99 * (i + 1) / total}
+            )
+            async with gate:
+                started = time.perf_counter()
+                resp = await clients[i % len(clients)].post(
+                    url, data=body, content_type="application/json"
+                )
+                latencies.append(time.perf_counter() - started)
+            if resp.status_code != 200:
+                errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(heartbeat(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        return elapsed, sorted(latencies), errors
+
+    def _report(self, name, result):
+        elapsed, latencies, errors = result
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{name:24} {len(latencies) / elapsed:8.1f} req/s   "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms   "
+            f"p95 {p95 * 1000:7.1f} ms   errors {errors}"
+        )
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import PendingCompletion
+from courses.progress import process_pending_completions
+
+
+class Command(BaseCommand):
+    help = 'Reconcile queued segment completions (PROGRESS_RECONCILE_MODE = "deferred")'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Queue rows to reconcile per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many completions are queued without processing them',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = PendingCompletion.objects.count()
+            self.stdout.write(
+                self.style.WARNING(f'{count} completions queued (dry run)')
+            )
+            return
+
+        total = 0
+        while True:
+            processed = process_pending_completions(limit=options['batch_size'])
+            if not processed:
+                break
+            total += processed
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Reconciled {total} queued completions')
+        )
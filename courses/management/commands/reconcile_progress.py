@@ -0,0 +1,57 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from courses.reconcile import CHAPTER, COURSE, INCOMPLETE, MISSING, iter_issues, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Mark chapter and course progress complete wherever every segment has been watched'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--course',
+            type=int,
+            action='append',
+            dest='courses',
+            help='Only reconcile this course id (repeatable; default: all live courses)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Progress rows to write per query (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be fixed without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            found = Counter(
+                (issue.kind, issue.problem)
+                for issue in iter_issues(course_ids=options['courses'])
+            )
+            for kind in (CHAPTER, COURSE):
+                self.stdout.write(
+                    f'{kind.title()} progress: {found[kind, MISSING]} missing, '
+                    f'{found[kind, INCOMPLETE]} not marked complete'
+                )
+            self.stdout.write(
+                self.style.WARNING(
+                    f'{sum(found.values())} records would be fixed (dry run)'
+                )
+            )
+            return
+
+        counts = reconcile(course_ids=options['courses'], batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reconciliation complete: {counts['chapter_created']} chapters created, "
+                f"{counts['chapter_updated']} chapters updated, "
+                f"{counts['course_created']} courses created, "
+                f"{counts['course_updated']} courses updated"
+            )
+        )
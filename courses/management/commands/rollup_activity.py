@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ova.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update the daily learner activity rollups behind the analytics dashboard (run it from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute every day instead of only those since the last run',
+        )
+
+    def handle(self, *args, **options):
+        first_day = update_rollups(rebuild=options['rebuild'])
+        if first_day is None:
+            self.stdout.write(self.style.WARNING('No activity to roll up yet'))
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rolled up daily activity from {first_day:%Y-%m-%d}')
+        )
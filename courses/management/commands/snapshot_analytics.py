@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses.models import AnalyticsSnapshot
+from ova.analytics import take_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Store a snapshot of the admin analytics dashboard metrics (run it from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=None,
+            help='Delete snapshots older than this many days (default: keep all)',
+        )
+
+    def handle(self, *args, **options):
+        snapshot = take_snapshot()
+        self.stdout.write(self.style.SUCCESS(f'Stored {snapshot}'))
+
+        if options['keep_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['keep_days'])
+            deleted, _ = AnalyticsSnapshot.objects.filter(created_at__lt=cutoff).delete()
+            self.stdout.write(f'Deleted {deleted} snapshots older than {cutoff:%Y-%m-%d}')
@@ -0,0 +1,72 @@
+# Seed the completion counters from progress recorded before they existed.
+from collections import Counter
+
+from django.db import migrations
+
+STEPLEN = 4
+
+
+def backfill_counters(apps, schema_editor):
+    SegmentProgress = apps.get_model("courses", "SegmentProgress")
+    ChapterPage = apps.get_model("courses", "ChapterPage")
+    CoursePage = apps.get_model("courses", "CoursePage")
+    ChapterProgress = apps.get_model("courses", "ChapterProgress")
+    ChapterCompletionCounter = apps.get_model("courses", "ChapterCompletionCounter")
+    CourseCompletionCounter = apps.get_model("courses", "CourseCompletionCounter")
+
+    chapter_ids = dict(ChapterPage.objects.values_list("path", "id"))
+    course_ids = dict(CoursePage.objects.values_list("path", "id"))
+
+    # Completed live segments per (user, chapter)
+    segments_done = Counter()
+    for user_id, path in SegmentProgress.objects.filter(
+        percent_watched__gte=100, segment__live=True
+    ).values_list("user_id", "segment__path"):
+        chapter_id = chapter_ids.get(path[:-STEPLEN])
+        if chapter_id:
+            segments_done[(user_id, chapter_id)] += 1
+
+    ChapterCompletionCounter.objects.bulk_create(
+        [
+            ChapterCompletionCounter(
+                user_id=user_id, chapter_id=chapter_id, completed_segments=count
+            )
+            for (user_id, chapter_id), count in segments_done.items()
+        ],
+        batch_size=1000,
+    )
+
+    # Completed non-intro chapters per (user, course)
+    chapters_done = Counter()
+    for user_id, path in ChapterProgress.objects.filter(
+        completed=True, chapter__live=True, chapter__is_intro=False
+    ).values_list("user_id", "chapter__path"):
+        course_id = course_ids.get(path[:-STEPLEN])
+        if course_id:
+            chapters_done[(user_id, course_id)] += 1
+
+    CourseCompletionCounter.objects.bulk_create(
+        [
+            CourseCompletionCounter(
+                user_id=user_id, course_id=course_id, completed_chapters=count
+            )
+            for (user_id, course_id), count in chapters_done.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def clear_counters(apps, schema_editor):
+    apps.get_model("courses", "ChapterCompletionCounter").objects.all().delete()
+    apps.get_model("courses", "CourseCompletionCounter").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0029_completion_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, clear_counters),
+    ]
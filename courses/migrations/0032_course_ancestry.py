@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0031_pendingcompletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapterpage',
+            name='course',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.coursepage'),
+        ),
+        migrations.AddField(
+            model_name='segmentpage',
+            name='chapter',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.chapterpage'),
+        ),
+        migrations.AddField(
+            model_name='segmentpage',
+            name='course',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.coursepage'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Fill the denormalised chapter/course columns for pages that predate them.
+from django.db import migrations
+
+STEPLEN = 4
+
+
+def backfill_ancestry(apps, schema_editor):
+    CoursePage = apps.get_model("courses", "CoursePage")
+    ChapterPage = apps.get_model("courses", "ChapterPage")
+    SegmentPage = apps.get_model("courses", "SegmentPage")
+
+    course_ids = dict(CoursePage.objects.values_list("path", "id"))
+
+    for chapter_id, path in ChapterPage.objects.values_list("id", "path"):
+        course_id = course_ids.get(path[:-STEPLEN])
+        if course_id is None:
+            continue
+        ChapterPage.objects.filter(id=chapter_id).update(course_id=course_id)
+        SegmentPage.objects.filter(path__startswith=path).update(
+            chapter_id=chapter_id, course_id=course_id
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("courses", "0032_course_ancestry"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ancestry, migrations.RunPython.noop),
+    ]
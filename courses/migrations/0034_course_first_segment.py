@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0033_backfill_course_ancestry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursepage',
+            name='first_segment',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.segmentpage'),
+        ),
+        migrations.AddField(
+            model_name='coursepage',
+            name='first_segment_url',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:28
+
+import re
+
+from django.db import migrations, models
+
+SOCIAL_LINK_PREFIX = re.compile(r"^(https?://)?(www\.)?", re.IGNORECASE)
+
+
+def backfill_processed_links(apps, schema_editor):
+    Instructor = apps.get_model("courses", "Instructor")
+
+    for instructor in Instructor.objects.all():
+        instructor.processed_social_links = [
+            {"url": link, "clean": SOCIAL_LINK_PREFIX.sub("", link).rstrip("/")}
+            for link in instructor.social_links
+        ]
+        instructor.save(update_fields=["processed_social_links"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0034_course_first_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instructor',
+            name='processed_social_links',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_processed_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0035_instructor_processed_social_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('metrics', models.JSONField()),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'get_latest_by': 'created_at',
+            },
+        ),
+    ]
@@ -66,14 +66,9 @@ class QuizMixin:
         )
 
     def mark_segment_complete(self, user, score):
-        from .models import SegmentProgress
+        from .progress import record_segment_progress
 
-        seg_prog, _ = SegmentProgress.objects.get_or_create(
-            user=user,
-            segment=self,
-        )
-        seg_prog.percent_watched = score
-        seg_prog.save()
+        record_segment_progress(user, self.id, score)
 
     def handle_quiz_submission(self, request):
         quiz = self.get_quiz()
@@ -108,34 +103,41 @@ class QuizMixin:
 
         return TemplateResponse(request, self.get_template(request), context)
 
-    def hydrate_quiz_from_progress(self, request):
-        if not request.user.is_authenticated:
-            return None
-
-        quiz = self.get_quiz()
-        if not quiz:
-            return None
+    @staticmethod
+    def quiz_context(state):
+        """Template variables for a previous submission, from the ``quiz``
+        entry of a segment overlay (courses/overlay.py)."""
+        # Normalize keys back to ints for template logic
+        return {
+            "answers": {int(k): v for k, v in state["answers"].items()},
+            "answer_results": {int(k): v for k, v in state["results"].items()},
+            "submitted": True,
+            "score": state["score"],
+        }
 
-        from .models import QuizProgress
 
-        qp = QuizProgress.objects.filter(
-            user=request.user,
-            quiz=quiz,
-        ).first()
+class OutlineEntryMixin:
+    """
+    For chapter and segment pages: their entry in the course's cached
+    CourseOutline, and the display numbers stored there. The outline numbers
+    a course once per structure change, not once per page view.
+    """
 
-        if not qp or not qp.answers_snapshot:
-            return None
+    def get_course_outline(self):
+        from courses.outline import outline_for_page
 
-        raw = qp.answers_snapshot
+        outline = getattr(self, "_outline", None)
+        if outline is None:
+            outline = self._outline = outline_for_page(self)
+        return outline
 
-        # Normalize keys back to ints for template logic
-        answers = {int(k): v for k, v in raw.get("answers", {}).items()}
-        answer_results = {int(k): v for k, v in raw.get("results", {}).items()}
+    @property
+    def outline_entry(self):
+        outline = self.get_course_outline()
+        return outline.at_path(self.path) if outline else None
 
-        return {
-            "quiz": quiz,
-            "answers": answers,
-            "answer_results": answer_results,
-            "submitted": True,
-            "score": qp.score or 0,
-        }
+    @property
+    def number(self):
+        """Display number (None for intro chapters and unpublished pages)."""
+        entry = self.outline_entry
+        return entry.number if entry else None
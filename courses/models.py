@@ -1,7 +1,6 @@
 from django import forms
 from django.conf import settings
 from django.db import models
-from django.db.models import Prefetch
 from django.contrib.auth import get_user_model
 from django.shortcuts import redirect
 from django.utils.text import slugify
@@ -22,7 +21,8 @@ import logging
 import re
 import requests
 
-from .mixins import QuizMixin
+from .mixins import OutlineEntryMixin, QuizMixin
+from .querysets import LightPageManager
 
 logger = logging.getLogger(__name__)
 
@@ -68,6 +68,19 @@ class InstructorsOrderable(Orderable):
     ]
 
 
+# Protocol and "www." are dropped from the link text shown for social links
+SOCIAL_LINK_PREFIX = re.compile(r"^(https?://)?(www\.)?", re.IGNORECASE)
+
+
+def process_social_links(links):
+    """``links`` as ``{"url", "clean"}`` dicts: the full URL for the href and
+    the text to show (no protocol, www. or trailing slash)."""
+    return [
+        {"url": link, "clean": SOCIAL_LINK_PREFIX.sub("", link).rstrip("/")}
+        for link in links
+    ]
+
+
 @register_snippet
 class Instructor(models.Model):
     name = models.CharField(max_length=255)
@@ -81,6 +94,8 @@ class Instructor(models.Model):
         related_name="+",
     )
     social_links = models.JSONField(default=list, blank=True)
+    # Kept in sync with social_links on save
+    processed_social_links = models.JSONField(default=list, editable=False)
     active = models.BooleanField(default=False)
     role = models.ForeignKey("Role", on_delete=models.SET_NULL, null=True, blank=True)
 
@@ -107,6 +122,13 @@ class Instructor(models.Model):
         ),
     ]
 
+    def save(self, *args, **kwargs):
+        self.processed_social_links = process_social_links(self.social_links)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "social_links" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "processed_social_links"}
+        return super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -158,50 +180,29 @@ def build_courses_listing_context(courses_index, user):
     """Shared context for the course-grid partial (``partials/courses.html``),
     used by both the courses index page and the home page.
 
-    Returns ``courses`` (each annotated with a ``completed`` flag for
-    authenticated users), ``all_tags`` (curated order) and ``all_topics``.
+    Returns ``courses`` (the cached catalog cards, see catalog.py, with
+    ``completed`` set for authenticated users), ``all_tags`` (curated order)
+    and ``all_topics``.
     """
-    courses_query = (
-        courses_index.get_children()
-        .live()
-        .specific()
-        .prefetch_related(
-            "tags",
-            "topics",
-            "course_instructors__instructor",
-            "course_instructors__instructor__image",
-            "image",  # Prefetch course images
-        )
-    )
+    from .catalog import get_catalog
+
+    catalog = get_catalog(courses_index)
 
-    # Add progress prefetch for authenticated users
     if user.is_authenticated:
-        progress_queryset = CourseProgress.objects.filter(user=user)
-        courses_query = courses_query.prefetch_related(
-            Prefetch(
-                "courseprogress_set",
-                queryset=progress_queryset,
-                to_attr="progress",
+        completed = set(
+            CourseProgress.objects.filter(user=user, completed=True).values_list(
+                "course_id", flat=True
             )
         )
-
-    # Evaluate queryset ONCE into a list
-    courses = list(courses_query)
-
-    # Collect tags and set completed flag - data already loaded
-    tags = set()
-    for course in courses:
-        for tag in course.tags.all():
-            tags.add(str(tag))
-        if user.is_authenticated:
-            progress = course.progress[0] if course.progress else None
-            course.completed = progress.completed if progress else False
+        courses = catalog.with_completed(completed)
+    else:
+        courses = list(catalog.courses)
 
     return {
         "courses": courses,
-        "all_tags": sort_tags_by_importance(tags),
+        "all_tags": catalog.all_tags,
         # Controlled topic vocabulary for the "Topic of Interest" filter
-        "all_topics": Topic.objects.all(),
+        "all_topics": catalog.all_topics,
     }
 
 
@@ -266,6 +267,10 @@ class SegmentMaterial(Orderable):
 class CoursePage(Page):
     """Instructors are linked via InstructorsOrderable model to implement many to one."""
 
+    objects = LightPageManager()
+    # Left out of list queries by .light() (see querysets.py)
+    heavy_fields = ("content",)
+
     duration = models.DurationField(blank=True, null=True)
     duration_seconds = models.PositiveIntegerField(blank=True, null=True)
     updated_on = models.DateTimeField(blank=True, null=True)
@@ -306,6 +311,19 @@ class CoursePage(Page):
         help_text="Enable if this course's instructor numbers segments in their recorded video starting at 0 (e.g. video shows 5.0, 5.1, 5.2...). When enabled, the site's segment numbers are shifted to match.",
     )
 
+    # The course's entry point (first live segment of its first live
+    # chapter), stored so get_url/serve need no tree queries. Refreshed
+    # whenever the course's structure changes (signals.py).
+    first_segment = models.ForeignKey(
+        "courses.SegmentPage",
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    first_segment_url = models.CharField(max_length=255, blank=True, editable=False)
+
     content_panels = Page.content_panels + [
         FieldRowPanel(
             [
@@ -387,6 +405,29 @@ class CoursePage(Page):
 
         return super().save(*args, **kwargs)
 
+    def sync_ancestry(self, dry_run=False):
+        """
+        Point the denormalised ``course``/``chapter`` columns of every chapter
+        and segment below this course at their current ancestors. Returns the
+        number of rows that were (or with ``dry_run``, would be) changed.
+        """
+
+        def apply(queryset, **values):
+            return queryset.count() if dry_run else queryset.update(**values)
+
+        chapters = ChapterPage.objects.filter(
+            path__startswith=self.path, depth=self.depth + 1
+        )
+        changed = apply(chapters.exclude(course_id=self.id), course_id=self.id)
+
+        for chapter_id, chapter_path in chapters.values_list("id", "path"):
+            segments = SegmentPage.objects.filter(path__startswith=chapter_path).exclude(
+                chapter_id=chapter_id, course_id=self.id
+            )
+            changed += apply(segments, chapter_id=chapter_id, course_id=self.id)
+
+        return changed
+
     def get_all_materials(self):
         # 1. Course-level materials
         materials = list(self.materials.all())
@@ -441,11 +482,9 @@ class CoursePage(Page):
                 'course': self,
                 'estimated_release': self.coming_soon,
             }, status=403)
-        first_ch = self.get_children().type(ChapterPage).live().first()
-        if first_ch:
-            first_seg = first_ch.get_children().type(SegmentPage).live().first()
-            if first_seg:
-                return redirect(first_seg.url)
+        entry_url = self._entry_url()
+        if entry_url:
+            return redirect(entry_url)
 
         # If no segments/chapters, fall back to normal view
         return super().serve(request)
@@ -453,18 +492,49 @@ class CoursePage(Page):
     # Resolve URL to first segment of first chapter (that way no one ends up on the course page)
     # This "becomes" the url for the course
     def get_url(self, request=None, *args, **kwargs):
-        # Get the first chapter
-        first_ch = self.get_children().type(ChapterPage).live().specific().first()
-        if not first_ch:
-            return super().get_url(request, *args, **kwargs)
-
-        # Get the first segment
-        first_seg = first_ch.get_children().type(SegmentPage).live().specific().first()
-        if not first_seg:
+        entry_url = self._entry_url()
+        if not entry_url:
             return super().get_url(request, *args, **kwargs)
 
         # Return the segment URL instead
-        return first_seg.get_url(request, *args, **kwargs)
+        return entry_url
+
+    def _entry_url(self):
+        if self.first_segment_url:
+            return self.first_segment_url
+        # Not stored yet (e.g. rows older than the column): cached outline
+        first_seg = self.outline.first_segment if self.pk else None
+        return first_seg.url if first_seg else None
+
+    def refresh_first_segment(self):
+        """
+        Store the id and URL of the course's first live segment (in a live
+        chapter), without saving the page. Returns whether they changed.
+        """
+        segment = (
+            SegmentPage.objects.live()
+            .filter(course_id=self.pk, chapter__live=True)
+            .order_by("path")
+            .only("id", "path", "depth", "url_path")
+            .first()
+        )
+        segment_id = segment.id if segment else None
+        url = (segment.get_url() or "") if segment else ""
+        if (segment_id, url) == (self.first_segment_id, self.first_segment_url):
+            return False
+
+        self.first_segment_id, self.first_segment_url = segment_id, url
+        CoursePage.objects.filter(pk=self.pk).update(
+            first_segment_id=segment_id, first_segment_url=url
+        )
+        return True
+
+    @property
+    def outline(self):
+        """This course's cached CourseOutline (see courses/outline.py)."""
+        from .outline import get_course_outline
+
+        return get_course_outline(self.pk)
 
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
@@ -478,11 +548,24 @@ class CoursePage(Page):
         return context
 
 
-class ChapterPage(Page):
+class ChapterPage(OutlineEntryMixin, Page):
+    objects = LightPageManager()
+    heavy_fields = ("content",)
+
     is_intro = models.BooleanField(
         default=False,
         help_text="Intro chapters are not numbered in the chapter list.",
     )
+    # Denormalised from the tree so the course is a plain column away; set on
+    # save, re-synced on move (signals.py) and by backfill_course_ancestry
+    course = models.ForeignKey(
+        CoursePage,
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
     content = StreamField(
         [
             ("rich_text", RichTextBlock()),
@@ -512,12 +595,26 @@ class ChapterPage(Page):
         # update slug to match title whenever it is changed
         self.slug = slugify(self.title)
 
+        # Partial saves (e.g. numchild, revisions) don't move the page
+        if kwargs.get("update_fields") is None:
+            self.sync_ancestry()
+
         return super().save(*args, **kwargs)
 
+    def sync_ancestry(self):
+        """Set ``course`` from the page's tree path (doesn't save)."""
+        self.course_id = (
+            CoursePage.objects.filter(path=self.path[: -self.steplen])
+            .values_list("id", flat=True)
+            .first()
+            if self.path
+            else None
+        )
+
     def serve(self, request):
         # Check parent course's coming soon restrictions
-        course = self.get_parent().specific
-        if hasattr(course, 'user_has_access') and not course.user_has_access(request.user):
+        course = self.course
+        if course and not course.user_has_access(request.user):
             return render(request, 'courses/coming_soon.html', {
                 'page': self,
                 'course': course,
@@ -529,12 +626,13 @@ class ChapterPage(Page):
     def get_context(self, request, *args, **kwargs):
         context = super().get_context(request, *args, **kwargs)
 
-        course = self.get_parent()
-        course = course.specific if hasattr(course, "specific") else None
+        course = self.course
         context["course"] = course
 
-        # Segments in this chapter (preloaded to avoid query in template)
-        context["segments"] = self.get_children().live().specific()
+        # Segments in this chapter, with their URLs and numbers, from the
+        # cached course outline
+        entry = self.outline_entry
+        context["segments"] = entry.segments if entry else ()
 
         # Chapter materials
         context["chapter_materials"] = self.materials.all()
@@ -632,7 +730,10 @@ def _group_cues_into_paragraphs(cues):
     return paragraphs
 
 
-class SegmentPage(QuizMixin, Page):
+class SegmentPage(OutlineEntryMixin, QuizMixin, Page):
+    objects = LightPageManager()
+    heavy_fields = ("transcript", "content")
+
     video_url = models.URLField(blank=True)
     duration = models.DurationField(blank=True, null=True)
 
@@ -645,6 +746,24 @@ class SegmentPage(QuizMixin, Page):
     # server-side (for SEO) with no per-request computation.
     transcript = models.JSONField(blank=True, default=list)
 
+    # Denormalised from the tree, like ChapterPage.course
+    chapter = models.ForeignKey(
+        ChapterPage,
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    course = models.ForeignKey(
+        CoursePage,
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+
     content = StreamField(
         [
             ("rich_text", RichTextBlock()),
@@ -697,50 +816,26 @@ class SegmentPage(QuizMixin, Page):
 
     @property
     def course_title(self):
-        chapter = self.get_parent()
-        course = chapter.get_parent() if chapter else None
-        return course.specific.title if course else ""
+        return self.course.title if self.course else ""
+
+    @property
+    def chapter_number(self):
+        """Display number of this segment's chapter (None for intro)."""
+        outline = self.get_course_outline()
+        chapter = outline.chapter(self.chapter_id) if outline else None
+        return chapter.number if chapter else None
 
     def _get_adjacent_segment(self, direction):
         """
-        Internal helper to get the next or previous segment.
+        Internal helper to get the next or previous segment, as an
+        OutlineSegment (id, title, url, ...) from the course outline.
         direction: "next" or "previous"
         """
-
         if direction not in ("next", "previous"):
             raise ValueError("direction must be 'next' or 'previous'")
 
-        # Select the correct sibling lookup
-        sibling_lookup = (
-            self.get_next_siblings().live().specific()
-            if direction == "next"
-            else self.get_prev_siblings().live().specific()
-        )
-
-        # 1. Try sibling segments
-        sibling = sibling_lookup.first()
-        if sibling:
-            return sibling
-
-        # 2. No siblings -> look in next/previous chapter
-        chapter = self.get_parent().specific
-
-        chapter_lookup = (
-            chapter.get_next_siblings().type(ChapterPage).live().specific()
-            if direction == "next"
-            else chapter.get_prev_siblings().type(ChapterPage).live().specific()
-        )
-
-        adjacent_chapter = chapter_lookup.first()
-        if not adjacent_chapter:
-            return None
-
-        # 3. Select first/last segment of that chapter
-        segment_lookup = (
-            adjacent_chapter.get_children().type(SegmentPage).live().specific()
-        )
-
-        return segment_lookup.first() if direction == "next" else segment_lookup.last()
+        outline = self.get_course_outline()
+        return outline.adjacent(self.id, direction) if outline else None
 
     def get_next_segment(self):
         return self._get_adjacent_segment("next")
@@ -775,6 +870,10 @@ class SegmentPage(QuizMixin, Page):
             self.height = None
             self.aspect_ratio = 0
 
+        # Partial saves (e.g. revisions) don't move the page
+        if kwargs.get("update_fields") is None:
+            self.sync_ancestry()
+
         result = super().save(*args, **kwargs)
 
         if video_url_changed and self.video_url:
@@ -784,6 +883,18 @@ class SegmentPage(QuizMixin, Page):
 
         return result
 
+    def sync_ancestry(self):
+        """Set ``chapter`` and ``course`` from the page's tree path (doesn't
+        save)."""
+        row = (
+            ChapterPage.objects.filter(path=self.path[: -self.steplen])
+            .values_list("id", "course_id")
+            .first()
+            if self.path
+            else None
+        )
+        self.chapter_id, self.course_id = row or (None, None)
+
     def _refresh_vimeo_duration(self):
         from datetime import timedelta
 
@@ -817,6 +928,8 @@ class SegmentPage(QuizMixin, Page):
 
             if updates:
                 SegmentPage.objects.filter(pk=self.pk).update(**updates)
+                # update() skips the signals that version outline and shell
+                self._invalidate_course_outline()
 
             if "duration" in updates:
                 self._update_course_duration_seconds()
@@ -828,17 +941,20 @@ class SegmentPage(QuizMixin, Page):
                 e,
             )
 
+    def _invalidate_course_outline(self):
+        from ova.page_cache import bump_content_version
+        from .outline import invalidate_course_outline
+
+        if self.course_id:
+            invalidate_course_outline(self.course_id)
+        # update() skips the page signals the page cache listens to
+        bump_content_version()
+
     def _update_course_duration_seconds(self):
-        chapter = self.get_parent()
-        if not chapter:
-            return
-        course = chapter.get_parent()
-        if not course:
+        if not self.course_id:
             return
 
-        segments = SegmentPage.objects.filter(
-            path__startswith=course.path,
-        ).live()
+        segments = SegmentPage.objects.filter(course_id=self.course_id).live()
 
         total_seconds = sum(
             int(seg.duration.total_seconds())
@@ -846,7 +962,14 @@ class SegmentPage(QuizMixin, Page):
             if seg.duration
         )
 
-        CoursePage.objects.filter(pk=course.pk).update(duration_seconds=total_seconds)
+        CoursePage.objects.filter(pk=self.course_id).update(
+            duration_seconds=total_seconds
+        )
+
+        from .catalog import invalidate_catalog
+
+        # The catalog shows each course's duration
+        invalidate_catalog()
 
     def _refresh_vimeo_transcript(self):
         """
@@ -900,6 +1023,7 @@ class SegmentPage(QuizMixin, Page):
 
             self.transcript = paragraphs
             SegmentPage.objects.filter(pk=self.pk).update(transcript=paragraphs)
+            self._invalidate_course_outline()
             return True
         except Exception as e:
             logger.warning(
@@ -912,28 +1036,19 @@ class SegmentPage(QuizMixin, Page):
 
     def serve(self, request):
         # Check parent course's coming soon restrictions
-        chapter = self.get_parent()
-        if chapter:
-            course = chapter.get_parent()
-            if course and hasattr(course, 'specific'):
-                course = course.specific
-                if hasattr(course, 'user_has_access') and not course.user_has_access(request.user):
-                    return render(request, 'courses/coming_soon.html', {
-                        'page': self,
-                        'course': course,
-                        'estimated_release': course.coming_soon,
-                    }, status=403)
+        course = self.course
+        if course and not course.user_has_access(request.user):
+            return render(request, 'courses/coming_soon.html', {
+                'page': self,
+                'course': course,
+                'estimated_release': course.coming_soon,
+            }, status=403)
 
         # POST always wins
         if request.method == "POST":
             return self.handle_quiz_submission(request)
 
         context = self.get_context(request)
-
-        hydrated = self.hydrate_quiz_from_progress(request)
-        if hydrated:
-            context.update(hydrated)
-
         return render(request, self.get_template(request), context)
 
     def get_context(self, request, *args, **kwargs):
@@ -945,22 +1060,11 @@ class SegmentPage(QuizMixin, Page):
             context["vimeo_id"] = match.group(1) if match else None
         context["transcript"] = self.transcript
 
-        # Parent chapter
-        # .specific is required: get_parent() returns a generic Page, which lacks
-        # ChapterPage fields like is_intro. During normal routing Wagtail caches the
-        # specific parent as an optimisation so the bug is invisible, but preview
-        # bypasses routing and exposes it.
-        chapter = self.get_parent()
-        if chapter:
-            chapter = chapter.specific
+        # Parent chapter and course, from the denormalised columns. Both are
+        # specific pages (ChapterPage/CoursePage), including in preview.
+        chapter = self.chapter
         context["chapter"] = chapter
-
-        # Parent course
-        course = None
-        if chapter:
-            parent_course = chapter.get_parent()
-            if parent_course and hasattr(parent_course, "specific"):
-                course = parent_course.specific
+        course = self.course
         context["course"] = course
 
         # ---------------------------------------
@@ -998,210 +1102,39 @@ class SegmentPage(QuizMixin, Page):
         context["chapter_percent_complete"] = 0
         context["course_percent_complete"] = 0
 
-        # Get chapters and segments (to be used for both anonymous and signed in users)
-        # Use select_related for content_type to reduce queries from .specific()
-        chapters = (
-            course.get_children()
-            .type(ChapterPage)
-            .live()
-            .select_related('content_type')
-            .specific()
-        )
-
-        # Prefetch all segments once with their quizzes
-        all_segments = (
-            SegmentPage.objects.filter(path__startswith=course.path)
-            .live()
-            .select_related('content_type')
-            .specific()
-            .prefetch_related('quizzes')
-        )
-
-        # Build quiz lookup map early so we can use it for current segment too
-        from courses.models import Quiz
-        quiz_map = {}
-        all_quiz_list = list(Quiz.objects.filter(segment__in=all_segments).select_related('segment'))
-        for quiz in all_quiz_list:
-            if quiz.segment_id not in quiz_map:
-                quiz_map[quiz.segment_id] = quiz
-
-        # Get quiz for current segment from the map (no extra query)
-        context["quiz"] = quiz_map.get(self.id)
-
-        # Calculate segment and chapter numbers using cached data to avoid COUNT queries
-        # Segment number within chapter
-        segments_in_chapter = [s for s in all_segments if s.path.startswith(chapter.path) and s.path != chapter.path]
-        segments_in_chapter_sorted = sorted(segments_in_chapter, key=lambda s: s.path)
-        start = 0 if (course and course.zero_indexed_video_segments) else 1
-        segment_number = start
-        for idx, seg in enumerate(segments_in_chapter_sorted, start):
-            if seg.id == self.id:
-                segment_number = idx
-                break
-        context["segment_number"] = segment_number
-
-        # Chapter number within course (skip intro chapters)
-        if chapter:
-            if chapter.is_intro:
-                context["chapter_number"] = None
-            else:
-                chapters_sorted = sorted(chapters, key=lambda c: c.path)
-                chapter_number = 0
-                for ch in chapters_sorted:
-                    if not ch.is_intro:
-                        chapter_number += 1
-                    if ch.id == chapter.id:
-                        break
-                context["chapter_number"] = chapter_number
-        else:
-            context["chapter_number"] = None
-
-        # Build a mapping of chapter_id -> segments to avoid get_parent() calls
-        segments_by_chapter = {}
-
-        for segment in all_segments:
-            # Use path-based parent detection to avoid query
-            # Segment path is like '000100020001000200010001', chapter is parent
-            chapter_path = segment.path[:-4]  # Remove last 4 chars to get parent path
-            # Find chapter by matching path
-            for chapter in chapters:
-                if chapter.path == chapter_path:
-                    if chapter.id not in segments_by_chapter:
-                        segments_by_chapter[chapter.id] = []
-                    segments_by_chapter[chapter.id].append(segment)
-                    break
-
-        if user.is_authenticated:
-
-            # -----------------------------
-            # 1. Current segment progress
-            # -----------------------------
-            seg_prog = (
-                SegmentProgress.objects.filter(user=user, segment=self)
-                .values_list("percent_watched", flat=True)
-                .first()
-            )
-
-            context["segment_progress"] = 0 if seg_prog is None else seg_prog
-
-            chapter = context.get("chapter")
-            course = context.get("course")
-
-            # -----------------------------
-            # Chapters + segments + progress
-            # -----------------------------
-
-            context["chapters_in_course"] = chapters
-            context["chapter_data"] = []
-
-            # Segment progress lookup
-            segment_progress_map = {
-                p.segment_id: p
-                for p in SegmentProgress.objects.filter(
-                    user=user,
-                    segment__in=all_segments,
-                )
-            }
-
-            # Chapter progress lookup
-            chapter_progress_map = {
-                p.chapter_id: p
-                for p in ChapterProgress.objects.filter(
-                    user=user,
-                    chapter__in=chapters,
-                )
-            }
-
-            display_chapter_number = 0
-            non_intro_segments_total = 0
-            non_intro_segments_done = 0
-
-            for chapter in chapters:
-                segments = segments_by_chapter.get(chapter.id, [])
+        # Chapters and segments in order, with numbering and quiz presence,
+        # from the cached course outline (to be used for both anonymous and
+        # signed in users). Everything below is dictionary lookups on it.
+        from .overlay import chapter_rows, segment_overlay, shell_key
 
-                completed_segments = 0
-                segment_rows = []
+        outline = self.get_course_outline()
+        current = self.outline_entry
 
-                for segment in segments:
-                    prog = segment_progress_map.get(segment.id)
-                    is_complete = prog and prog.percent_watched >= 100
-
-                    if is_complete:
-                        completed_segments += 1
-
-                    # Get quiz from prebuilt map - no database query
-                    quiz = quiz_map.get(segment.id)
-
-                    segment_rows.append(
-                        {
-                            "segment": segment,
-                            "progress": prog,
-                            "completed": is_complete,
-                            "quiz": quiz,
-                        }
-                    )
-
-                chapter_complete = (
-                    completed_segments == len(segments) and len(segments) > 0
-                )
-
-                if not chapter.is_intro:
-                    display_chapter_number += 1
-                    non_intro_segments_total += len(segments)
-                    non_intro_segments_done += completed_segments
-
-                context["chapter_data"].append(
-                    {
-                        "chapter": chapter,
-                        "is_intro": chapter.is_intro,
-                        "chapter_number": None if chapter.is_intro else display_chapter_number,
-                        "segments": segment_rows,
-                        "completed": chapter_complete,
-                        "percent_complete": (
-                            int((completed_segments / len(segments)) * 100)
-                            if segments
-                            else 0
-                        ),
-                    }
-                )
-
-            # Course percent based on individual segment completion (exclude intro chapters)
-            if non_intro_segments_total:
-                context["course_percent_complete"] = int(
-                    (non_intro_segments_done / non_intro_segments_total) * 100
-                )
-        else:
-
-            # For anonymous users, provide simpler list of chapters and segments
-
-            context["chapter_data"] = []
-            display_chapter_number = 0
-
-            for chapter in chapters:
-                segments = segments_by_chapter.get(chapter.id, [])
-                segment_rows = []
-                for segment in segments:
-                    # Get quiz from prebuilt map - no database query
-                    quiz = quiz_map.get(segment.id)
-
-                    segment_rows.append(
-                        {
-                            "segment": segment,
-                            "quiz": quiz,
-                        }
-                    )
-
-                if not chapter.is_intro:
-                    display_chapter_number += 1
-
-                context["chapter_data"].append(
-                    {
-                        "chapter": chapter,
-                        "is_intro": chapter.is_intro,
-                        "chapter_number": None if chapter.is_intro else display_chapter_number,
-                        "segments": segment_rows,
-                    }
-                )
+        # The full Quiz (with its questions) is only needed for this segment
+        quiz_entry = current.quiz if current else None
+        context["quiz"] = (
+            Quiz.objects.filter(id=quiz_entry.id).first() if quiz_entry else None
+        )
+        context["segment_number"] = self.number
+        context["chapter_number"] = self.chapter_number
+
+        # Shared fragments are cached under this key (see courses/overlay.py).
+        # Previews and unpublished renders show content other visitors
+        # mustn't see, so they always render uncached.
+        if self.live and not getattr(request, "is_preview", False):
+            context["shell_key"] = shell_key(self, outline)
+
+        # The learner's own state: one SegmentProgress query, plus one
+        # QuizProgress query on quiz segments
+        overlay = segment_overlay(user, self, outline)
+        context["chapter_data"], context["course_percent_complete"] = chapter_rows(
+            outline, overlay["segments"] if overlay else {}
+        )
+        if overlay:
+            context["segment_progress"] = overlay["segment_progress"]
+            context["chapters_in_course"] = outline.chapters
+            if overlay["quiz"]:
+                context.update(self.quiz_context(overlay["quiz"]))
 
         return context
 
@@ -1277,7 +1210,7 @@ class CourseProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     course = models.ForeignKey(CoursePage, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
-    completed_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     class Meta:
         unique_together = ("user", "course")
@@ -1290,22 +1223,122 @@ class SegmentProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     segment = models.ForeignKey(SegmentPage, on_delete=models.CASCADE)
     percent_watched = models.FloatField(default=0)
-    last_updated = models.DateTimeField(auto_now=True)
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    # percent_watched as last read from or written to the database, so the
+    # post_save signal can tell a first completion from a re-save at 100%
+    _stored_percent = 0
 
     class Meta:
         unique_together = ("user", "segment")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "percent_watched" in field_names:
+            instance._stored_percent = instance.percent_watched
+        return instance
+
     def __str__(self):
         return f"{self.user} watched {self.segment}: {self.percent_watched}%"
 
 
+class PendingCompletion(models.Model):
+    """A segment completion waiting to be reconciled into chapter/course
+    progress when PROGRESS_RECONCILE_MODE is "deferred"."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    segment = models.ForeignKey(SegmentPage, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("user", "segment")
+
+    def __str__(self):
+        return f"{self.user} completed {self.segment} (pending)"
+
+
+class ChapterCompletionCounter(models.Model):
+    """Number of a chapter's segments the user has completed, bumped when a
+    SegmentProgress first reaches 100% (see courses/progress.py)."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    chapter = models.ForeignKey(ChapterPage, on_delete=models.CASCADE)
+    completed_segments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "chapter")
+
+    def __str__(self):
+        return f"{self.user} completed {self.completed_segments} segments of {self.chapter}"
+
+
+class CourseCompletionCounter(models.Model):
+    """Number of a course's non-intro chapters the user has completed, bumped
+    when a ChapterProgress is first marked complete."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    course = models.ForeignKey(CoursePage, on_delete=models.CASCADE)
+    completed_chapters = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("user", "course")
+
+    def __str__(self):
+        return f"{self.user} completed {self.completed_chapters} chapters of {self.course}"
+
+
 class QuizProgress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE)
     completed = models.BooleanField(default=False)
     score = models.IntegerField(default=0, null=True, blank=True)
-    last_updated = models.DateTimeField(auto_now=True)
+    last_updated = models.DateTimeField(auto_now=True, db_index=True)
     answers_snapshot = models.JSONField(default=dict, blank=True)
 
     class Meta:
         unique_together = ("user", "quiz")
+
+
+class AnalyticsSnapshot(models.Model):
+    """The admin analytics dashboard's metrics at one point in time, as
+    computed by ``ova.analytics.collect_metrics``. The dashboard shows the
+    latest one; older ones give the trend lines."""
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    metrics = models.JSONField()
+
+    class Meta:
+        ordering = ["-created_at"]
+        get_latest_by = "created_at"
+
+    def __str__(self):
+        return f"Analytics snapshot {self.created_at:%Y-%m-%d %H:%M}"
+
+
+class DailySiteActivity(models.Model):
+    """Site-wide learner activity on one day, maintained by
+    ``ova.rollups.update_rollups``."""
+
+    day = models.DateField(unique=True)
+    new_users = models.PositiveIntegerField(default=0)
+    active_learners = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-day"]
+        verbose_name_plural = "daily site activity"
+
+    def __str__(self):
+        return f"Site activity on {self.day}"
+
+
+class RollupWatermark(models.Model):
+    """When a rollup last ran: the next run only re-reads rows from that
+    day on."""
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value:%Y-%m-%d %H:%M}"
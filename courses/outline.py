@@ -0,0 +1,293 @@
+"""
+Course outline
+
+A ``CourseOutline`` is a read-only snapshot of one course's live structure:
+its chapters and their segments in tree order. For each entry it holds the
+ids, paths, URLs, intro flags, display numbers, durations and quiz. It is
+built with two queries (the course row, then one query over the whole
+subtree) and cached per course.
+
+Cache keys are versioned (see ova/cache_versions.py).
+``invalidate_course_outline`` bumps the course's version instead of
+deleting keys, so a request that is still building the old structure can't
+write it back over the new one. The receivers in signals.py call it on
+publish, unpublish, move, save and delete.
+
+Anything that needs "which chapters/segments does this course have, in
+which order" should read it from here rather than walk the page tree.
+
+Versions live in the default cache, which every process must share for a
+bump to reach them all: with several web workers CACHE_BACKEND has to be a
+shared backend, and ova.prefork won't start them otherwise.
+"""
+
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Q, Subquery
+from wagtail.models import Page
+
+from ova.cache_versions import bump_version, current_version
+
+from .models import CoursePage, Quiz, SegmentPage
+from .page_urls import page_urls
+
+OUTLINE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bump when the pickled shape of the outline changes
+OUTLINE_FORMAT = 1
+
+OutlineQuiz = namedtuple("OutlineQuiz", "id title")
+OutlineSegment = namedtuple(
+    "OutlineSegment", "id path title url chapter_id number duration quiz"
+)
+OutlineChapter = namedtuple(
+    "OutlineChapter", "id path title url is_intro number segments"
+)
+
+
+class CourseOutline:
+    def __init__(self, course_id, course_path, version, chapters):
+        self.course_id = course_id
+        self.course_path = course_path
+        self.version = version
+        self.chapters = tuple(chapters)
+        self.segments = tuple(s for ch in self.chapters for s in ch.segments)
+
+        self._chapters = {ch.id: ch for ch in self.chapters}
+        self._segments = {s.id: s for s in self.segments}
+        self._by_path = {
+            entry.path: entry for entry in (*self.chapters, *self.segments)
+        }
+        self._positions = {s.id: i for i, s in enumerate(self.segments)}
+
+    def __repr__(self):
+        return (
+            f"<CourseOutline course={self.course_id} v{self.version}: "
+            f"{len(self.chapters)} chapters, {len(self.segments)} segments>"
+        )
+
+    def chapter(self, chapter_id):
+        return self._chapters.get(chapter_id)
+
+    def segment(self, segment_id):
+        return self._segments.get(segment_id)
+
+    def at_path(self, path):
+        """The chapter or segment whose tree path is ``path``, or None."""
+        return self._by_path.get(path)
+
+    def chapter_of(self, segment_id):
+        segment = self._segments.get(segment_id)
+        return self._chapters[segment.chapter_id] if segment else None
+
+    @property
+    def first_segment(self):
+        return self.segments[0] if self.segments else None
+
+    @property
+    def numbered_chapters(self):
+        """Chapters that count towards course completion (not intro)."""
+        return [ch for ch in self.chapters if not ch.is_intro]
+
+    def adjacent(self, segment_id, direction):
+        """The segment after or before ``segment_id`` in course order,
+        crossing chapter boundaries; None at either end."""
+        if direction not in ("next", "previous"):
+            raise ValueError("direction must be 'next' or 'previous'")
+
+        position = self._positions.get(segment_id)
+        if position is None:
+            return None
+        position += 1 if direction == "next" else -1
+        if 0 <= position < len(self.segments):
+            return self.segments[position]
+        return None
+
+
+def _version_key(course_id):
+    return f"courses:outline-version:{course_id}"
+
+
+def _outline_key(course_id, version):
+    return f"courses:outline:{OUTLINE_FORMAT}:{course_id}:{version}"
+
+
+def _current_version(course_id):
+    return current_version(_version_key(course_id))
+
+
+def invalidate_course_outline(*course_ids):
+    for course_id in course_ids:
+        bump_version(_version_key(course_id))
+
+
+def build_course_outline(course_id, version=0):
+    """Build an outline from the database (no cache). Returns None if the
+    course doesn't exist."""
+    course = (
+        CoursePage.objects.filter(id=course_id)
+        .values("path", "depth", "zero_indexed_video_segments")
+        .first()
+    )
+    if course is None:
+        return None
+
+    first_quiz = Quiz.objects.filter(segment=OuterRef("pk")).order_by("id")
+    rows = (
+        Page.objects.live()
+        .filter(path__startswith=course["path"])
+        .filter(
+            Q(depth=course["depth"] + 1, chapterpage__isnull=False)
+            | Q(depth=course["depth"] + 2, segmentpage__isnull=False)
+        )
+        .annotate(
+            quiz_id=Subquery(first_quiz.values("id")[:1]),
+            quiz_title=Subquery(first_quiz.values("title")[:1]),
+        )
+        .order_by("path")
+        .values(
+            "id",
+            "path",
+            "depth",
+            "title",
+            "url_path",
+            "chapterpage__is_intro",
+            "segmentpage__duration",
+            "quiz_id",
+            "quiz_title",
+        )
+    )
+
+    rows = list(rows)
+    urls = dict(zip((row["id"] for row in rows), page_urls(row["url_path"] for row in rows)))
+
+    first_segment_number = 0 if course["zero_indexed_video_segments"] else 1
+    steplen = Page.steplen
+    chapters = []
+    # chapter path -> (chapter id, its segments so far)
+    by_path = {}
+    chapter_number = 0
+
+    for row in rows:
+        if row["depth"] == course["depth"] + 1:
+            is_intro = row["chapterpage__is_intro"]
+            if not is_intro:
+                chapter_number += 1
+            segments = []
+            by_path[row["path"]] = (row["id"], segments)
+            chapters.append((row, is_intro, None if is_intro else chapter_number, segments))
+            continue
+
+        # A segment whose chapter isn't live isn't part of the outline
+        parent = by_path.get(row["path"][:-steplen])
+        if parent is None:
+            continue
+        chapter_id, siblings = parent
+        siblings.append(
+            OutlineSegment(
+                id=row["id"],
+                path=row["path"],
+                title=row["title"],
+                url=urls[row["id"]],
+                chapter_id=chapter_id,
+                number=first_segment_number + len(siblings),
+                duration=row["segmentpage__duration"],
+                quiz=(
+                    OutlineQuiz(row["quiz_id"], row["quiz_title"])
+                    if row["quiz_id"]
+                    else None
+                ),
+            )
+        )
+
+    return CourseOutline(
+        course_id,
+        course["path"],
+        version,
+        [
+            OutlineChapter(
+                id=row["id"],
+                path=row["path"],
+                title=row["title"],
+                url=urls[row["id"]],
+                is_intro=is_intro,
+                number=number,
+                segments=tuple(segments),
+            )
+            for row, is_intro, number, segments in chapters
+        ],
+    )
+
+
+def get_course_outline(course_id):
+    """The cached outline for ``course_id`` (None if there's no such course)."""
+    version = _current_version(course_id)
+    key = _outline_key(course_id, version)
+    outline = cache.get(key)
+    if outline is None:
+        outline = build_course_outline(course_id, version)
+        if outline is not None:
+            cache.set(key, outline, OUTLINE_CACHE_TIMEOUT)
+    return outline
+
+
+def course_id_for_page(page):
+    """Id of the course a course, chapter or segment page belongs to."""
+    if isinstance(page, CoursePage):
+        return page.id
+    # Chapter and segment pages store it (see ChapterPage.sync_ancestry)
+    if getattr(page, "course_id", None):
+        return page.course_id
+    return (
+        CoursePage.objects.filter(path__in=_ancestor_paths(page.path))
+        .values_list("id", flat=True)
+        .first()
+    )
+
+
+def _ancestor_paths(path):
+    steplen = Page.steplen
+    return [path[:end] for end in range(steplen, len(path) + 1, steplen)]
+
+
+def _segment_course_key(segment_id):
+    return f"courses:segment-course:{segment_id}"
+
+
+def outline_for_segment(segment_id):
+    """
+    The outline of the course ``segment_id`` is live in, or None when it
+    isn't a live segment of a live course.
+
+    The segment's course id is cached next to the outlines and checked
+    against the outline on every call, so a segment that has moved or been
+    unpublished since costs a query instead of a wrong answer, and the
+    common case makes none.
+    """
+    key = _segment_course_key(segment_id)
+    course_id = cache.get(key)
+    if course_id is not None:
+        outline = get_course_outline(course_id)
+        if outline is not None and outline.segment(segment_id) is not None:
+            return outline
+
+    course_id = (
+        SegmentPage.objects.live()
+        .filter(id=segment_id)
+        .values_list("course_id", flat=True)
+        .first()
+    )
+    if course_id is None:
+        return None
+    cache.set(key, course_id, OUTLINE_CACHE_TIMEOUT)
+    outline = get_course_outline(course_id)
+    if outline is None or outline.segment(segment_id) is None:
+        return None
+    return outline
+
+
+def outline_for_page(page):
+    """The outline of the course containing ``page``, or None."""
+    course_id = course_id_for_page(page)
+    return get_course_outline(course_id) if course_id else None
@@ -0,0 +1,129 @@
+"""
+Segment page layers
+===================
+A segment page is rendered in two layers.
+
+The shell is everything that looks the same to every learner: the course
+card, overview, video, transcript, written content and materials. Those
+fragments are cached (``{% shell_fragment %}`` in partials/course.html)
+under ``shell_key``. The key changes with the segment's live revision and
+with the course outline version, so publishing the segment or changing the
+course structure starts a fresh shell. SEGMENT_SHELL_TIMEOUT bounds how
+long edits elsewhere (instructors, tags) take to show up. Previews and
+renders of pages that aren't live get no key, so drafts are never cached.
+
+The overlay is the learner's own state: segment and course progress,
+completed segments and chapters, and their last quiz submission.
+``segment_overlay`` builds it from one SegmentProgress query and, on quiz
+segments, one QuizProgress query. SegmentPage.get_context merges it into the
+page. ``/api/progress/overlay/<segment_id>/`` returns the same data as JSON,
+so scripts can refresh progress without reloading the page.
+"""
+
+from .models import QuizProgress, SegmentProgress
+from .progress import COMPLETE_PERCENT
+
+# Bump when the markup inside the cached fragments changes shape
+SHELL_FORMAT = 1
+
+
+def shell_key(segment, outline):
+    """Cache key prefix for the shared fragments of ``segment``'s page."""
+    return (
+        f"courses:segment-shell:{SHELL_FORMAT}:{segment.id}:"
+        f"{segment.live_revision_id or 0}:{outline.course_id}:{outline.version}"
+    )
+
+
+def chapter_rows(outline, percents):
+    """
+    Chapter list rows for the sidebar, plus the course percentage, in one
+    pass over the outline. ``percents`` maps segment id to the user's
+    percent watched (empty for anonymous users).
+
+    Intro chapters are listed but don't count towards the percentage.
+    """
+    rows = []
+    counted_total = 0
+    counted_done = 0
+
+    for chapter in outline.chapters:
+        segment_rows = []
+        done = 0
+        for segment in chapter.segments:
+            percent = percents.get(segment.id)
+            completed = percent is not None and percent >= COMPLETE_PERCENT
+            done += completed
+            segment_rows.append(
+                {
+                    "segment": segment,
+                    "progress": percent,
+                    "completed": completed,
+                    "quiz": segment.quiz,
+                }
+            )
+
+        total = len(segment_rows)
+        if not chapter.is_intro:
+            counted_total += total
+            counted_done += done
+
+        rows.append(
+            {
+                "chapter": chapter,
+                "is_intro": chapter.is_intro,
+                "chapter_number": chapter.number,
+                "segments": segment_rows,
+                "completed": total > 0 and done == total,
+                "percent_complete": int(done / total * 100) if total else 0,
+            }
+        )
+
+    percent = int(counted_done / counted_total * 100) if counted_total else 0
+    return rows, percent
+
+
+def _quiz_state(user, entry):
+    if entry is None or entry.quiz is None:
+        return None
+
+    progress = (
+        QuizProgress.objects.filter(user=user, quiz_id=entry.quiz.id)
+        .values("score", "answers_snapshot")
+        .first()
+    )
+    if not progress or not progress["answers_snapshot"]:
+        return None
+
+    snapshot = progress["answers_snapshot"]
+    return {
+        "id": entry.quiz.id,
+        "score": progress["score"] or 0,
+        "answers": snapshot.get("answers", {}),
+        "results": snapshot.get("results", {}),
+    }
+
+
+def segment_overlay(user, segment, outline):
+    """
+    ``user``'s state on ``segment``'s page as a JSON-ready dict, or None for
+    anonymous users.
+    """
+    if not user.is_authenticated:
+        return None
+
+    percents = dict(
+        SegmentProgress.objects.filter(
+            user=user, segment__course_id=outline.course_id
+        ).values_list("segment_id", "percent_watched")
+    )
+    rows, course_percent = chapter_rows(outline, percents)
+
+    return {
+        "segment_id": segment.id,
+        "segment_progress": percents.get(segment.id, 0),
+        "course_percent_complete": course_percent,
+        "segments": percents,
+        "completed_chapters": [row["chapter"].id for row in rows if row["completed"]],
+        "quiz": _quiz_state(user, outline.segment(segment.id)),
+    }
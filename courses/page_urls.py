@@ -0,0 +1,52 @@
+"""
+Bulk page URLs
+
+``page.url`` looks up the site root paths and reverses ``wagtail_serve``
+for every page it's called on. ``page_urls`` gives the same answer as
+``Page.get_url()`` (no request) for a whole list of pages in one pass: the
+root paths are read once and the serve prefix is reversed once, then each
+URL is string slicing on the page's stored ``url_path``.
+
+The course outline and the course catalog use it when they're built, so
+the sidebar, the previous/next arrows and the course cards all render from
+precomputed URLs.
+"""
+
+from django.conf import settings
+from django.urls import NoReverseMatch, reverse
+from wagtail.models import Page, Site
+
+WAGTAIL_APPEND_SLASH = getattr(settings, "WAGTAIL_APPEND_SLASH", True)
+
+
+def page_urls(url_paths):
+    """
+    URLs for the pages whose ``url_path`` values are given, in order. Each
+    is relative when a single site is configured and absolute otherwise,
+    or None when the page isn't under any site.
+    """
+    url_paths = list(url_paths)
+    if getattr(settings, "WAGTAIL_I18N_ENABLED", False):
+        # Language prefixes are resolved per page; no shortcut there
+        return [Page(url_path=url_path).get_url() for url_path in url_paths]
+
+    root_paths = Site.get_site_root_paths()
+    absolute = len({root.site_id for root in root_paths}) > 1
+    try:
+        serve_prefix = reverse("wagtail_serve", args=("",))
+    except NoReverseMatch:
+        return [None] * len(url_paths)
+
+    urls = []
+    for url_path in url_paths:
+        # Same choice as Page.get_url_parts: the first matching root path
+        root = next((r for r in root_paths if url_path.startswith(r.root_path)), None)
+        if root is None:
+            urls.append(None)
+            continue
+        page_path = serve_prefix + url_path[len(root.root_path) :]
+        if not WAGTAIL_APPEND_SLASH and page_path != "/":
+            page_path = page_path.rstrip("/")
+        urls.append(root.root_url + page_path if absolute else page_path)
+    return urls
+
@@ -0,0 +1,774 @@
+"""
+Progress store
+==============
+Helpers for recording SegmentProgress and reconciling the ChapterProgress /
+CourseProgress records that depend on it.
+
+Segment writes are monotonic upserts that report whether they took a segment
+to 100%. Only those first completions feed ``register_completions``, which
+keeps per-user completed-segment and completed-chapter counters, so marking
+chapters and courses complete costs the same however large the course is.
+With PROGRESS_RECONCILE_MODE = "deferred" that step is queued and runs off
+the request path (``ReconcileWorker``).
+
+A segment's chapter and course are read from its denormalised
+``chapter_id``/``course_id`` columns, so nothing here walks the page tree.
+"""
+
+import logging
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ova.background import BackgroundWorker
+
+from .models import (
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    ChapterProgress,
+    CourseProgress,
+    ChapterCompletionCounter,
+    CourseCompletionCounter,
+    PendingCompletion,
+    User,
+)
+from .outline import get_course_outline
+
+logger = logging.getLogger(__name__)
+
+# A segment counts as watched once percent_watched reaches this value.
+COMPLETE_PERCENT = 100
+
+# Upper bound on entries accepted by a single batch request.
+MAX_BATCH_ENTRIES = 200
+
+# found: the segment exists. written: the stored value went up.
+# completed: this write took the segment to 100% (it was below before).
+ProgressWrite = namedtuple("ProgressWrite", "found written completed")
+
+
+def _mark_complete(model, field, user, ids, now):
+    """Create or flip ``model`` rows for ``user`` to completed, keeping the
+    original completed_at of rows that are already complete.
+
+    Returns the ids that were not complete before."""
+    if not ids:
+        return []
+
+    existing = dict(
+        model.objects.filter(user=user, **{f"{field}_id__in": ids}).values_list(
+            f"{field}_id", "completed"
+        )
+    )
+
+    model.objects.bulk_create(
+        [
+            model(user=user, completed=True, completed_at=now, **{f"{field}_id": pk})
+            for pk in ids
+            if pk not in existing
+        ]
+    )
+
+    incomplete = [pk for pk, completed in existing.items() if not completed]
+    if incomplete:
+        model.objects.filter(user=user, **{f"{field}_id__in": incomplete}).update(
+            completed=True, completed_at=now
+        )
+
+    return [pk for pk in ids if pk not in existing] + incomplete
+
+
+# ---------------------------------------------------------------------------
+# Completion counters
+# ---------------------------------------------------------------------------
+
+def course_totals(course_id):
+    """
+    Live segment count per chapter and live non-intro chapter count for a
+    course, from the cached course outline.
+    """
+    outline = get_course_outline(course_id)
+    if outline is None:
+        return {"segments": {}, "chapters": 0}
+    return {
+        "segments": {ch.id: len(ch.segments) for ch in outline.chapters},
+        "chapters": len(outline.numbered_chapters),
+    }
+
+
+def _recount(model, target, count_field, counters, done, group_by, user_ids):
+    """Replace the ``counters`` rows of ``model`` with counts of ``done``
+    grouped by user and ``group_by``, in one grouped query."""
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+        done = done.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        counters.delete()
+        model.objects.bulk_create(
+            [
+                model(
+                    user_id=user_id, **{f"{target}_id": target_id, count_field: count}
+                )
+                for user_id, target_id, count in done.values_list("user_id", group_by)
+                .annotate(count=Count("id"))
+                .order_by()
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_chapter_counters(chapter_ids, user_ids=None):
+    """
+    Recount the completed-segment counters of the chapters ``chapter_ids``
+    (and only for ``user_ids``, if given) from the progress rows of their
+    live segments.
+
+    Counters are only bumped, so they go stale when a chapter's segments
+    change: a republished segment someone had already watched, or one moved
+    in from another chapter, leaves the counter below the number of live
+    segments done, and it would never reach the chapter total again.
+    """
+    chapter_ids = list(chapter_ids)
+    if not chapter_ids:
+        return
+    _recount(
+        ChapterCompletionCounter,
+        "chapter",
+        "completed_segments",
+        ChapterCompletionCounter.objects.filter(chapter_id__in=chapter_ids),
+        SegmentProgress.objects.filter(
+            segment__live=True,
+            segment__chapter_id__in=chapter_ids,
+            percent_watched__gte=COMPLETE_PERCENT,
+        ),
+        "segment__chapter_id",
+        user_ids,
+    )
+
+
+def rebuild_course_counters(course_ids, user_ids=None):
+    """Recount the completed-chapter counters of the courses ``course_ids``
+    from the ChapterProgress rows of their live non-intro chapters."""
+    course_ids = list(course_ids)
+    if not course_ids:
+        return
+    _recount(
+        CourseCompletionCounter,
+        "course",
+        "completed_chapters",
+        CourseCompletionCounter.objects.filter(course_id__in=course_ids),
+        ChapterProgress.objects.filter(
+            chapter__live=True,
+            chapter__is_intro=False,
+            chapter__course_id__in=course_ids,
+            completed=True,
+        ),
+        "chapter__course_id",
+        user_ids,
+    )
+
+
+def rebuild_counters(course_ids, user_ids=None):
+    """Recount every chapter and course counter of the courses
+    ``course_ids``."""
+    course_ids = list(course_ids)
+    rebuild_chapter_counters(
+        ChapterPage.objects.filter(course_id__in=course_ids).values_list(
+            "id", flat=True
+        ),
+        user_ids,
+    )
+    rebuild_course_counters(course_ids, user_ids)
+
+
+_pending_recounts = threading.local()
+
+
+def schedule_recount(chapter_ids=(), course_ids=()):
+    """
+    Recount the counters of ``chapter_ids`` and ``course_ids`` once the
+    current transaction commits (see ``rebuild_chapter_counters``).
+
+    Called by the structure signals on publish, unpublish, move and delete.
+    Deleting a chapter deletes its segments one at a time, so the ids are
+    collected and each chapter or course is recounted once per transaction.
+    """
+    pending = getattr(_pending_recounts, "ids", None)
+    if pending is None:
+        pending = _pending_recounts.ids = (set(), set())
+    pending[0].update(pk for pk in chapter_ids if pk)
+    pending[1].update(pk for pk in course_ids if pk)
+    # One callback per call, but only the first to run finds anything to do
+    transaction.on_commit(_run_pending_recounts)
+
+
+def _run_pending_recounts():
+    pending = getattr(_pending_recounts, "ids", None)
+    if pending is None:
+        return
+    del _pending_recounts.ids
+    chapter_ids, course_ids = pending
+    rebuild_chapter_counters(chapter_ids)
+    rebuild_course_counters(course_ids)
+
+
+def _increment_counter(model, target, count_field, user_id, target_id, by):
+    """Atomically add ``by`` to a counter row, creating it if needed, and
+    return the new value."""
+    table = model._meta.db_table
+    target_column = model._meta.get_field(target).column
+    qn = connection.ops.quote_name
+
+    sql = f"""
+        INSERT INTO {qn(table)} (user_id, {qn(target_column)}, {qn(count_field)})
+        VALUES (%s, %s, %s)
+        ON CONFLICT (user_id, {qn(target_column)}) DO UPDATE
+        SET {qn(count_field)} = {qn(table)}.{qn(count_field)} + excluded.{qn(count_field)}
+        RETURNING {qn(count_field)}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, target_id, by])
+        return cursor.fetchone()[0]
+
+
+def _confirm_chapter(user, chapter_id, counted):
+    """The counter says the chapter is done: check against the progress rows
+    and correct the counter if it has drifted (segments unpublished, moved
+    or deleted since it was bumped). Returns whether the chapter is done."""
+    segments = SegmentPage.objects.live().filter(chapter_id=chapter_id)
+    total = segments.count()
+    done = SegmentProgress.objects.filter(
+        user=user, segment__in=segments, percent_watched__gte=COMPLETE_PERCENT
+    ).count()
+
+    if done != counted:
+        ChapterCompletionCounter.objects.filter(user=user, chapter_id=chapter_id).update(
+            completed_segments=done
+        )
+    return total > 0 and done == total
+
+
+def _confirm_course(user, course_id, counted):
+    """Course-level counterpart of ``_confirm_chapter``."""
+    chapters = ChapterPage.objects.live().filter(course_id=course_id, is_intro=False)
+    total = chapters.count()
+    done = ChapterProgress.objects.filter(
+        user=user, chapter__in=chapters, completed=True
+    ).count()
+
+    if done != counted:
+        CourseCompletionCounter.objects.filter(user=user, course_id=course_id).update(
+            completed_chapters=done
+        )
+    return total > 0 and done == total
+
+
+def register_completions(user, segment_ids):
+    """
+    Record that the segments ``segment_ids`` just reached 100% for ``user``
+    and mark their chapters and courses complete when that finished them.
+
+    Must be called exactly once per segment, when it first crosses 100%.
+    Each call bumps a per-(user, chapter) counter and compares it with the
+    cached chapter total, so the cost doesn't depend on the size of the
+    course. Only when a counter reaches its total are the progress rows
+    counted to confirm it; a finished chapter then bumps the per-(user,
+    course) counter the same way.
+    """
+    if not segment_ids:
+        return
+
+    completed_per_chapter = Counter(
+        SegmentPage.objects.filter(id__in=list(segment_ids))
+        .exclude(course_id=None)
+        .values_list("chapter_id", "course_id", "chapter__is_intro")
+    )
+
+    now = timezone.now()
+    finished_per_course = Counter()
+
+    for (chapter_id, course_id, is_intro), completed in completed_per_chapter.items():
+        counted = _increment_counter(
+            ChapterCompletionCounter,
+            "chapter",
+            "completed_segments",
+            user.pk,
+            chapter_id,
+            completed,
+        )
+        total = course_totals(course_id)["segments"].get(chapter_id, 0)
+        if counted < total or not _confirm_chapter(user, chapter_id, counted):
+            continue
+
+        if _mark_complete(ChapterProgress, "chapter", user, [chapter_id], now):
+            if not is_intro:
+                finished_per_course[course_id] += 1
+
+    for course_id, finished in finished_per_course.items():
+        counted = _increment_counter(
+            CourseCompletionCounter,
+            "course",
+            "completed_chapters",
+            user.pk,
+            course_id,
+            finished,
+        )
+        total = course_totals(course_id)["chapters"]
+        if counted < total or not _confirm_course(user, course_id, counted):
+            continue
+
+        _mark_complete(CourseProgress, "course", user, [course_id], now)
+
+
+def complete_segments(user, segment_ids):
+    """
+    Hand segments that just reached 100% to reconciliation.
+
+    In the default "sync" PROGRESS_RECONCILE_MODE this runs
+    ``register_completions`` inline. In "deferred" mode the completions are
+    queued as PendingCompletion rows in the caller's transaction, and the
+    reconcile worker is woken once it commits.
+    """
+    if not segment_ids:
+        return
+
+    if settings.PROGRESS_RECONCILE_MODE == "deferred":
+        PendingCompletion.objects.bulk_create(
+            [PendingCompletion(user=user, segment_id=pk) for pk in segment_ids],
+            ignore_conflicts=True,
+        )
+        transaction.on_commit(reconcile_worker.wake)
+        return
+
+    register_completions(user, segment_ids)
+
+
+def process_pending_completions(user=None, limit=500):
+    """
+    Reconcile up to ``limit`` queued completions, oldest first, and remove
+    them from the queue. Completions for the same user and chapter are
+    folded into one counter update. Pass ``user`` to drain only that user's
+    queue (used for synchronous completion reads).
+
+    Returns the number of queue rows processed.
+    """
+    queue = PendingCompletion.objects.order_by("id")
+    if user is not None:
+        queue = queue.filter(user=user)
+
+    with transaction.atomic():
+        pending = list(
+            queue.select_for_update(skip_locked=True, of=("self",)).values_list(
+                "id", "user_id", "segment_id"
+            )[:limit]
+        )
+        if not pending:
+            return 0
+
+        segments_per_user = {}
+        for _, user_id, segment_id in pending:
+            segments_per_user.setdefault(user_id, []).append(segment_id)
+
+        users = (
+            {user.pk: user}
+            if user is not None
+            else User.objects.in_bulk(list(segments_per_user))
+        )
+        for user_id, segment_ids in segments_per_user.items():
+            if user_id in users:
+                register_completions(users[user_id], segment_ids)
+
+        PendingCompletion.objects.filter(id__in=[pk for pk, _, _ in pending]).delete()
+
+    return len(pending)
+
+
+def _upsert_progress(user_id, percents):
+    """
+    Insert or raise a user's SegmentProgress rows from ``{segment_id:
+    percent}`` in a single statement, however many there are.
+
+    The INSERT selects from the segment table, so unknown segment ids insert
+    nothing instead of violating the foreign key. On conflict a row is only
+    updated while it is below 100% and below the new value (the GREATEST of
+    old and new, without rewriting rows that wouldn't change), and
+    concurrent heartbeats for the same pair can't race on the unique
+    constraint.
+
+    Returns ``{segment_id: stored percent}`` for the rows that were written.
+    """
+    if not percents:
+        return {}
+
+    progress = SegmentProgress._meta.db_table
+    segment_table = SegmentPage._meta.db_table
+    segment_pk = SegmentPage._meta.pk.column
+    qn = connection.ops.quote_name
+
+    cases = " ".join(["WHEN %s THEN %s"] * len(percents))
+    placeholders = ", ".join(["%s"] * len(percents))
+    sql = f"""
+        INSERT INTO {qn(progress)} (user_id, segment_id, percent_watched, last_updated)
+        SELECT %s, {qn(segment_pk)}, CASE {qn(segment_pk)} {cases} END, %s
+        FROM {qn(segment_table)}
+        WHERE {qn(segment_pk)} IN ({placeholders})
+        ON CONFLICT (user_id, segment_id) DO UPDATE
+        SET percent_watched = excluded.percent_watched,
+            last_updated = excluded.last_updated
+        WHERE {qn(progress)}.percent_watched < excluded.percent_watched
+          AND {qn(progress)}.percent_watched < %s
+        RETURNING segment_id, percent_watched
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = [user_id]
+    for segment_id, percent in percents.items():
+        params += [segment_id, percent]
+    params += [now, *percents, COMPLETE_PERCENT]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _upsert_segment_progress(user_id, segment_id, percent):
+    """``_upsert_progress`` for one segment. Returns the stored percent when
+    the row was written, else None."""
+    return _upsert_progress(user_id, {segment_id: percent}).get(segment_id)
+
+
+def record_segment_progress(user, segment_id, percent):
+    """
+    Store one heartbeat and reconcile chapter/course completion if it
+    completed the segment.
+
+    Progress is monotonic: a stored value is only ever raised, and never
+    changes once it reaches 100%. In the common case (a partial heartbeat
+    that moves the value up) this is exactly one query.
+
+    Returns a ``ProgressWrite``.
+    """
+    # savepoint=False: under an outer transaction the common case must stay
+    # a single statement rather than SAVEPOINT/INSERT/RELEASE
+    with transaction.atomic(savepoint=False):
+        stored = _upsert_segment_progress(user.pk, segment_id, percent)
+
+        if stored is None:
+            found = SegmentPage.objects.filter(id=segment_id).exists()
+            return ProgressWrite(found=found, written=False, completed=False)
+
+        if stored < COMPLETE_PERCENT:
+            return ProgressWrite(found=True, written=True, completed=False)
+
+        # The raw upsert doesn't send post_save, so reconcile here
+        complete_segments(user, [segment_id])
+        return ProgressWrite(found=True, written=True, completed=True)
+
+
+def completion_status(user, segment_id, sync=False):
+    """Return ``(chapter_completed, course_completed)`` for the chapter and
+    course that contain ``segment_id``.
+
+    With ``sync`` any completions still queued for the user are reconciled
+    first, so the answer is current even in deferred mode."""
+    if sync and settings.PROGRESS_RECONCILE_MODE == "deferred":
+        _drain_pending(user)
+
+    ancestry = (
+        SegmentPage.objects.filter(id=segment_id)
+        .values_list("chapter_id", "course_id")
+        .first()
+    )
+    if ancestry is None:
+        return False, False
+
+    chapter_id, course_id = ancestry
+    chapter_completed = ChapterProgress.objects.filter(
+        user=user, chapter_id=chapter_id, completed=True
+    ).exists()
+    course_completed = CourseProgress.objects.filter(
+        user=user, course_id=course_id, completed=True
+    ).exists()
+    return chapter_completed, course_completed
+
+
+def _drain_pending(user):
+    while process_pending_completions(user=user):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Async variants for the async progress view. Heartbeats use the async ORM
+# directly; reconciliation and the queue drain keep their transactions and
+# run in a worker thread via sync_to_async.
+# ---------------------------------------------------------------------------
+
+async def acomplete_segments(user, segment_ids):
+    """Async ``complete_segments`` for callers running in autocommit."""
+    if not segment_ids:
+        return
+
+    if settings.PROGRESS_RECONCILE_MODE == "deferred":
+        await PendingCompletion.objects.abulk_create(
+            [PendingCompletion(user=user, segment_id=pk) for pk in segment_ids],
+            ignore_conflicts=True,
+        )
+        # Nothing to wait for: in autocommit the rows are already visible
+        reconcile_worker.wake()
+        return
+
+    await sync_to_async(complete_segments)(user, segment_ids)
+
+
+async def _araise_progress(user, segment_id, percent):
+    """Raise an existing row with a conditional UPDATE. Returns a
+    ``ProgressWrite`` if the row was raised, else None."""
+    raised = await SegmentProgress.objects.filter(
+        user_id=user.pk,
+        segment_id=segment_id,
+        percent_watched__lt=min(percent, COMPLETE_PERCENT),
+    ).aupdate(percent_watched=percent, last_updated=timezone.now())
+    if not raised:
+        return None
+
+    completed = percent >= COMPLETE_PERCENT
+    if completed:
+        await acomplete_segments(user, [segment_id])
+    return ProgressWrite(found=True, written=True, completed=completed)
+
+
+async def arecord_segment_progress(user, segment_id, percent):
+    """
+    Async ``record_segment_progress`` with the same monotonic rules.
+
+    The raise is a conditional UPDATE, so of several concurrent heartbeats
+    only the one that moves a row to 100% reports (and reconciles) the
+    completion. A partial heartbeat that raises an existing row is one query.
+
+    Returns a ``ProgressWrite``.
+    """
+    write = await _araise_progress(user, segment_id, percent)
+    if write is not None:
+        return write
+
+    if await SegmentProgress.objects.filter(
+        user_id=user.pk, segment_id=segment_id
+    ).aexists():
+        return ProgressWrite(found=True, written=False, completed=False)
+
+    if not await SegmentPage.objects.filter(id=segment_id).aexists():
+        return ProgressWrite(found=False, written=False, completed=False)
+
+    _, created = await SegmentProgress.objects.aget_or_create(
+        user=user, segment_id=segment_id, defaults={"percent_watched": percent}
+    )
+    if created:
+        # Created through the ORM, so the post_save signal reconciled it
+        return ProgressWrite(
+            found=True, written=True, completed=percent >= COMPLETE_PERCENT
+        )
+
+    # Another heartbeat created the row first; raise it like any other
+    write = await _araise_progress(user, segment_id, percent)
+    return write or ProgressWrite(found=True, written=False, completed=False)
+
+
+async def acompletion_status(user, segment_id, sync=False):
+    """Async ``completion_status``."""
+    if sync and settings.PROGRESS_RECONCILE_MODE == "deferred":
+        await sync_to_async(_drain_pending)(user)
+
+    ancestry = await (
+        SegmentPage.objects.filter(id=segment_id)
+        .values_list("chapter_id", "course_id")
+        .afirst()
+    )
+    if ancestry is None:
+        return False, False
+
+    chapter_id, course_id = ancestry
+    chapter_completed = await ChapterProgress.objects.filter(
+        user=user, chapter_id=chapter_id, completed=True
+    ).aexists()
+    course_completed = await CourseProgress.objects.filter(
+        user=user, course_id=course_id, completed=True
+    ).aexists()
+    return chapter_completed, course_completed
+
+
+def record_progress_batch(user, entries):
+    """
+    Save many ``{segment_id: percent}`` updates for one user in a single
+    transaction and reconcile chapter/course completion once for the lot.
+
+    Follows the single-update rules: values are only ever raised, and a
+    segment at 100% never changes, whatever order the heartbeats arrive
+    in. All rows are written by one ``_upsert_progress`` statement.
+
+    Returns ``(segments, chapters, courses)``: the saved percent per known
+    segment id, and the completion flag per touched chapter and course id.
+    Unknown segment ids are left out of ``segments``.
+    """
+    ancestry = {
+        segment_id: (chapter_id, course_id)
+        for segment_id, chapter_id, course_id in SegmentPage.objects.filter(
+            id__in=list(entries)
+        ).values_list("id", "chapter_id", "course_id")
+    }
+
+    with transaction.atomic():
+        written = _upsert_progress(
+            user.pk, {segment_id: entries[segment_id] for segment_id in ancestry}
+        )
+        # The upsert never writes a row that was already at 100%, so these
+        # are all first completions. It doesn't send post_save either.
+        complete_segments(
+            user,
+            [pk for pk, percent in written.items() if percent >= COMPLETE_PERCENT],
+        )
+
+    saved = dict(
+        SegmentProgress.objects.filter(
+            user=user, segment_id__in=list(ancestry)
+        ).values_list("segment_id", "percent_watched")
+    )
+
+    chapter_ids = {chapter_id for chapter_id, _ in ancestry.values() if chapter_id}
+    course_ids = {course_id for _, course_id in ancestry.values() if course_id}
+
+    completed_chapters = set(
+        ChapterProgress.objects.filter(
+            user=user, chapter_id__in=chapter_ids, completed=True
+        ).values_list("chapter_id", flat=True)
+    )
+    completed_courses = set(
+        CourseProgress.objects.filter(
+            user=user, course_id__in=course_ids, completed=True
+        ).values_list("course_id", flat=True)
+    )
+
+    return (
+        saved,
+        {pk: pk in completed_chapters for pk in chapter_ids},
+        {pk: pk in completed_courses for pk in course_ids},
+    )
+
+
+def flush_buffered_progress(pending):
+    """
+    Apply buffered ``{(user_id, segment_id): percent}`` values with one
+    ``_upsert_progress`` statement per user, so they follow the same rules
+    as a heartbeat written straight away: a stored value is only ever
+    raised, and rows for segments deleted since the heartbeat are dropped.
+
+    Only sub-100% values are ever buffered, so nothing here can complete a
+    chapter and no reconciliation is needed.
+    """
+    by_user = defaultdict(dict)
+    for (user_id, segment_id), percent in pending.items():
+        by_user[user_id][segment_id] = percent
+
+    with transaction.atomic():
+        for user_id, percents in by_user.items():
+            _upsert_progress(user_id, percents)
+
+
+class ProgressBuffer(BackgroundWorker):
+    """
+    In-process write-behind buffer for sub-100% heartbeats.
+
+    Enabled with ``PROGRESS_WRITE_BEHIND``. ``update_progress`` records the
+    highest percent seen per (user, segment) and returns without touching the
+    database; a background thread flushes the coalesced values every
+    ``PROGRESS_WRITE_BEHIND_INTERVAL`` seconds (and once more when the
+    process stops, see ova/background.py). Heartbeats that reach 100% bypass
+    the buffer so chapter/course completion and certificates are never
+    delayed.
+
+    Set the interval to 0 to disable the thread and call ``flush()`` yourself.
+    """
+
+    name = "progress-write-behind"
+    error_message = "Failed to flush buffered segment progress"
+
+    def __init__(self):
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        super().__init__()
+
+    @property
+    def interval(self):
+        return settings.PROGRESS_WRITE_BEHIND_INTERVAL
+
+    def record(self, user_id, segment_id, percent):
+        key = (user_id, segment_id)
+        with self._pending_lock:
+            if percent > self._pending.get(key, -1):
+                self._pending[key] = percent
+        if self.interval > 0:
+            self.start()
+
+    def discard(self, user_id, segment_id):
+        with self._pending_lock:
+            self._pending.pop((user_id, segment_id), None)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of entries."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        try:
+            flush_buffered_progress(pending)
+        except Exception:
+            # Put the values back (keeping anything newer) for the next run
+            with self._pending_lock:
+                for key, percent in pending.items():
+                    if percent > self._pending.get(key, -1):
+                        self._pending[key] = percent
+            raise
+        return len(pending)
+
+    def work(self):
+        self.flush()
+
+    def stop(self, timeout=None):
+        stopped = super().stop(timeout)
+        # Also covers interval 0, where no thread ever ran
+        self.flush()
+        connections.close_all()
+        return stopped
+
+
+class ReconcileWorker(BackgroundWorker):
+    """
+    In-process consumer for the PendingCompletion queue in deferred mode.
+
+    ``wake()`` is called after a transaction that queued completions
+    commits. The worker waits PROGRESS_RECONCILE_WINDOW seconds so that
+    completions arriving close together are reconciled in one batch, then
+    drains the queue. Rows left behind by a process that exited are picked
+    up by the ``reconcile_pending_progress`` management command.
+    """
+
+    name = "progress-reconcile"
+    error_message = "Failed to reconcile pending completions"
+
+    @property
+    def delay(self):
+        return settings.PROGRESS_RECONCILE_WINDOW
+
+    def work(self):
+        while process_pending_completions():
+            pass
+
+
+progress_buffer = ProgressBuffer()
+reconcile_worker = ReconcileWorker()
@@ -0,0 +1,27 @@
+"""
+Light page querysets
+
+Course, chapter and segment pages carry large columns that lists never
+show: the StreamField ``content`` bodies and a segment's whole video
+``transcript``. Each of those models names them in ``heavy_fields`` and
+uses ``LightPageManager``, so list queries can leave them out:
+
+    SegmentPage.objects.live().light()                # no transcript/content
+    SegmentPage.objects.light("transcript")           # but keep transcript
+
+Deferred fields still load on access (one query per object), so anything
+that reads them should ask for them explicitly.
+"""
+
+from wagtail.models import PageManager
+from wagtail.query import PageQuerySet
+
+
+class LightPageQuerySet(PageQuerySet):
+    def light(self, *include):
+        """Defer the model's ``heavy_fields``, apart from those in ``include``."""
+        fields = [f for f in self.model.heavy_fields if f not in include]
+        return self.defer(*fields) if fields else self
+
+
+LightPageManager = PageManager.from_queryset(LightPageQuerySet)
@@ -0,0 +1,372 @@
+"""
+Bulk progress reconciliation
+
+Finds ChapterProgress and CourseProgress records that disagree with
+SegmentProgress and fixes them, for every learner at once. A chapter
+should be complete when all of its live segments are at 100% for the
+learner, and a course when all segments of its non-intro chapters are (the
+same rules as ``_is_chapter_complete`` and ``_is_course_complete`` in
+views.py, which check one learner at a time).
+
+``iter_issues`` works from the cached course outlines and a few grouped
+queries per course, whatever the number of learners: completed segments
+counted per (learner, chapter) and per (learner, course), compared with
+the outline's totals, then merged with the existing progress rows read in
+the same order.
+``apply_fixes`` creates the missing rows and flips the incomplete ones in
+chunks, then recounts the completion counters of the learners it touched,
+and ``reconcile`` runs it course by course. They're used by the
+``reconcile_progress`` command and the reconciliation report in the
+CourseProgress admin, which pages through ``iter_issues`` by keyset,
+streams it as CSV or NDJSON, and applies every fix with ``fix_worker`` so
+the request doesn't wait for it.
+"""
+
+import heapq
+import logging
+from collections import defaultdict, namedtuple
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.utils import timezone
+
+from ova.background import BackgroundWorker
+
+from .models import ChapterProgress, CoursePage, CourseProgress, SegmentProgress
+from .outline import get_course_outline
+from .progress import rebuild_counters
+
+logger = logging.getLogger(__name__)
+
+CHAPTER = "chapter"
+COURSE = "course"
+
+MISSING = "missing"
+INCOMPLETE = "incomplete"
+
+PROBLEM_LABELS = {MISSING: "Missing record", INCOMPLETE: "Not marked complete"}
+
+# Existing progress rows read per round trip
+CHUNK_SIZE = 2000
+
+# ``progress_id`` is the existing row for INCOMPLETE issues, None otherwise
+Issue = namedtuple("Issue", "kind problem user_id object_id course_id progress_id")
+
+
+class Structure:
+    """What each live course requires, from the course outlines."""
+
+    def __init__(self, course_ids=None):
+        courses = CoursePage.objects.live().order_by("path")
+        if course_ids is not None:
+            courses = courses.filter(id__in=course_ids)
+
+        self.course_titles = {}
+        # Tree paths, which order the report and place its cursors
+        self.course_paths = {}
+        for course_id, title, course_path in courses.values_list("id", "title", "path"):
+            self.course_titles[course_id] = title
+            self.course_paths[course_id] = course_path
+        self.chapter_titles = {}
+        self.course_chapters = {}
+        # Segments to complete, per chapter and per course
+        self.chapter_segments = {}
+        self.course_segments = {}
+
+        for course_id in self.course_titles:
+            outline = get_course_outline(course_id)
+            if outline is None:
+                continue
+            for chapter in outline.chapters:
+                if not chapter.segments:
+                    continue
+                self.chapter_titles[chapter.id] = chapter.title
+                self.course_chapters.setdefault(course_id, []).append(chapter.id)
+                self.chapter_segments[chapter.id] = {s.id for s in chapter.segments}
+
+            numbered = outline.numbered_chapters
+            if numbered and all(chapter.segments for chapter in numbered):
+                self.course_segments[course_id] = {
+                    s.id for chapter in numbered for s in chapter.segments
+                }
+
+    def title(self, issue):
+        if issue.kind == CHAPTER:
+            return self.chapter_titles.get(issue.object_id)
+        return self.course_titles.get(issue.object_id)
+
+
+def _should_complete(segment_ids, group_by, totals, after_user):
+    """``(user id, group id)`` for every chapter or course a learner has
+    watched all segments of, ordered by learner."""
+    rows = (
+        SegmentProgress.objects.filter(
+            percent_watched__gte=100, segment_id__in=segment_ids
+        )
+        .values_list("user_id", group_by)
+        .annotate(completed=Count("id"))
+        .order_by("user_id", group_by)
+    )
+    if after_user is not None:
+        rows = rows.filter(user_id__gte=after_user)
+    for user_id, group_id, completed in rows.iterator(chunk_size=CHUNK_SIZE):
+        if completed == totals.get(group_id):
+            yield user_id, group_id
+
+
+def _existing(model, field, object_ids, after_user):
+    """``(user id, object id, pk, completed)`` progress rows, ordered the
+    same way."""
+    rows = (
+        model.objects.filter(**{f"{field}_id__in": object_ids})
+        .values_list("user_id", f"{field}_id", "id", "completed")
+        .order_by("user_id", f"{field}_id")
+    )
+    if after_user is not None:
+        rows = rows.filter(user_id__gte=after_user)
+    return rows.iterator(chunk_size=CHUNK_SIZE)
+
+
+def _diff(kind, course_id, should_complete, existing):
+    """Walk both ordered streams together, like a merge join."""
+    row = next(existing, None)
+    for key in should_complete:
+        while row is not None and row[:2] < key:
+            row = next(existing, None)
+        if row is None or row[:2] != key:
+            yield Issue(kind, MISSING, key[0], key[1], course_id, None)
+        elif not row[3]:
+            yield Issue(kind, INCOMPLETE, key[0], key[1], course_id, row[2])
+
+
+def _sort_key(issue):
+    return issue.user_id, issue.kind == COURSE, issue.object_id
+
+
+def _course_issues(structure, course_id, kinds, after_user):
+    streams = []
+    chapters = structure.course_chapters.get(course_id, ())
+    if CHAPTER in kinds and chapters:
+        segment_ids = set().union(*(structure.chapter_segments[pk] for pk in chapters))
+        totals = {pk: len(structure.chapter_segments[pk]) for pk in chapters}
+        streams.append(
+            _diff(
+                CHAPTER,
+                course_id,
+                _should_complete(segment_ids, "segment__chapter_id", totals, after_user),
+                _existing(ChapterProgress, "chapter", chapters, after_user),
+            )
+        )
+    required = structure.course_segments.get(course_id)
+    if COURSE in kinds and required:
+        streams.append(
+            _diff(
+                COURSE,
+                course_id,
+                _should_complete(
+                    required, "segment__course_id", {course_id: len(required)}, after_user
+                ),
+                _existing(CourseProgress, "course", [course_id], after_user),
+            )
+        )
+    return heapq.merge(*streams, key=_sort_key)
+
+
+def issue_cursor(structure, issue):
+    """Opaque position of ``issue`` in the report, for keyset pagination.
+
+    It starts with the course's tree path, so a report whose course has
+    since been deleted or unpublished resumes at the course after it.
+    """
+    return (
+        f"{structure.course_paths[issue.course_id]}-{issue.course_id}-"
+        f"{issue.user_id}-{issue.kind}-{issue.object_id}"
+    )
+
+
+def _parse_cursor(cursor):
+    try:
+        course_path, course_id, user_id, kind, object_id = cursor.split("-")
+        if not course_path.isalnum() or kind not in (CHAPTER, COURSE):
+            return None
+        return course_path, int(course_id), int(user_id), kind, int(object_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def iter_issues(
+    structure=None,
+    course_ids=None,
+    kinds=(CHAPTER, COURSE),
+    problems=(MISSING, INCOMPLETE),
+    after=None,
+):
+    """
+    Progress records that should be complete but aren't, ordered by course
+    (as in the page tree), learner, then chapters before the course.
+
+    Issues are produced course by course from ordered, chunked cursors, so
+    memory stays flat however many there are. ``after`` is an
+    ``issue_cursor`` to resume from; learners before it aren't read again.
+    """
+    structure = structure or Structure(course_ids)
+    after = _parse_cursor(after) if after else None
+    courses = list(structure.course_titles)
+    if course_ids is not None:
+        courses = [pk for pk in courses if pk in set(course_ids)]
+    if after is not None:
+        after_path, after_course, *after_key = after
+        # Courses are in path order; the cursor's course may be gone
+        courses = [pk for pk in courses if structure.course_paths[pk] >= after_path]
+
+    for course_id in courses:
+        resume = (
+            after is not None
+            and course_id == after_course
+            and structure.course_paths[course_id] == after_path
+        )
+        after_user = after_key[0] if resume else None
+        for issue in _course_issues(structure, course_id, kinds, after_user):
+            if resume and _sort_key(issue) <= (
+                after_key[0],
+                after_key[1] == COURSE,
+                after_key[2],
+            ):
+                continue
+            if issue.problem in problems:
+                yield issue
+
+
+def describe(structure, issues, chunk_size=CHUNK_SIZE):
+    """Report rows for ``issues``, looking up learners' emails a chunk at a
+    time."""
+    User = get_user_model()
+    issues = iter(issues)
+    while chunk := list(islice(issues, chunk_size)):
+        emails = dict(
+            User.objects.filter(pk__in={issue.user_id for issue in chunk}).values_list(
+                "pk", "email"
+            )
+        )
+        for issue in chunk:
+            yield {
+                "user": emails.get(issue.user_id),
+                "user_id": issue.user_id,
+                "type": issue.kind.title(),
+                "course": structure.course_titles.get(issue.course_id),
+                "course_id": issue.course_id,
+                "item": structure.title(issue),
+                "item_id": issue.object_id,
+                "issue": PROBLEM_LABELS[issue.problem],
+            }
+
+
+def find_issues(course_ids=None, structure=None):
+    """All issues, as a list (see ``iter_issues``)."""
+    return list(iter_issues(structure, course_ids))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def apply_fixes(issues, batch_size=500, now=None):
+    """
+    Mark the progress records in ``issues`` complete and recount the
+    completion counters of the learners and courses involved. Returns
+    counts of ``chapter_created``, ``chapter_updated``, ``course_created``
+    and ``course_updated``.
+    """
+    now = now or timezone.now()
+    issues = list(issues)
+    counts = {}
+    for kind, model, field in (
+        (CHAPTER, ChapterProgress, "chapter"),
+        (COURSE, CourseProgress, "course"),
+    ):
+        missing = [i for i in issues if i.kind == kind and i.problem == MISSING]
+        incomplete = [
+            i.progress_id for i in issues if i.kind == kind and i.problem == INCOMPLETE
+        ]
+        created = updated = 0
+
+        for chunk in _chunks(missing, batch_size):
+            # ignore_conflicts: the learner may have completed it meanwhile,
+            # so count the rows that were actually inserted
+            rows = model.objects.filter(
+                user_id__in={issue.user_id for issue in chunk},
+                **{f"{field}_id__in": {issue.object_id for issue in chunk}},
+            )
+            before = rows.count()
+            model.objects.bulk_create(
+                [
+                    model(
+                        user_id=issue.user_id,
+                        completed=True,
+                        completed_at=now,
+                        **{f"{field}_id": issue.object_id},
+                    )
+                    for issue in chunk
+                ],
+                ignore_conflicts=True,
+            )
+            created += rows.count() - before
+        for chunk in _chunks(incomplete, batch_size):
+            updated += model.objects.filter(pk__in=chunk, completed=False).update(
+                completed=True, completed_at=now
+            )
+
+        counts[f"{kind}_created"] = created
+        counts[f"{kind}_updated"] = updated
+
+    # The counters decide when the next completion finishes a chapter or
+    # course, so they must agree with the rows written above
+    learners = defaultdict(set)
+    for issue in issues:
+        learners[issue.course_id].add(issue.user_id)
+    for course_id, user_ids in learners.items():
+        rebuild_counters([course_id], user_ids)
+    return counts
+
+
+def reconcile(course_ids=None, batch_size=500):
+    """
+    Fix every issue, one course at a time: a course's issues are read in
+    full before any of them is written, so no cursor is open on a table
+    while it changes. Returns the summed ``apply_fixes`` counts.
+    """
+    structure = Structure(course_ids)
+    now = timezone.now()
+    totals = dict.fromkeys(
+        ("chapter_created", "chapter_updated", "course_created", "course_updated"), 0
+    )
+    for course_id in structure.course_titles:
+        issues = iter_issues(structure, [course_id])
+        for key, count in apply_fixes(issues, batch_size, now).items():
+            totals[key] += count
+    return totals
+
+
+class FixWorker(BackgroundWorker):
+    """
+    Runs ``reconcile`` in a background thread when staff apply every fix
+    from the admin report. Requests that arrive while it runs are covered
+    by one more run.
+    """
+
+    name = "progress-fix-all"
+    error_message = "Failed to apply progress fixes"
+
+    def work(self):
+        counts = reconcile()
+        logger.info(
+            "Progress fixes applied: %(chapter_created)s chapters created, "
+            "%(chapter_updated)s chapters updated, %(course_created)s courses "
+            "created, %(course_updated)s courses updated",
+            counts,
+        )
+
+
+fix_worker = FixWorker()
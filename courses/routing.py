@@ -0,0 +1,99 @@
+"""
+Route cache
+
+Wagtail routes a request by walking the page tree from the site root, one
+slug at a time, with a query or two per level. A segment URL is five levels
+deep, so that's a dozen queries before SegmentPage.serve runs.
+
+``RouteCacheMiddleware`` remembers which page a URL resolved to, keyed on
+the host and path, for course, chapter and segment pages. On the next
+request for that URL it loads the page with one query and hands it to
+Wagtail's ``serve`` as the route result (``Page.route_for_request`` uses
+``request._wagtail_route_for_request`` when it's set), so the walk is
+skipped. Everything after routing (view restrictions, before_serve_page
+hooks, the page's own ``serve``) runs as usual.
+
+Entries are versioned (see ova/cache_versions.py). ``invalidate_routes``
+bumps the version, and the receivers in signals.py call it on publish
+(which covers slug changes), unpublish, move and delete. A cached page that
+is no longer live, or whose url_path no longer matches, is treated as a
+miss, so a missed invalidation can't route to the wrong page.
+"""
+
+import hashlib
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from wagtail.models import Page
+from wagtail.url_routing import RouteResult
+from wagtail.views import serve as wagtail_serve
+
+from ova.cache_versions import bump_version, current_version
+
+ROUTE_CACHE_TIMEOUT = 60 * 60 * 24
+
+VERSION_KEY = "courses:route-version"
+
+
+def _cached_types():
+    from .models import ChapterPage, CoursePage, SegmentPage
+
+    return (CoursePage, ChapterPage, SegmentPage)
+
+
+def invalidate_routes():
+    bump_version(VERSION_KEY)
+
+
+def route_key(host, path, version):
+    digest = hashlib.sha256(f"{host}/{path}".encode()).hexdigest()
+    return f"courses:route:{version}:{digest}"
+
+
+def _load(entry):
+    page_id, content_type_id, url_path = entry
+    model = ContentType.objects.get_for_id(content_type_id).model_class()
+    if model is None:
+        return None
+    page = model.objects.filter(id=page_id, live=True).first()
+    if page is None or page.url_path != url_path or page.expired:
+        return None
+    return page
+
+
+class RouteCacheMiddleware:
+    """Skip Wagtail's tree walk for course pages it has routed before."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func is not wagtail_serve or hasattr(
+            request, "_wagtail_route_for_request"
+        ):
+            return None
+
+        # Wagtail's URL pattern passes the path positionally
+        path = view_args[0] if view_args else view_kwargs.get("path", "")
+        key = route_key(request.get_host(), path, current_version(VERSION_KEY))
+        entry = cache.get(key)
+        if entry is not None:
+            page = _load(entry)
+            if page is not None:
+                request._wagtail_route_for_request = RouteResult(page)
+                return None
+
+        # Route the usual way (the result is kept on the request for serve)
+        result = Page.route_for_request(request, path)
+        if result is not None:
+            page, args, kwargs = result
+            if isinstance(page, _cached_types()) and not args and not kwargs:
+                cache.set(
+                    key,
+                    (page.id, page.content_type_id, page.url_path),
+                    ROUTE_CACHE_TIMEOUT,
+                )
+        return None
@@ -6,23 +6,45 @@ Purpose:    Automatically update ChapterProgress and CourseProgress whenever
             a user's segment watch progress is saved.
 
 How it works:
-    1. A SegmentProgress record is created or updated (e.g. when the video
-       player reports percent_watched via the /api/progress/update/ endpoint).
-    2. This signal fires and walks up the Wagtail page tree:
-       SegmentPage -> ChapterPage -> CoursePage.
-    3. It checks whether ALL segments in the chapter are now complete
-       (percent_watched >= 100). If so, ChapterProgress is marked complete.
-    4. It then checks whether ALL chapters in the course are complete.
-       If so, CourseProgress is marked complete.
-
-This replaces the need to run temp/reconcile_progress_apply.py manually.
-The reconciliation is idempotent -- running it multiple times on already-
-completed progress is a no-op.
+    1. A SegmentProgress record is created or updated through the ORM (the
+       /api/progress/update/ endpoint writes through courses/progress.py,
+       which does the same thing without the signal).
+    2. If this save took percent_watched to 100 for the first time, the
+       segment is handed to progress.complete_segments(), which calls
+       register_completions() directly or, with PROGRESS_RECONCILE_MODE =
+       "deferred", queues it for the background reconcile worker.
+    3. That bumps the user's completed-segment counter for the chapter and,
+       once it reaches the chapter's segment total, marks ChapterProgress
+       complete.
+    4. A newly completed non-intro chapter bumps the course counter the same
+       way, and CourseProgress is marked complete when it reaches the number
+       of non-intro chapters.
+
+Re-saving a segment that was already at 100% is a no-op, so the signal is
+idempotent.
+
+The per-course segment/chapter totals come from the cached course outline
+(outline.py); the receivers at the bottom of this module invalidate it, and
+refresh the course's stored first segment, whenever a course's structure
+changes. When pages are published, unpublished, moved or deleted they also
+recount the completion counters of the chapters (or, for chapters, the
+courses) involved once the transaction commits, since the counters would
+otherwise stay below the totals for segments that come back or move between
+chapters.
+
+They also drop cached routes (routing.py) when pages are published,
+unpublished, moved or deleted, and invalidate the cached course catalog
+(catalog.py) when a course, tag, topic, instructor, role or image changes.
+With BAKE_ON_PUBLISH, publishing and unpublishing also refresh the static
+bake (bake.py) once the transaction commits.
 """
 
+from django.conf import settings
+from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from django.utils import timezone
+from wagtail.images import get_image_model_string
+from wagtail.signals import page_published, page_unpublished, post_page_move
 
 
 @receiver(post_save, sender="courses.SegmentProgress")
@@ -30,78 +52,165 @@ def reconcile_progress(sender, instance, **kwargs):
     """
     After a SegmentProgress is saved, check whether the parent chapter
     and course should be marked complete for that user.
-
-    Walks the page hierarchy (Segment -> Chapter -> Course) and creates or
-    updates the corresponding progress records when all child items are done.
     """
-    from .models import (
-        ChapterPage,
-        CoursePage,
-        ChapterProgress,
-        CourseProgress,
-    )
-    from .views import _is_chapter_complete, _is_course_complete
+    from .progress import COMPLETE_PERCENT, complete_segments
 
-    if instance.percent_watched < 100:
+    previous = instance._stored_percent
+    instance._stored_percent = instance.percent_watched
+
+    if previous >= COMPLETE_PERCENT or instance.percent_watched < COMPLETE_PERCENT:
         return
 
-    user = instance.user
-    segment = instance.segment
+    complete_segments(instance.user, [instance.segment_id])
 
-    # Walk up the Wagtail page tree: Segment -> Chapter -> Course
-    chapter = segment.get_parent()
-    if not chapter:
-        return
-    chapter = chapter.specific
 
-    if not isinstance(chapter, ChapterPage):
-        return
+@receiver(post_delete, sender="courses.SegmentPage")
+def update_course_duration_on_segment_delete(sender, instance, **kwargs):
+    instance._update_course_duration_seconds()
+
+
+def _course_ids_above(page):
+    """Ids of the CoursePages at or above ``page`` (at most one in practice)."""
+    from .models import CoursePage
+
+    step = page.steplen
+    ancestor_paths = [page.path[:end] for end in range(step, len(page.path) + 1, step)]
+    return list(
+        CoursePage.objects.filter(path__in=ancestor_paths).values_list("id", flat=True)
+    )
+
+
+def _invalidate_structure(page):
+    from .catalog import invalidate_catalog
+    from .models import CoursePage
+    from .outline import invalidate_course_outline
+
+    course_ids = _course_ids_above(page)
+    invalidate_course_outline(*course_ids)
+    for course in CoursePage.objects.filter(id__in=course_ids).only(
+        "id", "first_segment", "first_segment_url"
+    ):
+        if course.refresh_first_segment():
+            # The catalog links each course to its first segment
+            invalidate_catalog()
+
+
+def _recount_counters(page):
+    """Recount the counters that count ``page`` once the transaction
+    commits: its chapter's for a segment, its course's for a chapter."""
+    from .models import ChapterPage, SegmentPage
+    from .progress import schedule_recount
 
-    course = chapter.get_parent()
-    if not course:
+    if isinstance(page, SegmentPage):
+        schedule_recount(chapter_ids=[page.chapter_id])
+    elif isinstance(page, ChapterPage):
+        schedule_recount(course_ids=_course_ids_above(page))
+
+
+@receiver(post_save, sender="courses.SegmentPage")
+@receiver(post_save, sender="courses.ChapterPage")
+@receiver(post_save, sender="courses.CoursePage")
+@receiver(post_delete, sender="courses.SegmentPage")
+@receiver(post_delete, sender="courses.ChapterPage")
+def invalidate_course_structure(sender, instance, **kwargs):
+    _invalidate_structure(instance)
+    if kwargs.get("signal") is post_delete:
+        _recount_counters(instance)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_course_structure_on_publish(sender, instance, **kwargs):
+    from .models import ChapterPage, CoursePage, SegmentPage
+
+    if isinstance(instance, (SegmentPage, ChapterPage, CoursePage)):
+        _invalidate_structure(instance)
+        _recount_counters(instance)
+
+
+@receiver(post_page_move)
+def invalidate_course_structure_on_move(sender, instance, parent_page_before, **kwargs):
+    from .models import ChapterPage, CoursePage, SegmentPage
+    from .progress import schedule_recount
+
+    # Moves rewrite paths without saving the pages, so the moved chapters
+    # and segments pick up their new course here
+    for course in CoursePage.objects.filter(id__in=_course_ids_above(instance)):
+        course.sync_ancestry()
+
+    # Both the course the page left and the one it joined change shape
+    _invalidate_structure(instance)
+    _invalidate_structure(parent_page_before)
+
+    page_class = instance.specific_class
+    if page_class is None:
         return
-    course = course.specific
-
-    # --- Chapter progress ---
-    # A chapter is complete when every segment has percent_watched >= 100.
-    if _is_chapter_complete(user, chapter):
-        cp, created = ChapterProgress.objects.get_or_create(
-            user=user,
-            chapter=chapter,
-            defaults={"completed": True, "completed_at": timezone.now()},
+    if issubclass(page_class, SegmentPage):
+        schedule_recount(
+            chapter_ids=[parent_page_before.id, instance.get_parent().id]
         )
-        if not created and not cp.completed:
-            cp.completed = True
-            cp.completed_at = timezone.now()
-            cp.save()
-
-    # --- Course progress ---
-    # A course is complete when every chapter is complete.
-    if isinstance(course, CoursePage) and _is_course_complete(user, course):
-        cprog, created = CourseProgress.objects.get_or_create(
-            user=user,
-            course=course,
-            defaults={"completed": True, "completed_at": timezone.now()},
+    elif issubclass(page_class, ChapterPage):
+        schedule_recount(
+            course_ids=_course_ids_above(instance)
+            + _course_ids_above(parent_page_before)
         )
-        if not created and not cprog.completed:
-            cprog.completed = True
-            cprog.completed_at = timezone.now()
-            cprog.save()
 
 
+@receiver(post_save, sender="courses.CoursePage")
+@receiver(post_delete, sender="courses.CoursePage")
+@receiver(post_save, sender="courses.InstructorsOrderable")
+@receiver(post_delete, sender="courses.InstructorsOrderable")
+@receiver(post_save, sender="courses.Instructor")
+@receiver(post_delete, sender="courses.Instructor")
+@receiver(post_save, sender="courses.Role")
+@receiver(post_delete, sender="courses.Role")
+@receiver(post_save, sender="courses.Topic")
+@receiver(post_delete, sender="courses.Topic")
+@receiver(post_save, sender="courses.CourseCategoryTag")
+@receiver(post_delete, sender="courses.CourseCategoryTag")
+@receiver(post_save, sender="courses.TagSnippet")
+@receiver(post_delete, sender="courses.TagSnippet")
+@receiver(post_save, sender="taggit.Tag")
+@receiver(post_delete, sender="taggit.Tag")
+@receiver(post_save, sender=get_image_model_string())
+@receiver(post_delete, sender=get_image_model_string())
+def invalidate_catalog_on_change(sender, **kwargs):
+    from .catalog import invalidate_catalog
+
+    invalidate_catalog()
+
+
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def invalidate_catalog_on_course_change(sender, instance, **kwargs):
+    from .catalog import invalidate_catalog
+    from .models import CoursePage
+
+    if instance.specific_class is CoursePage:
+        invalidate_catalog()
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@receiver(post_delete, sender="courses.CoursePage")
+@receiver(post_delete, sender="courses.ChapterPage")
 @receiver(post_delete, sender="courses.SegmentPage")
-def update_course_duration_on_segment_delete(sender, instance, **kwargs):
-    from .models import CoursePage, SegmentPage
+def invalidate_routes_on_change(sender, **kwargs):
+    from .routing import invalidate_routes
 
-    # Each Wagtail path step is 4 chars: segment is 2 levels below course
-    course_path = instance.path[: (instance.depth - 2) * 4]
-    if not course_path:
-        return
+    # Publishing also covers slug changes. Only course, chapter and segment
+    # routes are cached, and deleting a page deletes its descendants one by
+    # one, so those three senders cover deletes anywhere above them too.
+    invalidate_routes()
 
-    segments = SegmentPage.objects.filter(path__startswith=course_path).live()
 
-    total_seconds = sum(
-        int(seg.duration.total_seconds()) for seg in segments if seg.duration
-    )
+@receiver(page_published)
+@receiver(page_unpublished)
+def bake_on_publish(sender, instance, **kwargs):
+    if not settings.BAKE_ON_PUBLISH:
+        return
+
+    from .bake import bake_worker
 
-    CoursePage.objects.filter(path=course_path).update(duration_seconds=total_seconds)
+    transaction.on_commit(bake_worker.wake)
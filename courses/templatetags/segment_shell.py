@@ -0,0 +1,44 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+
+register = template.Library()
+
+
+class ShellFragmentNode(template.Node):
+    def __init__(self, nodelist, name):
+        self.nodelist = nodelist
+        self.name = name
+
+    def render(self, context):
+        prefix = context.get("shell_key")
+        timeout = settings.SEGMENT_SHELL_TIMEOUT
+        # Pages without a shell key (e.g. CoursePage) render uncached
+        if not prefix or timeout <= 0:
+            return self.nodelist.render(context)
+
+        key = f"{prefix}:{self.name}"
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, timeout)
+        return content
+
+
+@register.tag
+def shell_fragment(parser, token):
+    """
+    Cache the enclosed markup as part of a segment page's shared shell:
+
+        {% shell_fragment "card" %} ... {% endshell_fragment %}
+
+    The content must not depend on the user. See courses/overlay.py.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2 or bits[1][0] not in "\"'" or bits[1][-1] != bits[1][0]:
+        raise template.TemplateSyntaxError(
+            f"{bits[0]} takes one quoted fragment name"
+        )
+    nodelist = parser.parse(("endshell_fragment",))
+    parser.delete_first_token()
+    return ShellFragmentNode(nodelist, bits[1][1:-1])
@@ -0,0 +1,272 @@
+"""
+Tests for the bulk progress reconciliation (courses/reconcile.py), its
+management command and the CourseProgress admin report.
+"""
+
+import json
+from io import StringIO
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import (
+    ChapterCompletionCounter,
+    ChapterPage,
+    ChapterProgress,
+    CourseCompletionCounter,
+    CoursePage,
+    CourseProgress,
+    SegmentPage,
+    SegmentProgress,
+)
+from courses.reconcile import (
+    CHAPTER,
+    COURSE,
+    INCOMPLETE,
+    MISSING,
+    Structure,
+    apply_fixes,
+    find_issues,
+    issue_cursor,
+    iter_issues,
+)
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def course():
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Reconcile Course", live=True)
+    root.add_child(instance=course)
+    pages = {"course": course}
+    for name, is_intro in (("intro", True), ("one", False), ("two", False)):
+        chapter = ChapterPage(title=f"Chapter {name}", is_intro=is_intro, live=True)
+        course.add_child(instance=chapter)
+        segment = SegmentPage(title=f"Segment {name}", live=True)
+        chapter.add_child(instance=segment)
+        pages[name] = chapter
+        pages[f"{name}_segment"] = segment
+    return pages
+
+
+def _watched(user, *segments):
+    # bulk_create skips the signals that would reconcile on the way in
+    SegmentProgress.objects.bulk_create(
+        [SegmentProgress(user=user, segment=s, percent_watched=100) for s in segments]
+    )
+
+
+def _learner(n):
+    return User.objects.create_user(email=f"reconcile{n}@example.com", password=None)
+
+
+def test_find_issues(course):
+    finished = _learner(1)
+    _watched(finished, course["intro_segment"], course["one_segment"], course["two_segment"])
+    halfway = _learner(2)
+    _watched(halfway, course["one_segment"])
+    ChapterProgress.objects.create(user=halfway, chapter=course["one"], completed=False)
+    _learner(3)
+
+    issues = {
+        (i.user_id, i.kind, i.object_id, i.problem) for i in find_issues()
+    }
+
+    assert issues == {
+        (finished.id, CHAPTER, course["intro"].id, MISSING),
+        (finished.id, CHAPTER, course["one"].id, MISSING),
+        (finished.id, CHAPTER, course["two"].id, MISSING),
+        (finished.id, COURSE, course["course"].id, MISSING),
+        (halfway.id, CHAPTER, course["one"].id, INCOMPLETE),
+    }
+
+
+def test_query_count_does_not_grow_with_learners(course):
+    def count():
+        find_issues()  # warm the outline cache
+        with CaptureQueriesContext(connection) as queries:
+            find_issues()
+        return len(queries)
+
+    _watched(_learner(0), course["one_segment"])
+    few = count()
+    for n in range(1, 20):
+        _watched(_learner(n), course["one_segment"], course["two_segment"])
+
+    assert count() == few
+
+
+def test_apply_fixes(course):
+    finished = _learner(1)
+    _watched(finished, course["one_segment"], course["two_segment"])
+    CourseProgress.objects.create(user=finished, course=course["course"], completed=False)
+
+    counts = apply_fixes(find_issues(), batch_size=1)
+
+    assert counts == {
+        "chapter_created": 2,
+        "chapter_updated": 0,
+        "course_created": 0,
+        "course_updated": 1,
+    }
+    assert CourseProgress.objects.get(user=finished).completed
+    assert find_issues() == []
+    assert CourseCompletionCounter.objects.get(user=finished).completed_chapters == 2
+    assert dict(
+        ChapterCompletionCounter.objects.filter(user=finished).values_list(
+            "chapter_id", "completed_segments"
+        )
+    ) == {course["one"].id: 1, course["two"].id: 1}
+
+
+def test_apply_fixes_counts_only_inserted_rows(course):
+    finished = _learner(1)
+    _watched(finished, course["one_segment"])
+    issues = find_issues()
+    # The learner's own heartbeat got there first
+    ChapterProgress.objects.create(user=finished, chapter=course["one"], completed=True)
+
+    counts = apply_fixes(issues)
+
+    assert counts["chapter_created"] == 0
+    assert ChapterProgress.objects.filter(user=finished).count() == 1
+
+
+def test_command_dry_run(course):
+    _watched(_learner(1), course["one_segment"])
+
+    out = StringIO()
+    call_command("reconcile_progress", dry_run=True, stdout=out)
+    assert "1 records would be fixed" in out.getvalue()
+    assert not ChapterProgress.objects.exists()
+
+    call_command("reconcile_progress", stdout=StringIO())
+    assert ChapterProgress.objects.get().completed
+
+
+ADMIN_SETTINGS = {
+    "STORAGES": {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+}
+
+
+def test_keyset_resume_and_filters(course):
+    learners = [_learner(n) for n in range(3)]
+    for learner in learners:
+        _watched(learner, course["one_segment"], course["two_segment"])
+    ChapterProgress.objects.create(user=learners[1], chapter=course["two"], completed=False)
+
+    issues = find_issues()
+    assert len(issues) == 9
+
+    resumed = list(iter_issues(after=issue_cursor(Structure(), issues[3])))
+    assert resumed == issues[4:]
+    assert list(iter_issues(after="not-a-cursor")) == issues
+
+    assert [i.kind for i in iter_issues(kinds=(COURSE,))] == [COURSE] * 3
+    assert [i.user_id for i in iter_issues(problems=(INCOMPLETE,))] == [learners[1].id]
+    assert list(iter_issues(course_ids=[course["course"].id + 1000])) == []
+
+
+def test_cursor_on_a_deleted_course_resumes_at_the_next_course(course):
+    root = Page.get_first_root_node()
+    courses = {}
+    for name in ("middle", "last"):
+        other = CoursePage(title=f"Reconcile {name}", live=True)
+        root.add_child(instance=other)
+        chapter = ChapterPage(title=f"Chapter {name}", live=True)
+        other.add_child(instance=chapter)
+        segment = SegmentPage(title=f"Segment {name}", live=True)
+        chapter.add_child(instance=segment)
+        courses[name] = (other, segment)
+
+    learner = _learner(0)
+    _watched(learner, course["one_segment"], *(s for _, s in courses.values()))
+    middle_issues = [
+        issue
+        for issue in find_issues()
+        if issue.course_id == courses["middle"][0].id
+    ]
+    cursor = issue_cursor(Structure(), middle_issues[0])
+
+    courses["middle"][0].delete()
+
+    assert {issue.course_id for issue in iter_issues(after=cursor)} == {
+        courses["last"][0].id
+    }
+
+
+@override_settings(**ADMIN_SETTINGS)
+def test_admin_report_is_keyset_paginated(admin_client, course, monkeypatch):
+    monkeypatch.setattr("courses.admin.RECONCILE_PAGE_SIZE", 2)
+    for n in range(3):
+        _watched(_learner(n), course["one_segment"])
+
+    url = reverse("admin:courses_courseprogress_reconcile")
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert len(response.context["issues"]) == 2
+    assert response.context["issues"][0]["item"] == "Chapter one"
+    next_cursor = response.context["next_cursor"]
+    assert next_cursor
+
+    response = admin_client.get(url, {"after": next_cursor})
+    assert [row["user"] for row in response.context["issues"]] == [
+        "reconcile2@example.com"
+    ]
+    assert response.context["next_cursor"] is None
+
+    response = admin_client.get(url, {"type": "course"})
+    assert response.context["issues"] == []
+
+    # Applying hands the work to the background worker and returns at once
+    from courses.reconcile import fix_worker
+
+    woken = []
+    monkeypatch.setattr(fix_worker, "wake", lambda: woken.append(1))
+    response = admin_client.post(reverse("admin:courses_courseprogress_reconcile_apply"))
+    assert response.status_code == 302
+    assert woken == [1]
+    assert not ChapterProgress.objects.filter(completed=True).exists()
+
+    fix_worker.work()
+    assert ChapterProgress.objects.filter(completed=True).count() == 3
+
+
+def _streamed(response):
+    # The export is an async iterator, as it's served under ASGI
+    async def read():
+        return b"".join([part async for part in response.streaming_content])
+
+    return async_to_sync(read)()
+
+
+@override_settings(**ADMIN_SETTINGS)
+def test_admin_report_streams_exports(admin_client, course):
+    for n in range(3):
+        _watched(_learner(n), course["one_segment"])
+    url = reverse("admin:courses_courseprogress_reconcile")
+
+    response = admin_client.get(url, {"format": "csv"})
+    assert response.streaming
+    lines = _streamed(response).decode().splitlines()
+    assert lines[0] == "user,user_id,type,course,course_id,item,item_id,issue"
+    assert len(lines) == 4
+    assert lines[1].startswith("reconcile0@example.com,")
+
+    response = admin_client.get(url, {"format": "ndjson", "issue": "missing"})
+    rows = [json.loads(line) for line in _streamed(response).splitlines()]
+    assert [row["issue"] for row in rows] == ["Missing record"] * 3
+    assert rows[0]["course"] == "Reconcile Course"
@@ -0,0 +1,206 @@
+"""
+Tests for the per-user completion counters (ChapterCompletionCounter /
+CourseCompletionCounter) that drive chapter and course completion.
+"""
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from wagtail.models import Page
+
+from users.models import User
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    ChapterProgress,
+    CourseProgress,
+    ChapterCompletionCounter,
+    CourseCompletionCounter,
+)
+from courses.progress import record_segment_progress
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(email="counter@example.com", password=None)
+
+
+def build_course(title, chapters, segments_per_chapter):
+    root = Page.get_first_root_node()
+    course = CoursePage(title=title, live=True)
+    root.add_child(instance=course)
+
+    tree = []
+    for c in range(chapters):
+        chapter = ChapterPage(title=f"{title} chapter {c}", live=True)
+        course.add_child(instance=chapter)
+        segments = []
+        for s in range(segments_per_chapter):
+            segment = SegmentPage(title=f"{title} segment {c}-{s}", live=True)
+            chapter.add_child(instance=segment)
+            segments.append(segment)
+        tree.append((chapter, segments))
+    return course, tree
+
+
+def test_counter_bumped_once_per_segment(user):
+    _course, [(chapter, segments)] = build_course("Once", 1, 3)
+
+    record_segment_progress(user, segments[0].id, 100)
+    record_segment_progress(user, segments[0].id, 100)
+
+    # ORM saves go through the signal and must not double count either
+    sp = SegmentProgress.objects.create(user=user, segment=segments[1])
+    sp.percent_watched = 100
+    sp.save()
+    sp.save()
+
+    counter = ChapterCompletionCounter.objects.get(user=user, chapter=chapter)
+    assert counter.completed_segments == 2
+    assert not ChapterProgress.objects.filter(user=user, chapter=chapter).exists()
+
+
+def test_counters_roll_up_to_course(user):
+    course, tree = build_course("Rollup", 2, 2)
+
+    for _chapter, segments in tree:
+        for segment in segments:
+            record_segment_progress(user, segment.id, 100)
+
+    assert CourseCompletionCounter.objects.get(
+        user=user, course=course
+    ).completed_chapters == 2
+    assert CourseProgress.objects.get(user=user, course=course).completed is True
+
+
+def test_new_segment_raises_chapter_total(user):
+    """Totals are cached per course; adding a segment must invalidate them."""
+    _course, [(chapter, segments)] = build_course("Grow", 1, 1)
+    record_segment_progress(user, segments[0].id, 50)
+
+    extra = SegmentPage(title="Grow extra", live=True)
+    chapter.add_child(instance=extra)
+
+    record_segment_progress(user, segments[0].id, 100)
+
+    assert not ChapterProgress.objects.filter(user=user, chapter=chapter).exists()
+
+    record_segment_progress(user, extra.id, 100)
+
+    assert ChapterProgress.objects.get(user=user, chapter=chapter).completed is True
+
+
+def test_drifted_counter_is_corrected(user):
+    """A counter that overshoots (e.g. after segments were removed) is
+    checked against the progress rows before anything is marked complete."""
+    _course, [(chapter, segments)] = build_course("Drift", 1, 2)
+    ChapterCompletionCounter.objects.create(
+        user=user, chapter=chapter, completed_segments=5
+    )
+
+    record_segment_progress(user, segments[0].id, 100)
+
+    assert not ChapterProgress.objects.filter(user=user, chapter=chapter).exists()
+    assert ChapterCompletionCounter.objects.get(
+        user=user, chapter=chapter
+    ).completed_segments == 1
+
+
+def test_completion_cost_independent_of_course_size(user):
+    _small, [(_ch, small_segments)] = build_course("Small", 1, 3)
+    _large, large_tree = build_course("Large", 8, 6)
+    large_segments = large_tree[0][1]
+
+    # Warm the cached totals for both courses
+    record_segment_progress(user, small_segments[0].id, 100)
+    record_segment_progress(user, large_segments[0].id, 100)
+
+    with CaptureQueriesContext(connection) as small:
+        record_segment_progress(user, small_segments[1].id, 100)
+    with CaptureQueriesContext(connection) as large:
+        record_segment_progress(user, large_segments[1].id, 100)
+
+    assert len(large) == len(small)
+
+
+def test_counter_recounted_when_segment_moves_in(
+    user, django_capture_on_commit_callbacks
+):
+    """A watched segment moved into another chapter counts there, so the
+    chapter still completes when the learner watches the rest of it."""
+    _course, [(first, [moved]), (second, [other])] = build_course("Move", 2, 1)
+    record_segment_progress(user, moved.id, 100)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        moved.move(second, pos="last-child")
+    record_segment_progress(user, other.id, 100)
+
+    assert ChapterCompletionCounter.objects.get(
+        user=user, chapter=second
+    ).completed_segments == 2
+    assert ChapterProgress.objects.get(user=user, chapter=second).completed is True
+    assert not ChapterCompletionCounter.objects.filter(
+        user=user, chapter=first, completed_segments__gt=0
+    ).exists()
+
+
+def test_counter_recounted_on_republish(user, django_capture_on_commit_callbacks):
+    """Progress on a segment that comes back counts towards its chapter
+    again, even though it never crosses 100% a second time."""
+    _course, [(chapter, segments)] = build_course("Republish", 1, 2)
+    record_segment_progress(user, segments[0].id, 100)
+    with django_capture_on_commit_callbacks(execute=True):
+        segments[0].unpublish()
+    record_segment_progress(user, segments[1].id, 100)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        segments[0].save_revision().publish()
+    assert ChapterCompletionCounter.objects.get(
+        user=user, chapter=chapter
+    ).completed_segments == 2
+
+
+def test_deleting_a_chapter_recounts_once_after_commit(
+    user, django_capture_on_commit_callbacks, monkeypatch
+):
+    """Wagtail deletes a chapter's segments one by one; the counters are
+    recounted once the transaction commits, and only for what was touched."""
+    from courses import progress
+
+    course, [(doomed, segments), (kept, _)] = build_course("Delete", 2, 3)
+    for segment in segments:
+        record_segment_progress(user, segment.id, 100)
+
+    chapter_recounts, course_recounts = [], []
+    rebuild_chapters = progress.rebuild_chapter_counters
+    rebuild_courses = progress.rebuild_course_counters
+    monkeypatch.setattr(
+        progress,
+        "rebuild_chapter_counters",
+        lambda ids, *args: chapter_recounts.append(set(ids))
+        or rebuild_chapters(ids, *args),
+    )
+    monkeypatch.setattr(
+        progress,
+        "rebuild_course_counters",
+        lambda ids, *args: course_recounts.append(set(ids))
+        or rebuild_courses(ids, *args),
+    )
+
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        doomed.delete()
+    assert chapter_recounts == course_recounts == []
+
+    for callback in callbacks:
+        callback()
+    assert chapter_recounts == [{doomed.id}]
+    assert course_recounts == [{course.id}]
+    assert not ChapterCompletionCounter.objects.filter(user=user).exists()
+    assert not CourseCompletionCounter.objects.filter(
+        user=user, completed_chapters__gt=0
+    ).exists()
+    assert ChapterPage.objects.filter(id=kept.id).exists()
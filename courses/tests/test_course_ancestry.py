@@ -0,0 +1,91 @@
+"""
+Tests for the denormalised chapter/course columns on ChapterPage and
+SegmentPage.
+
+Page tree used by the fixture:
+
+    Root
+    ├── Course One
+    │   └── Chapter A
+    │       ├── A1
+    │       └── A2
+    └── Course Two
+        └── Chapter B
+            └── B1
+"""
+
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from wagtail.models import Page
+
+from courses.models import CoursePage, ChapterPage, SegmentPage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def tree():
+    root = Page.get_first_root_node()
+    pages = {}
+    for course_key, course_title, chapter_key, segments in [
+        ("one", "Course One", "a", ["A1", "A2"]),
+        ("two", "Course Two", "b", ["B1"]),
+    ]:
+        course = CoursePage(title=course_title, live=True)
+        root.add_child(instance=course)
+        chapter = ChapterPage(title=f"Chapter {chapter_key.upper()}", live=True)
+        course.add_child(instance=chapter)
+        pages[course_key] = course
+        pages[chapter_key] = chapter
+        for title in segments:
+            segment = SegmentPage(title=title, live=True)
+            chapter.add_child(instance=segment)
+            pages[title] = segment
+    return pages
+
+
+def _ancestry(page):
+    page = type(page).objects.get(pk=page.pk)
+    return getattr(page, "chapter_id", None), page.course_id
+
+
+def test_columns_set_on_create(tree):
+    assert _ancestry(tree["a"]) == (None, tree["one"].id)
+    assert _ancestry(tree["A2"]) == (tree["a"].id, tree["one"].id)
+    assert tree["B1"].course_title == "Course Two"
+
+
+def test_move_updates_chapter_and_its_segments(tree):
+    tree["a"].move(tree["two"], pos="last-child")
+
+    assert _ancestry(tree["a"]) == (None, tree["two"].id)
+    assert _ancestry(tree["A1"]) == (tree["a"].id, tree["two"].id)
+
+    tree["B1"].move(ChapterPage.objects.get(pk=tree["a"].pk), pos="last-child")
+
+    assert _ancestry(tree["B1"]) == (tree["a"].id, tree["two"].id)
+
+
+def test_copy_points_at_new_parents(tree):
+    copy = tree["a"].copy(recursive=True, to=tree["two"], update_attrs={"slug": "a-copy"})
+
+    assert _ancestry(copy) == (None, tree["two"].id)
+    for segment in SegmentPage.objects.filter(path__startswith=copy.path):
+        assert (segment.chapter_id, segment.course_id) == (copy.id, tree["two"].id)
+
+
+def test_backfill_command(tree):
+    SegmentPage.objects.update(chapter_id=None, course_id=None)
+    ChapterPage.objects.filter(pk=tree["b"].pk).update(course_id=tree["one"].id)
+
+    out = StringIO()
+    call_command("backfill_course_ancestry", dry_run=True, stdout=out)
+    assert "4 rows out of sync" in out.getvalue()
+    assert _ancestry(tree["A1"]) == (None, None)
+
+    call_command("backfill_course_ancestry", stdout=StringIO())
+    assert _ancestry(tree["A1"]) == (tree["a"].id, tree["one"].id)
+    assert _ancestry(tree["b"]) == (None, tree["two"].id)
+    assert _ancestry(tree["B1"]) == (tree["b"].id, tree["two"].id)
@@ -0,0 +1,131 @@
+"""
+Tests for the cached course catalog (courses/catalog.py) behind the course
+grid on the home page and the courses index, and for the home page's
+instructor and contributor panels.
+"""
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from wagtail.models import Page
+
+from users.models import User
+from courses.catalog import VERSION_KEY, get_catalog, get_people_panels
+from courses.models import (
+    CoursePage,
+    CourseProgress,
+    CoursesIndexPage,
+    Instructor,
+    InstructorsOrderable,
+    Role,
+    Topic,
+    build_courses_listing_context,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def index():
+    cache.clear()
+    root = Page.get_first_root_node()
+    index = CoursesIndexPage(title="Courses", live=True)
+    root.add_child(instance=index)
+    for title in ["First", "Second"]:
+        course = CoursePage(title=title, live=True)
+        index.add_child(instance=course)
+        course.tags.add("Lecture")
+        course.save()
+    return index
+
+
+def test_evicted_version_does_not_revive_old_entries(index):
+    """Losing the version key mustn't make entries from before a bump
+    current again."""
+    before = get_catalog(index)
+    Topic.objects.create(name="Eviction Topic")
+    after = get_catalog(index)
+    assert after.version > before.version
+
+    cache.delete(VERSION_KEY)
+    catalog = get_catalog(index)
+    assert catalog.version > after.version
+    assert "eviction-topic" in [t.slug for t in catalog.all_topics]
+
+
+def test_listing_queries(index, django_assert_num_queries):
+    user = User.objects.create_user(email="catalog@example.com", password="pass")
+    second = CoursePage.objects.get(title="Second")
+    CourseProgress.objects.create(user=user, course=second, completed=True)
+    build_courses_listing_context(index, AnonymousUser())
+
+    with django_assert_num_queries(0):
+        context = build_courses_listing_context(index, AnonymousUser())
+    assert [c.title for c in context["courses"]] == ["First", "Second"]
+    assert context["all_tags"] == ("Lecture",)
+    assert len(context["all_topics"]) == Topic.objects.count()
+
+    with django_assert_num_queries(1):
+        context = build_courses_listing_context(index, user)
+    assert [c.completed for c in context["courses"]] == [False, True]
+    # The shared cards aren't modified
+    assert not any(c.completed for c in get_catalog(index).courses)
+
+
+def test_catalog_invalidated_on_changes(index):
+    version = get_catalog(index).version
+
+    Topic.objects.create(name="Catalog Test Topic")
+    catalog = get_catalog(index)
+    assert catalog.version > version
+    assert "catalog-test-topic" in [t.slug for t in catalog.all_topics]
+
+    course = CoursePage.objects.get(title="First")
+    course.title = "Renamed"
+    course.save_revision().publish()
+    assert get_catalog(index).courses[0].title == "Renamed"
+
+    course.unpublish()
+    assert [c.title for c in get_catalog(index).courses] == ["Second"]
+
+
+def test_processed_social_links_stored():
+    role, _ = Role.objects.get_or_create(name="instructor")
+    person = Instructor.objects.create(
+        name="Ada",
+        bio="Bio",
+        role=role,
+        social_links=["https://www.example.com/ada/", "http://ada.dev"],
+    )
+
+    assert Instructor.objects.get(pk=person.pk).processed_social_links == [
+        {"url": "https://www.example.com/ada/", "clean": "example.com/ada"},
+        {"url": "http://ada.dev", "clean": "ada.dev"},
+    ]
+
+    person.social_links = ["https://ada.org"]
+    person.save(update_fields=["social_links"])
+    assert Instructor.objects.get(pk=person.pk).processed_social_links[0]["clean"] == "ada.org"
+
+
+def test_people_panels_cached(index, django_assert_num_queries):
+    instructor_role, _ = Role.objects.get_or_create(name="instructor")
+    contributor_role, _ = Role.objects.get_or_create(name="contributor")
+    ada = Instructor.objects.create(name="Ada", bio="Bio", role=instructor_role)
+    Instructor.objects.create(name="Bob", bio="Bio", role=contributor_role)
+    InstructorsOrderable.objects.create(
+        page=CoursePage.objects.get(title="First"), instructor=ada
+    )
+    get_people_panels()
+
+    with django_assert_num_queries(0):
+        panels = get_people_panels()
+    [person] = [p for p in panels["instructors"] if p.name == "Ada"]
+    assert [c.title for c in person.courses] == ["First"]
+    assert person.image_alt == "Profile"
+    assert "Bob" in [p.name for p in panels["contributors"]]
+
+    ada.tagline = "Designer"
+    ada.save()
+    [person] = [p for p in get_people_panels()["instructors"] if p.name == "Ada"]
+    assert person.tagline == "Designer"
@@ -0,0 +1,82 @@
+"""
+Tests for the stored first segment (id and URL) of a CoursePage.
+
+Page tree used by the fixture (under the default site's root page, so pages
+have URLs):
+
+    Home
+    └── Course
+        ├── Intro
+        │   └── Welcome
+        └── Chapter A
+            └── A1
+"""
+
+import pytest
+from django.core.management import call_command
+from wagtail.models import Site
+
+from courses.models import CoursePage, ChapterPage, SegmentPage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def course():
+    home = Site.objects.get(is_default_site=True).root_page
+
+    course = CoursePage(title="Entry Course", live=True)
+    home.add_child(instance=course)
+
+    pages = {"course": course}
+    for key, title, segment_title in [
+        ("intro", "Intro", "Welcome"),
+        ("a", "Chapter A", "A1"),
+    ]:
+        chapter = ChapterPage(title=title, live=True)
+        course.add_child(instance=chapter)
+        segment = SegmentPage(title=segment_title, live=True)
+        chapter.add_child(instance=segment)
+        pages[key] = chapter
+        pages[segment_title] = segment
+    return pages
+
+
+def _stored(course):
+    return CoursePage.objects.get(pk=course.pk)
+
+
+def test_first_segment_stored(course):
+    stored = _stored(course["course"])
+
+    assert stored.first_segment_id == course["Welcome"].id
+    assert stored.first_segment_url == "/entry-course/intro/welcome/"
+
+
+def test_get_url_reads_stored_value(course, django_assert_num_queries):
+    stored = _stored(course["course"])
+
+    with django_assert_num_queries(0):
+        assert stored.get_url() == "/entry-course/intro/welcome/"
+
+
+def test_unpublish_and_move_refresh(course):
+    course["Welcome"].unpublish()
+    assert _stored(course["course"]).first_segment_id == course["A1"].id
+
+    course["a"].move(course["intro"], pos="left")
+    SegmentPage.objects.get(pk=course["Welcome"].pk).save_revision().publish()
+    stored = _stored(course["course"])
+    assert stored.first_segment_id == course["A1"].id
+    assert stored.first_segment_url == "/entry-course/chapter-a/a1/"
+
+    SegmentPage.objects.get(pk=course["A1"].pk).delete()
+    assert _stored(course["course"]).first_segment_id == course["Welcome"].id
+
+
+def test_backfill_command_fills_missing_value(course):
+    CoursePage.objects.update(first_segment=None, first_segment_url="")
+
+    call_command("backfill_course_ancestry", verbosity=0)
+
+    assert _stored(course["course"]).first_segment_id == course["Welcome"].id
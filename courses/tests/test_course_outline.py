@@ -0,0 +1,171 @@
+"""
+Tests for the cached CourseOutline (courses/outline.py).
+
+Page tree used by the course fixture:
+
+    Root
+    └── Course
+        ├── Intro (is_intro)
+        │   └── Welcome
+        ├── Chapter A
+        │   ├── A1
+        │   └── A2 (quiz)
+        └── Chapter B
+            └── B1
+"""
+
+from datetime import timedelta
+
+import pytest
+from wagtail.models import Page
+
+from users.models import User
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    Quiz,
+)
+from courses.outline import _version_key, build_course_outline, get_course_outline
+from courses.views import _is_chapter_complete, _is_course_complete
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def course():
+    root = Page.get_first_root_node()
+
+    course = CoursePage(title="Outline Course", live=True)
+    root.add_child(instance=course)
+
+    pages = {"course": course}
+    for key, title, is_intro, segments in [
+        ("intro", "Intro", True, ["Welcome"]),
+        ("a", "Chapter A", False, ["A1", "A2"]),
+        ("b", "Chapter B", False, ["B1"]),
+    ]:
+        chapter = ChapterPage(title=title, is_intro=is_intro, live=True)
+        course.add_child(instance=chapter)
+        pages[key] = chapter
+        for seg_title in segments:
+            segment = SegmentPage(
+                title=seg_title, live=True, duration=timedelta(minutes=3)
+            )
+            chapter.add_child(instance=segment)
+            pages[seg_title] = segment
+
+    Quiz.objects.create(segment=pages["A2"], title="Check yourself")
+    return pages
+
+
+def test_outline_structure(course):
+    outline = build_course_outline(course["course"].id)
+
+    assert [ch.title for ch in outline.chapters] == ["Intro", "Chapter A", "Chapter B"]
+    assert [ch.number for ch in outline.chapters] == [None, 1, 2]
+    assert [s.title for s in outline.segments] == ["Welcome", "A1", "A2", "B1"]
+    assert [s.number for s in outline.chapter(course["a"].id).segments] == [1, 2]
+
+    a2 = outline.segment(course["A2"].id)
+    assert a2.chapter_id == course["a"].id
+    assert a2.quiz.title == "Check yourself"
+    assert a2.duration == timedelta(minutes=3)
+    assert outline.segment(course["A1"].id).quiz is None
+
+
+def test_zero_indexed_segment_numbers(course):
+    course["course"].zero_indexed_video_segments = True
+    course["course"].save()
+
+    outline = get_course_outline(course["course"].id)
+
+    assert [s.number for s in outline.chapter(course["a"].id).segments] == [0, 1]
+
+
+def test_outline_built_in_two_queries_then_cached(course, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        build_course_outline(course["course"].id)
+
+    get_course_outline(course["course"].id)
+    with django_assert_num_queries(0):
+        get_course_outline(course["course"].id)
+
+
+def test_unpublish_and_move_invalidate(course):
+    course_id = course["course"].id
+    get_course_outline(course_id)
+
+    course["A1"].unpublish()
+    assert [s.title for s in get_course_outline(course_id).segments] == [
+        "Welcome",
+        "A2",
+        "B1",
+    ]
+
+    course["b"].move(course["a"], pos="left")
+    assert [ch.title for ch in get_course_outline(course_id).chapters] == [
+        "Intro",
+        "Chapter B",
+        "Chapter A",
+    ]
+
+    SegmentPage.objects.get(id=course["B1"].id).delete()
+    outline = get_course_outline(course_id)
+    assert outline.chapter(course["b"].id).segments == ()
+
+
+def test_evicted_version_does_not_revive_old_outline(course):
+    """An outline cached before a bump stays stale when the course's version
+    key is evicted."""
+    from django.core.cache import cache
+
+    course_id = course["course"].id
+    get_course_outline(course_id)
+    course["A1"].unpublish()
+    get_course_outline(course_id)
+
+    cache.delete(_version_key(course_id))
+    assert "A1" not in [s.title for s in get_course_outline(course_id).segments]
+
+
+def test_adjacent_segments_cross_chapters(course):
+    a1 = SegmentPage.objects.get(id=course["A1"].id)
+    b1 = SegmentPage.objects.get(id=course["B1"].id)
+
+    assert a1.get_previous_segment().title == "Welcome"
+    assert a1.get_next_segment().title == "A2"
+    assert b1.get_previous_segment().title == "A2"
+    assert b1.get_next_segment() is None
+
+
+def test_display_numbers_on_pages(course, django_assert_num_queries):
+    a2 = SegmentPage.objects.get(id=course["A2"].id)
+    welcome = SegmentPage.objects.get(id=course["Welcome"].id)
+    get_course_outline(course["course"].id)
+
+    with django_assert_num_queries(0):
+        assert (a2.chapter_number, a2.number) == (1, 2)
+        assert (welcome.chapter_number, welcome.number) == (None, 1)
+
+    chapter_b = ChapterPage.objects.get(id=course["b"].id)
+    assert chapter_b.number == 2
+    assert [s.number for s in chapter_b.outline_entry.segments] == [1]
+
+    course["course"].zero_indexed_video_segments = True
+    course["course"].save()
+    assert SegmentPage.objects.get(id=course["A2"].id).number == 1
+
+
+def test_completion_helpers_read_outline(course):
+    user = User.objects.create_user(email="outline@example.com", password=None)
+    for title in ("A1", "A2", "B1"):
+        SegmentProgress.objects.create(
+            user=user, segment=course[title], percent_watched=100
+        )
+
+    assert _is_chapter_complete(user, course["a"]) is True
+    assert _is_chapter_complete(user, course["intro"]) is False
+    # Intro chapters don't count towards the course
+    assert _is_course_complete(user, course["course"]) is True
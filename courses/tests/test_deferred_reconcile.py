@@ -0,0 +1,145 @@
+"""
+Tests for deferred completion reconciliation (PROGRESS_RECONCILE_MODE =
+"deferred").
+
+Completions are queued as PendingCompletion rows instead of being
+reconciled in the heartbeat request. on_commit callbacks don't run inside
+test transactions, so the tests drain the queue explicitly.
+"""
+
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    ChapterProgress,
+    CourseProgress,
+    ChapterCompletionCounter,
+    PendingCompletion,
+)
+from courses.progress import process_pending_completions, record_segment_progress
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.usefixtures("deferred"),
+]
+
+
+@pytest.fixture
+def deferred():
+    with override_settings(PROGRESS_RECONCILE_MODE="deferred"):
+        yield
+
+
+@pytest.fixture
+def course_structure():
+    root = Page.get_first_root_node()
+
+    course = CoursePage(title="Deferred Course", live=True)
+    root.add_child(instance=course)
+
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+
+    segments = []
+    for i in range(2):
+        segment = SegmentPage(title=f"Segment {i}", live=True)
+        chapter.add_child(instance=segment)
+        segments.append(segment)
+
+    return course, chapter, segments
+
+
+@pytest.fixture
+def auth_client(client, django_user_model):
+    user = django_user_model.objects.create_user(
+        email="deferred@example.com",
+        password="pass",
+    )
+    client.force_login(user)
+    return client, user
+
+
+def post_progress(client, segment, percent, **extra):
+    return client.post(
+        reverse("update_progress"),
+        data=json.dumps(
+            {"segment_id": segment.id, "percent_watched": percent, **extra}
+        ),
+        content_type="application/json",
+    )
+
+
+def test_completion_is_queued_not_reconciled(auth_client, course_structure):
+    client, user = auth_client
+    _course, chapter, segments = course_structure
+
+    for segment in segments:
+        data = post_progress(client, segment, 100).json()
+
+    assert data["completion_pending"] is True
+    assert data["chapter_completed"] is False
+    assert PendingCompletion.objects.filter(user=user).count() == 2
+    assert not ChapterCompletionCounter.objects.filter(user=user).exists()
+
+    assert process_pending_completions() == 2
+
+    assert not PendingCompletion.objects.exists()
+    assert ChapterProgress.objects.get(user=user, chapter=chapter).completed is True
+
+
+def test_repeated_completion_is_queued_once(auth_client, course_structure):
+    client, user = auth_client
+    _course, chapter, segments = course_structure
+    record_segment_progress(user, segments[0].id, 100)
+
+    # Re-sending 100% doesn't re-queue, and the ORM path shares the queue
+    post_progress(client, segments[0], 100)
+    record_segment_progress(user, segments[0].id, 100)
+
+    assert PendingCompletion.objects.filter(user=user).count() == 1
+
+    process_pending_completions()
+
+    assert ChapterCompletionCounter.objects.get(
+        user=user, chapter=chapter
+    ).completed_segments == 1
+
+
+def test_sync_read_drains_users_queue(auth_client, course_structure, django_user_model):
+    client, user = auth_client
+    course, _chapter, segments = course_structure
+    other = django_user_model.objects.create_user(email="other@example.com")
+    record_segment_progress(other, segments[0].id, 100)
+
+    post_progress(client, segments[0], 100)
+    data = post_progress(client, segments[1], 100, sync=True).json()
+
+    assert "completion_pending" not in data
+    assert data["chapter_completed"] is True
+    assert data["course_completed"] is True
+    assert CourseProgress.objects.get(user=user, course=course).completed is True
+
+    # Other users' completions stay queued for the worker
+    assert list(PendingCompletion.objects.values_list("user_id", flat=True)) == [
+        other.id
+    ]
+
+
+def test_command_drains_queue(auth_client, course_structure):
+    _client, user = auth_client
+    _course, chapter, segments = course_structure
+    for segment in segments:
+        record_segment_progress(user, segment.id, 100)
+
+    call_command("reconcile_pending_progress", batch_size=1)
+
+    assert not PendingCompletion.objects.exists()
+    assert ChapterProgress.objects.get(user=user, chapter=chapter).completed is True
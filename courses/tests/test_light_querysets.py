@@ -0,0 +1,84 @@
+"""
+Tests for the light page querysets (courses/querysets.py): which columns
+list queries load.
+"""
+
+import pytest
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import ChapterPage, CoursePage, SegmentPage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def segment():
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Light Course", live=True)
+    root.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(
+        title="Segment", live=True, transcript=[{"start": 0, "text": "Hello"}]
+    )
+    chapter.add_child(instance=segment)
+    return segment
+
+
+def _loaded_columns(queryset, table):
+    with CaptureQueriesContext(connection) as queries:
+        list(queryset)
+    sql = " ".join(q["sql"] for q in queries.captured_queries)
+    return {
+        column
+        for column in ("transcript", "content", "title", "video_url")
+        if f'"{table}"."{column}"' in sql
+    }
+
+
+def test_light_defers_heavy_fields(segment):
+    assert _loaded_columns(SegmentPage.objects.all(), "courses_segmentpage") == {
+        "transcript",
+        "content",
+        "video_url",
+    }
+    assert _loaded_columns(SegmentPage.objects.live().light(), "courses_segmentpage") == {
+        "video_url"
+    }
+    assert _loaded_columns(
+        SegmentPage.objects.light("transcript"), "courses_segmentpage"
+    ) == {"transcript", "video_url"}
+    assert _loaded_columns(CoursePage.objects.light(), "courses_coursepage") == set()
+    assert _loaded_columns(ChapterPage.objects.light(), "courses_chapterpage") == set()
+
+
+def test_light_instances_load_deferred_on_access(segment):
+    light = SegmentPage.objects.light().get(pk=segment.pk)
+
+    assert light.get_deferred_fields() == {"transcript", "content"}
+    assert light.transcript == [{"start": 0, "text": "Hello"}]
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+)
+def test_segment_admin_list_skips_transcript(admin_client, segment):
+    url = reverse("admin:courses_segmentpage_changelist")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = admin_client.get(url)
+
+    assert response.status_code == 200
+    listing = [q["sql"] for q in queries.captured_queries if "courses_segmentpage" in q["sql"]]
+    assert listing
+    assert not any('"courses_segmentpage"."transcript",' in sql for sql in listing)
+    assert response.context["cl"].result_list[0].transcript_present is True
@@ -0,0 +1,61 @@
+"""
+Tests for bulk page URL resolution (courses/page_urls.py).
+"""
+
+import pytest
+from wagtail.models import Page, Site
+
+from courses.models import ChapterPage, CoursePage, SegmentPage
+from courses.outline import build_course_outline
+from courses.page_urls import page_urls
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def pages():
+    home = Site.objects.get(is_default_site=True).root_page
+    course = CoursePage(title="URL Course", live=True)
+    home.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segments = []
+    for title in ["One", "Two", "Three"]:
+        segment = SegmentPage(title=title, live=True)
+        chapter.add_child(instance=segment)
+        segments.append(segment)
+
+    # Outside every site: not routable
+    orphan = CoursePage(title="Orphan", live=True)
+    Page.get_first_root_node().add_child(instance=orphan)
+    return [home, chapter, *segments, orphan]
+
+
+def test_matches_get_url(pages, django_assert_num_queries):
+    Site.get_site_root_paths()  # warm Wagtail's cache of site roots
+
+    with django_assert_num_queries(0):
+        urls = page_urls(page.url_path for page in pages)
+
+    assert urls == [Page.objects.get(pk=page.pk).get_url() for page in pages]
+    assert urls[0] == "/"
+    assert urls[-1] is None
+
+
+def test_without_trailing_slash(pages, monkeypatch):
+    monkeypatch.setattr("courses.page_urls.WAGTAIL_APPEND_SLASH", False)
+
+    urls = page_urls(page.url_path for page in pages)
+
+    assert urls[0] == "/"
+    assert urls[1] == "/url-course/chapter"
+
+
+def test_outline_urls(pages):
+    outline = build_course_outline(CoursePage.objects.get(title="URL Course").id)
+
+    assert [s.url for s in outline.segments] == [
+        "/url-course/chapter/one/",
+        "/url-course/chapter/two/",
+        "/url-course/chapter/three/",
+    ]
@@ -0,0 +1,120 @@
+"""
+Tests for the async progress endpoint (/api/progress/update/async/).
+
+It must behave exactly like update_progress; these tests cover the
+async-specific store paths (conditional UPDATE, get-or-create fallback)
+and concurrent heartbeats for the same segment.
+"""
+
+import asyncio
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    ChapterProgress,
+    ChapterCompletionCounter,
+)
+from courses.progress import arecord_segment_progress
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def course_structure():
+    root = Page.get_first_root_node()
+
+    course = CoursePage(title="Async Course", live=True)
+    root.add_child(instance=course)
+
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+
+    return chapter, segment
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        email="async@example.com",
+        password="pass",
+    )
+
+
+@pytest.fixture
+def client(async_client, user):
+    async_to_sync(async_client.aforce_login)(user)
+    return async_client
+
+
+def post_progress(client, segment, percent):
+    return client.post(
+        reverse("update_progress_async"),
+        data=json.dumps({"segment_id": segment.id, "percent_watched": percent}),
+        content_type="application/json",
+    )
+
+
+def test_async_progress_never_decreases(client, user, course_structure):
+    _chapter, segment = course_structure
+
+    async def heartbeats():
+        first = await post_progress(client, segment, 40)
+        await post_progress(client, segment, 70)
+        await post_progress(client, segment, 50)
+        return first
+
+    resp = async_to_sync(heartbeats)()
+
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "segment_id": segment.id,
+        "saved": True,
+        "percent_watched": 40,
+        "chapter_completed": False,
+        "course_completed": False,
+    }
+    assert SegmentProgress.objects.get(user=user, segment=segment).percent_watched == 70
+
+
+def test_async_completion_reconciles_chapter(client, user, course_structure):
+    chapter, segment = course_structure
+
+    async def heartbeats():
+        await post_progress(client, segment, 50)
+        return await post_progress(client, segment, 100)
+
+    data = async_to_sync(heartbeats)().json()
+
+    assert data["chapter_completed"] is True
+    assert ChapterProgress.objects.get(user=user, chapter=chapter).completed is True
+
+
+def test_concurrent_completions_counted_once(client, user, course_structure):
+    chapter, segment = course_structure
+
+    async def burst():
+        await asyncio.gather(*(post_progress(client, segment, 100) for _ in range(5)))
+
+    async_to_sync(burst)()
+
+    assert ChapterCompletionCounter.objects.get(
+        user=user, chapter=chapter
+    ).completed_segments == 1
+
+
+def test_async_unknown_segment_is_not_stored(user):
+    write = async_to_sync(arecord_segment_progress)(user, 999999, 50)
+
+    assert write.found is False
+    assert not SegmentProgress.objects.filter(user=user).exists()
@@ -0,0 +1,199 @@
+"""
+Tests for the batched progress endpoint (/api/progress/update/batch/).
+
+Page tree used by the course_tree fixture:
+
+    Root
+    └── Course
+        ├── Chapter 1
+        │   ├── Segment 1-1
+        │   └── Segment 1-2
+        └── Chapter 2
+            ├── Segment 2-1
+            └── Segment 2-2
+"""
+
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    ChapterProgress,
+    CourseProgress,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope="module")
+def course_tree(django_db_blocker):
+    with django_db_blocker.unblock():
+        root = Page.get_first_root_node()
+
+        course = CoursePage(title="Batch Test Course", live=True)
+        root.add_child(instance=course)
+
+        chapters = []
+        segments = []
+        for c in range(1, 3):
+            chapter = ChapterPage(title=f"Chapter {c}", live=True)
+            course.add_child(instance=chapter)
+            chapters.append(chapter)
+            for s in range(1, 3):
+                seg = SegmentPage(title=f"Segment {c}-{s}", live=True)
+                chapter.add_child(instance=seg)
+                segments.append(seg)
+
+    yield {
+        "course": course.specific,
+        "chapters": [c.specific for c in chapters],
+        "segments": [s.specific for s in segments],
+    }
+
+    with django_db_blocker.unblock():
+        course.delete()
+
+
+@pytest.fixture
+def auth_client(client, django_user_model):
+    user = django_user_model.objects.create_user(
+        email="batch@example.com",
+        password="pass",
+    )
+    client.force_login(user)
+    return client, user
+
+
+def post_batch(client, entries):
+    return client.post(
+        reverse("update_progress_batch"),
+        data=json.dumps({"entries": entries}),
+        content_type="application/json",
+    )
+
+
+def entry(segment, percent):
+    return {"segment_id": segment.id, "percent_watched": percent}
+
+
+# ---------------------------------------------------------------------------
+# Tests
+# ---------------------------------------------------------------------------
+
+def test_batch_saves_every_segment(auth_client, course_tree):
+    client, user = auth_client
+    segs = course_tree["segments"]
+
+    resp = post_batch(client, [entry(segs[0], 30), entry(segs[1], 60)])
+    data = resp.json()
+
+    assert resp.status_code == 200
+    assert data["saved"] is True
+    assert {s["segment_id"]: s["percent_watched"] for s in data["segments"]} == {
+        segs[0].id: 30,
+        segs[1].id: 60,
+    }
+    assert SegmentProgress.objects.get(user=user, segment=segs[1]).percent_watched == 60
+
+
+def test_batch_reports_chapter_and_course_completion(auth_client, course_tree):
+    client, user = auth_client
+    segs = course_tree["segments"]
+    ch1, ch2 = course_tree["chapters"]
+    course = course_tree["course"]
+
+    data = post_batch(client, [entry(segs[0], 100), entry(segs[1], 100)]).json()
+
+    assert data["chapters"] == [{"chapter_id": ch1.id, "completed": True}]
+    assert data["courses"] == [{"course_id": course.id, "completed": False}]
+    assert ChapterProgress.objects.get(user=user, chapter=ch1).completed is True
+
+    data = post_batch(client, [entry(segs[2], 100), entry(segs[3], 100)]).json()
+
+    assert data["chapters"] == [{"chapter_id": ch2.id, "completed": True}]
+    assert data["courses"] == [{"course_id": course.id, "completed": True}]
+    assert CourseProgress.objects.get(user=user, course=course).completed is True
+
+
+def test_batch_does_not_lower_completed_segment(auth_client, course_tree):
+    client, user = auth_client
+    seg = course_tree["segments"][0]
+
+    post_batch(client, [entry(seg, 100)])
+    data = post_batch(client, [entry(seg, 20)]).json()
+
+    assert data["segments"][0]["percent_watched"] == 100
+    assert SegmentProgress.objects.get(user=user, segment=seg).percent_watched == 100
+
+
+def test_batch_out_of_order_values_never_lower_progress(auth_client, course_tree):
+    """A late batch carrying older heartbeats must not undo newer ones."""
+    client, user = auth_client
+    first, second = course_tree["segments"][:2]
+
+    post_batch(client, [entry(first, 70), entry(second, 40)])
+    data = post_batch(client, [entry(first, 30), entry(second, 55)]).json()
+
+    assert {s["segment_id"]: s["percent_watched"] for s in data["segments"]} == {
+        first.id: 70,
+        second.id: 55,
+    }
+    assert SegmentProgress.objects.get(user=user, segment=first).percent_watched == 70
+    assert SegmentProgress.objects.get(user=user, segment=second).percent_watched == 55
+
+
+def test_batch_query_count_independent_of_size(auth_client, course_tree):
+    client, _user = auth_client
+    segs = course_tree["segments"]
+
+    # Create the rows (and warm up the session/user lookups) so both
+    # measured batches are pure updates
+    post_batch(client, [entry(seg, 10) for seg in segs])
+
+    with CaptureQueriesContext(connection) as one:
+        post_batch(client, [entry(segs[0], 20)])
+    with CaptureQueriesContext(connection) as many:
+        post_batch(client, [entry(seg, 30) for seg in segs])
+
+    assert len(many) == len(one)
+
+
+def test_batch_skips_unknown_segments(auth_client, course_tree):
+    client, _user = auth_client
+    seg = course_tree["segments"][0]
+
+    data = post_batch(
+        client, [entry(seg, 50), {"segment_id": 999999, "percent_watched": 50}]
+    ).json()
+
+    saved = {s["segment_id"]: s["saved"] for s in data["segments"]}
+    assert saved == {seg.id: True, 999999: False}
+
+
+def test_batch_rejects_malformed_payload(auth_client):
+    client, _user = auth_client
+
+    assert post_batch(client, []).status_code == 400
+    assert post_batch(client, [{"segment_id": 1}]).status_code == 400
+    assert post_batch(client, [{"segment_id": "x", "percent_watched": 5}]).status_code == 400
+
+
+def test_batch_anonymous_not_saved(client, course_tree):
+    seg = course_tree["segments"][0]
+
+    data = post_batch(client, [entry(seg, 100)]).json()
+
+    assert data["saved"] is False
+    assert not SegmentProgress.objects.filter(segment=seg).exists()
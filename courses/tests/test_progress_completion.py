@@ -200,3 +200,44 @@ def test_percent_watched_locked_at_100(auth_client, course_structure):
     post_progress(client, seg1, 0)
     sp.refresh_from_db()
     assert sp.percent_watched == 100
+
+
+def test_partial_progress_never_decreases(auth_client, course_structure):
+    """Below 100% the stored value is the highest one reported so far."""
+    client, user = auth_client
+    _course, _chapter, seg1, _seg2 = course_structure
+
+    post_progress(client, seg1, 60)
+    post_progress(client, seg1, 30)
+
+    sp = SegmentProgress.objects.get(user=user, segment=seg1)
+    assert sp.percent_watched == 60
+
+
+def test_partial_heartbeat_is_single_query(
+    auth_client, course_structure, django_assert_num_queries
+):
+    """A heartbeat that raises a partial value is a single statement."""
+    from courses.progress import record_segment_progress
+
+    _client, user = auth_client
+    _course, _chapter, seg1, _seg2 = course_structure
+
+    record_segment_progress(user, seg1.id, 10)
+
+    with django_assert_num_queries(1):
+        write = record_segment_progress(user, seg1.id, 20)
+
+    assert write.written is True
+    assert write.completed is False
+
+
+def test_unknown_segment_is_not_stored(auth_client):
+    from courses.progress import record_segment_progress
+
+    _client, user = auth_client
+
+    write = record_segment_progress(user, 999999, 50)
+
+    assert write.found is False
+    assert not SegmentProgress.objects.filter(segment_id=999999).exists()
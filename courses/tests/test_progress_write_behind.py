@@ -0,0 +1,182 @@
+"""
+Tests for write-behind progress mode (PROGRESS_WRITE_BEHIND).
+
+Sub-100% heartbeats are buffered in memory and only reach the database when
+the buffer is flushed; a 100% heartbeat is still written (and reconciled)
+synchronously.
+"""
+
+import json
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+from wagtail.models import Page
+
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    ChapterProgress,
+)
+from courses.progress import progress_buffer
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.usefixtures("write_behind"),
+]
+
+
+@pytest.fixture
+def write_behind():
+    # Interval 0: no background flusher, the tests flush explicitly.
+    # Plain static storage so 404 pages render without a manifest.
+    with override_settings(
+        PROGRESS_WRITE_BEHIND=True,
+        PROGRESS_WRITE_BEHIND_INTERVAL=0,
+        STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        },
+    ):
+        yield
+    progress_buffer.flush()
+
+
+@pytest.fixture
+def course_structure():
+    root = Page.get_first_root_node()
+
+    course = CoursePage(title="Write Behind Course", live=True)
+    root.add_child(instance=course)
+
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+
+    return chapter, segment
+
+
+@pytest.fixture
+def auth_client(client, django_user_model):
+    user = django_user_model.objects.create_user(
+        email="writebehind@example.com",
+        password="pass",
+    )
+    client.force_login(user)
+    return client, user
+
+
+def post_progress(client, segment, percent, view="update_progress"):
+    segment_id = segment if isinstance(segment, int) else segment.id
+    return client.post(
+        reverse(view),
+        data=json.dumps({"segment_id": segment_id, "percent_watched": percent}),
+        content_type="application/json",
+    )
+
+
+def test_partial_heartbeats_are_buffered(auth_client, course_structure):
+    client, user = auth_client
+    _chapter, segment = course_structure
+
+    data = post_progress(client, segment, 30).json()
+    post_progress(client, segment, 60)
+    post_progress(client, segment, 40)
+
+    assert data["saved"] is True
+    assert data["buffered"] is True
+    assert not SegmentProgress.objects.filter(user=user, segment=segment).exists()
+
+    assert progress_buffer.flush() == 1
+
+    # Only the highest buffered value is written
+    sp = SegmentProgress.objects.get(user=user, segment=segment)
+    assert sp.percent_watched == 60
+
+
+def test_completion_is_written_synchronously(auth_client, course_structure):
+    client, user = auth_client
+    chapter, segment = course_structure
+
+    post_progress(client, segment, 50)
+    data = post_progress(client, segment, 100).json()
+
+    assert "buffered" not in data
+    assert data["chapter_completed"] is True
+    assert ChapterProgress.objects.get(user=user, chapter=chapter).completed is True
+
+    # The superseded 50% was dropped and can't lower the stored value
+    assert progress_buffer.flush() == 0
+    assert SegmentProgress.objects.get(user=user, segment=segment).percent_watched == 100
+
+
+def test_flush_never_lowers_stored_value(auth_client, course_structure):
+    client, user = auth_client
+    _chapter, segment = course_structure
+    SegmentProgress.objects.create(user=user, segment=segment, percent_watched=80)
+
+    post_progress(client, segment, 20)
+    progress_buffer.flush()
+
+    assert SegmentProgress.objects.get(user=user, segment=segment).percent_watched == 80
+
+
+def test_flush_writes_each_user_in_one_statement(auth_client, course_structure):
+    """The flush goes through the same upsert as a direct write: one query
+    per user, raising the stored value and leaving completed rows alone."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from courses.progress import flush_buffered_progress
+
+    _client, user = auth_client
+    chapter, segment = course_structure
+    done = SegmentPage(title="Done", live=True)
+    chapter.add_child(instance=done)
+    fresh = SegmentPage(title="Fresh", live=True)
+    chapter.add_child(instance=fresh)
+    SegmentProgress.objects.create(user=user, segment=segment, percent_watched=30)
+    SegmentProgress.objects.create(user=user, segment=done, percent_watched=100)
+
+    with CaptureQueriesContext(connection) as queries:
+        flush_buffered_progress(
+            {(user.pk, segment.id): 60, (user.pk, done.id): 50, (user.pk, fresh.id): 10}
+        )
+
+    writes = [q for q in queries if "INSERT" in q["sql"]]
+    assert len(writes) == 1
+    assert dict(
+        SegmentProgress.objects.filter(user=user).values_list(
+            "segment_id", "percent_watched"
+        )
+    ) == {segment.id: 60, done.id: 100, fresh.id: 10}
+
+
+def test_flush_drops_unknown_segments(auth_client):
+    client, user = auth_client
+
+    post_progress(client, 999999, 10)
+    progress_buffer.flush()
+
+    assert not SegmentProgress.objects.filter(user=user).exists()
+
+
+@pytest.mark.parametrize("view", ["update_progress", "update_progress_async"])
+def test_unknown_and_unpublished_segments_are_not_buffered(
+    auth_client, course_structure, view
+):
+    client, _user = auth_client
+    _chapter, segment = course_structure
+
+    assert post_progress(client, segment, 10, view).status_code == 200
+    assert post_progress(client, 999999, 10, view).status_code == 404
+
+    segment.unpublish()
+    assert post_progress(client, segment, 20, view).status_code == 404
+    assert progress_buffer.flush() == 1
@@ -0,0 +1,107 @@
+"""
+Tests for the route cache (courses/routing.py).
+
+Page tree used by the fixture (under the default site's root page):
+
+    Home
+    └── Course
+        └── Chapter A
+            └── A1
+"""
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from wagtail.models import Site
+
+from courses.models import ChapterPage, CoursePage, SegmentPage
+
+pytestmark = [
+    pytest.mark.django_db,
+    pytest.mark.usefixtures("static_storage"),
+]
+
+
+@pytest.fixture
+def static_storage():
+    with override_settings(
+        STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+        }
+    ):
+        yield
+
+
+@pytest.fixture
+def course():
+    cache.clear()
+    home = Site.objects.get(is_default_site=True).root_page
+    course = CoursePage(title="Routed Course", live=True)
+    home.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter A", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(title="A1", live=True)
+    chapter.add_child(instance=segment)
+    return {"course": course, "a": chapter, "A1": segment}
+
+
+def _get(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    return response, len(queries)
+
+
+def test_cached_route_skips_tree_walk(client, course):
+    url = course["A1"].url
+
+    first, first_queries = _get(client, url)
+    second, second_queries = _get(client, url)
+
+    assert first.status_code == second.status_code == 200
+    assert second.content == first.content
+    # Site, root page and two queries for each of the four levels
+    assert second_queries <= first_queries - 8
+
+
+def test_rename_and_unpublish_drop_routes(client, course):
+    url = course["A1"].url
+    client.get(url)
+
+    chapter = ChapterPage.objects.get(pk=course["a"].pk)
+    chapter.title = "Chapter B"
+    chapter.save_revision().publish()
+
+    assert client.get(url).status_code == 404
+    new_url = SegmentPage.objects.get(pk=course["A1"].pk).url
+    assert client.get(new_url).status_code == 200
+    assert client.get(new_url).status_code == 200
+
+    SegmentPage.objects.get(pk=course["A1"].pk).unpublish()
+    assert client.get(new_url).status_code == 404
+
+
+def test_stale_entry_not_served(client, course):
+    """A cached route whose page moved is re-routed even without a version bump."""
+    url = course["A1"].url
+    client.get(url)
+
+    SegmentPage.objects.filter(pk=course["A1"].pk).update(live=False)
+
+    assert client.get(url).status_code == 404
+
+
+def test_only_page_deletes_drop_routes(course, django_user_model):
+    from courses.routing import VERSION_KEY
+    from ova.cache_versions import current_version
+
+    version = current_version(VERSION_KEY)
+    django_user_model.objects.create_user("routes", password="x").delete()
+    assert current_version(VERSION_KEY) == version
+
+    course["course"].delete()
+    assert current_version(VERSION_KEY) > version
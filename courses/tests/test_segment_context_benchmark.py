@@ -0,0 +1,102 @@
+"""
+Regression benchmark for SegmentPage.get_context on a large course.
+
+A synthetic 40-chapter × 20-segment course is built once. The context for a
+segment in the middle of it must cost the same number of queries as on a
+two-segment course: nothing in it may scale with the number of chapters or
+segments.
+"""
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from wagtail.models import Page
+
+from users.models import User
+from courses.models import CoursePage, ChapterPage, SegmentPage, SegmentProgress, Quiz
+
+pytestmark = pytest.mark.django_db
+
+CHAPTERS = 40
+SEGMENTS_PER_CHAPTER = 20
+
+
+def _build_course(title, chapters, segments_per_chapter):
+    root = Page.get_first_root_node()
+    course = CoursePage(title=title, live=True)
+    root.add_child(instance=course)
+
+    segments = []
+    for c in range(chapters):
+        chapter = ChapterPage(title=f"Chapter {c}", is_intro=(c == 0), live=True)
+        course.add_child(instance=chapter)
+        for s in range(segments_per_chapter):
+            segment = SegmentPage(title=f"Segment {c}.{s}", live=True)
+            chapter.add_child(instance=segment)
+            segments.append(segment)
+    return course, segments
+
+
+def _context(user, segment):
+    request = RequestFactory().get("/fake-path/")
+    request.user = user
+    return segment.get_context(request)
+
+
+def _query_count(user, segment):
+    with CaptureQueriesContext(connection) as queries:
+        _context(user, segment)
+    return len(queries)
+
+
+@pytest.fixture
+def courses():
+    small = _build_course("Small Course", 2, 1)
+    large = _build_course("Large Course", CHAPTERS, SEGMENTS_PER_CHAPTER)
+    return small, large
+
+
+@pytest.fixture
+def user(courses):
+    user = User.objects.create_user(email="bench@example.com", password="pass")
+    (_, small_segments), (_, large_segments) = courses
+    SegmentProgress.objects.bulk_create(
+        SegmentProgress(user=user, segment=segment, percent_watched=100)
+        for segment in (*small_segments, *large_segments[: len(large_segments) // 2])
+    )
+    Quiz.objects.create(segment=large_segments[-1], title="Final quiz")
+    return user
+
+
+def test_large_course_context(courses, user):
+    """Building 800 pages is slow, so one test covers queries and content.
+    Query counts rather than timings, so a slow machine can't fail it."""
+    (_, small_segments), (_, large_segments) = courses
+    small_segment = small_segments[-1]
+    segment = large_segments[len(large_segments) // 2]
+
+    cache.clear()
+    for viewer in (user, AnonymousUser()):
+        # Warm the outlines so both counts measure the cached path
+        _context(viewer, small_segment)
+        _context(viewer, segment)
+        assert _query_count(viewer, segment) == _query_count(viewer, small_segment)
+
+    ctx = _context(user, segment)
+
+    rows = ctx["chapter_data"]
+    assert len(rows) == CHAPTERS
+    assert sum(len(row["segments"]) for row in rows) == CHAPTERS * SEGMENTS_PER_CHAPTER
+    assert rows[0]["is_intro"] and rows[0]["chapter_number"] is None
+    assert rows[-1]["chapter_number"] == CHAPTERS - 1
+    assert rows[-1]["segments"][-1]["quiz"].title == "Final quiz"
+
+    # Half the segments are complete, the first (intro) chapter is excluded
+    counted = (CHAPTERS - 1) * SEGMENTS_PER_CHAPTER
+    done = CHAPTERS * SEGMENTS_PER_CHAPTER // 2 - SEGMENTS_PER_CHAPTER
+    assert ctx["course_percent_complete"] == int(done / counted * 100)
+    assert ctx["segment_progress"] == 0
+    assert ctx["segment_number"] == 1
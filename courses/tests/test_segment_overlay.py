@@ -0,0 +1,216 @@
+"""
+Tests for the two-layer segment page: the cached shell fragments and the
+per-user overlay (courses/overlay.py).
+
+Page tree used by the course fixture:
+
+    Root
+    └── Course
+        └── Chapter A
+            ├── A1
+            └── A2 (quiz)
+"""
+
+import re
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.template import Context, Template
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.models import Page
+
+from users.models import User
+from courses.models import (
+    CoursePage,
+    ChapterPage,
+    SegmentPage,
+    SegmentProgress,
+    Quiz,
+    QuizProgress,
+)
+from courses.outline import get_course_outline
+from courses.overlay import segment_overlay, shell_key
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def course():
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Overlay Course", live=True)
+    root.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter A", live=True)
+    course.add_child(instance=chapter)
+
+    pages = {"course": course, "a": chapter}
+    for title in ["A1", "A2"]:
+        segment = SegmentPage(title=title, live=True)
+        chapter.add_child(instance=segment)
+        pages[title] = segment
+    pages["quiz"] = Quiz.objects.create(segment=pages["A2"], title="Check")
+    return pages
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(email="overlay@example.com", password="pass")
+
+
+def test_overlay_queries(course, user, django_assert_num_queries):
+    SegmentProgress.objects.create(user=user, segment=course["A1"], percent_watched=100)
+    QuizProgress.objects.create(
+        user=user,
+        quiz=course["quiz"],
+        score=50,
+        answers_snapshot={"answers": {"7": 3}, "results": {"7": False}},
+    )
+    outline = get_course_outline(course["course"].id)
+
+    with django_assert_num_queries(1):
+        overlay = segment_overlay(user, course["A1"], outline)
+    assert overlay["segment_progress"] == 100
+    assert overlay["course_percent_complete"] == 50
+    assert overlay["completed_chapters"] == []
+    assert overlay["quiz"] is None
+
+    with django_assert_num_queries(2):
+        overlay = segment_overlay(user, course["A2"], outline)
+    assert overlay["segment_progress"] == 0
+    assert overlay["quiz"] == {
+        "id": course["quiz"].id,
+        "score": 50,
+        "answers": {"7": 3},
+        "results": {"7": False},
+    }
+
+
+def test_overlay_endpoint(client, course, user):
+    url = reverse("segment_overlay", args=[course["A1"].id])
+
+    assert client.get(url).json() == {
+        "segment_id": course["A1"].id,
+        "authenticated": False,
+    }
+
+    SegmentProgress.objects.create(user=user, segment=course["A1"], percent_watched=100)
+    SegmentProgress.objects.create(user=user, segment=course["A2"], percent_watched=100)
+    client.force_login(user)
+    data = client.get(url).json()
+
+    assert data["authenticated"] is True
+    assert data["course_percent_complete"] == 100
+    assert data["completed_chapters"] == [course["a"].id]
+    assert data["segments"] == {str(course["A1"].id): 100, str(course["A2"].id): 100}
+
+
+def test_get_context_merges_overlay(course, user, rf):
+    QuizProgress.objects.create(
+        user=user,
+        quiz=course["quiz"],
+        score=100,
+        answers_snapshot={"answers": {"7": 3}, "results": {"7": True}},
+    )
+    request = rf.get("/")
+    request.user = user
+    ctx = SegmentPage.objects.get(pk=course["A2"].pk).get_context(request)
+
+    assert ctx["submitted"] is True
+    assert ctx["score"] == 100
+    assert ctx["answers"] == {7: 3}
+    assert ctx["shell_key"].startswith("courses:segment-shell:")
+
+
+@override_settings(SEGMENT_SHELL_TIMEOUT=60)
+def test_shell_fragments_cached_per_key(course):
+    cache.clear()
+    template = Template(
+        '{% load segment_shell %}{% shell_fragment "t" %}{{ value }}{% endshell_fragment %}'
+    )
+    key = shell_key(course["A1"], get_course_outline(course["course"].id))
+
+    assert template.render(Context({"shell_key": key, "value": "one"})) == "one"
+    assert template.render(Context({"shell_key": key, "value": "two"})) == "one"
+    # No key (e.g. a CoursePage render): never cached
+    assert template.render(Context({"value": "two"})) == "two"
+
+    # A structure change moves the segment to a new key
+    course["A2"].unpublish()
+    new_key = shell_key(course["A1"], get_course_outline(course["course"].id))
+    assert new_key != key
+    assert template.render(Context({"shell_key": new_key, "value": "two"})) == "two"
+
+
+def _without_csrf(html):
+    return re.sub(rb'name="csrfmiddlewaretoken" value="[^"]*"', b"", html)
+
+
+@override_settings(
+    SEGMENT_SHELL_TIMEOUT=60,
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+)
+def test_warm_signed_in_render(course, user, rf):
+    """Once the outline and shell are cached, a signed-in view costs the
+    course and chapter rows plus one progress query."""
+    cache.clear()
+
+    def render():
+        request = rf.get("/")
+        request.user = user
+        request.session = {}
+        page = SegmentPage.objects.get(pk=course["A1"].pk)
+        with CaptureQueriesContext(connection) as queries:
+            response = page.serve(request)
+        return response, len(queries)
+
+    cold, cold_queries = render()
+    warm, warm_queries = render()
+
+    assert warm.status_code == 200
+    # Same page apart from the (per-render) CSRF token
+    assert _without_csrf(warm.content) == _without_csrf(cold.content)
+    assert warm_queries == 3 < cold_queries
+
+
+@override_settings(
+    SEGMENT_SHELL_TIMEOUT=60,
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+)
+def test_preview_does_not_fill_the_live_shell(course, rf):
+    """A preview of an unsaved draft must not be cached under the live
+    page's shell key."""
+    cache.clear()
+    editor = User.objects.create_superuser(email="editor@example.com", password="pass")
+
+    # Set directly so saving doesn't fetch metadata from Vimeo
+    SegmentPage.objects.filter(pk=course["A1"].pk).update(video_url="https://vimeo.com/1")
+    live = SegmentPage.objects.get(pk=course["A1"].pk)
+    live.transcript = [[{"timestamp": 0, "text": "PUBLISHED-TEXT"}]]
+    live.save_revision().publish()
+
+    draft = SegmentPage.objects.get(pk=course["A1"].pk)
+    draft.transcript = [[{"timestamp": 0, "text": "DRAFT-SECRET"}]]
+    request = rf.get("/")
+    request.user = editor
+    preview = draft.make_preview_request(request, draft.default_preview_mode)
+    assert b"DRAFT-SECRET" in preview.content
+
+    request = rf.get("/")
+    request.user = AnonymousUser()
+    request.session = {}
+    content = SegmentPage.objects.get(pk=course["A1"].pk).serve(request).content
+    assert b"PUBLISHED-TEXT" in content
+    assert b"DRAFT-SECRET" not in content
@@ -0,0 +1,115 @@
+"""
+Tests for the static bake (courses/bake.py).
+
+Page tree used by the fixture (under the default site's root page):
+
+    Home
+    └── Course
+        └── Chapter A
+            ├── A1
+            └── A2
+"""
+
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from wagtail.models import Site
+
+from courses.bake import bake_pages, file_name
+from courses.models import ChapterPage, CoursePage, SegmentPage
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def baked(tmp_path):
+    with override_settings(
+        STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+            },
+            "baked": {
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": str(tmp_path)},
+            },
+        }
+    ):
+        yield tmp_path
+
+
+@pytest.fixture
+def course():
+    home = Site.objects.get(is_default_site=True).root_page
+    course = CoursePage(title="Baked Course", live=True)
+    home.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter A", live=True)
+    course.add_child(instance=chapter)
+
+    pages = {"course": course, "a": chapter}
+    for title in ["A1", "A2"]:
+        segment = SegmentPage(title=title, live=True)
+        chapter.add_child(instance=segment)
+        pages[title] = segment
+    return pages
+
+
+def _read(root, page):
+    return (root / file_name(page.url)).read_bytes()
+
+
+def test_file_name():
+    assert file_name("/") == "index.html"
+    assert file_name("/course/chapter/") == "course/chapter/index.html"
+
+
+def test_bake_writes_public_pages(baked, course):
+    counts = bake_pages()
+
+    assert counts["failed"] == 0
+    assert b"A1" in _read(baked, course["A1"])
+    assert (baked / file_name(course["a"].url)).exists()
+    manifest = json.loads((baked / "manifest.json").read_text())
+    assert str(course["A2"].id) in manifest["pages"]
+
+
+def test_bake_is_incremental(baked, course):
+    first = bake_pages()
+
+    # Nothing changed: only the always-rendered listing pages run again
+    again = bake_pages()
+    assert again["skipped"] == first["rendered"] - again["rendered"] > 0
+    assert again["written"] == 0
+
+    # A new revision of one segment re-renders just that segment
+    segment = SegmentPage.objects.get(pk=course["A2"].pk)
+    segment.save_revision().publish()
+    after_publish = bake_pages()
+    assert after_publish["rendered"] == again["rendered"] + 1
+
+    # An outline change (another segment unpublished) touches the whole course
+    SegmentPage.objects.get(pk=course["A1"].pk).unpublish()
+    after_unpublish = bake_pages()
+    assert after_unpublish["removed"] == 1
+    assert after_unpublish["rendered"] == again["rendered"] + 2
+    assert not (baked / file_name(course["A1"].url)).exists()
+
+
+def test_gated_course_not_baked(baked, course):
+    bake_pages()
+    course["course"].coming_soon = "Spring"
+    course["course"].save_revision().publish()
+
+    counts = bake_pages()
+
+    assert counts["removed"] == 3
+    assert not (baked / file_name(course["A1"].url)).exists()
+
+
+def test_command_dry_run(baked, course, capsys):
+    call_command("bake_pages", "--dry-run", "--jobs", "1")
+
+    assert "to render" in capsys.readouterr().out
+    assert not (baked / "manifest.json").exists()
@@ -1,8 +1,29 @@
 from django.urls import path
-from .views import update_progress, generate_certificate
+from .views import (
+    update_progress,
+    update_progress_async,
+    update_progress_batch,
+    segment_overlay_view,
+    generate_certificate,
+)
 
 urlpatterns = [
     path("progress/update/", update_progress, name="update_progress"),
+    path(
+        "progress/update/async/",
+        update_progress_async,
+        name="update_progress_async",
+    ),
+    path(
+        "progress/update/batch/",
+        update_progress_batch,
+        name="update_progress_batch",
+    ),
+    path(
+        "progress/overlay/<int:segment_id>/",
+        segment_overlay_view,
+        name="segment_overlay",
+    ),
     path(
         "courses/<int:course_id>/certificate/",
         generate_certificate,
@@ -1,5 +1,5 @@
 from django.http import JsonResponse, Http404, HttpResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -8,59 +8,72 @@ from django.contrib.auth.decorators import login_required
 from django.template.loader import render_to_string
 import json
 import requests
+from asgiref.sync import sync_to_async
 
 from .models import (
     SegmentPage,
-    ChapterPage,
     CoursePage,
     SegmentProgress,
-    ChapterProgress,
     CourseProgress,
 )
+from .outline import get_course_outline, outline_for_page, outline_for_segment
+from .overlay import segment_overlay
+from .progress import (
+    COMPLETE_PERCENT,
+    MAX_BATCH_ENTRIES,
+    acompletion_status,
+    arecord_segment_progress,
+    completion_status,
+    progress_buffer,
+    record_progress_batch,
+    record_segment_progress,
+)
 
 
-def _is_chapter_complete(user, chapter):
+def _is_chapter_complete(user, chapter, outline=None):
     """
     A chapter is complete when ALL of its segments for this user
     have percent_watched >= 100.
     """
-    # All segments under this chapter
-    segments_qs = chapter.get_children().type(SegmentPage).live()
-
-    total_segments = segments_qs.count()
-    if total_segments == 0:
+    outline = outline or outline_for_page(chapter)
+    entry = outline.chapter(chapter.id) if outline else None
+    if entry is None or not entry.segments:
         return False
 
     completed_segments = SegmentProgress.objects.filter(
         user=user,
-        segment__in=segments_qs,
+        segment_id__in=[s.id for s in entry.segments],
         percent_watched__gte=100,
     ).count()
 
-    return completed_segments == total_segments
+    return completed_segments == len(entry.segments)
 
 
-def _is_course_complete(user, course):
+def _is_course_complete(user, course, outline=None):
     """
     A course is complete when ALL of its non-intro chapters are complete for this user.
     """
-    chapters_qs = course.get_children().type(ChapterPage).live().specific()
-
-    non_intro = [ch for ch in chapters_qs if not ch.is_intro]
+    outline = outline or get_course_outline(course.id)
+    non_intro = outline.numbered_chapters if outline else []
 
-    if not non_intro:
+    if not non_intro or not all(ch.segments for ch in non_intro):
         return False
 
-    for ch in non_intro:
-        if not _is_chapter_complete(user, ch):
-            return False
+    required = [s.id for ch in non_intro for s in ch.segments]
+    completed = SegmentProgress.objects.filter(
+        user=user,
+        segment_id__in=required,
+        percent_watched__gte=100,
+    ).count()
 
-    return True
+    return completed == len(required)
 
 
-@csrf_exempt
-@require_POST
-def update_progress(request):
+def _parse_progress_request(request):
+    """
+    Validate an update_progress body. Returns ``(segment_id, percent, sync)``
+    or a 400 JsonResponse.
+    """
     # Parse JSON safely
     try:
         data = json.loads(request.body.decode("utf-8") or "{}")
@@ -73,53 +86,221 @@ def update_progress(request):
     if segment_id is None or percent_watched is None:
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    segment = get_object_or_404(SegmentPage, id=segment_id)
-
     try:
         percent = float(percent_watched)
     except (TypeError, ValueError):
         return JsonResponse({"error": "Invalid percent_watched"}, status=400)
 
+    try:
+        segment_id = int(segment_id)
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    return segment_id, percent, data.get("sync") is True
+
+
+def _buffer_heartbeat(user, segment_id, percent):
+    """
+    In write-behind mode, buffer a sub-100% heartbeat and return its
+    response; returns None when the heartbeat must be written now.
+    """
+    if not settings.PROGRESS_WRITE_BEHIND:
+        return None
+
+    # Sub-100% heartbeats can't complete anything: buffer them and let the
+    # flusher write the highest value. Completions stay synchronous.
+    if percent < COMPLETE_PERCENT:
+        # Nothing is written yet, so check the segment against the cached
+        # outline and 404 like the synchronous write would
+        if outline_for_segment(segment_id) is None:
+            raise Http404("No SegmentPage matches the given query.")
+        progress_buffer.record(user.id, segment_id, percent)
+        return JsonResponse(
+            {
+                "segment_id": segment_id,
+                "saved": True,
+                "buffered": True,
+                "percent_watched": percent,
+                "chapter_completed": False,
+                "course_completed": False,
+            }
+        )
+    progress_buffer.discard(user.id, segment_id)
+    return None
+
+
+def _progress_response(segment_id, percent, authenticated, completion, sync):
+    chapter_completed, course_completed = completion
+
+    # Anonymous users don’t get persisted state or completion inference
+    response = {
+        "segment_id": segment_id,
+        "saved": authenticated,
+        "percent_watched": percent,
+        "chapter_completed": chapter_completed if authenticated else False,
+        "course_completed": course_completed if authenticated else False,
+    }
+    if authenticated and settings.PROGRESS_RECONCILE_MODE == "deferred" and not sync:
+        # Completion flags may lag until the reconcile worker catches up;
+        # clients that need them now can resend with "sync": true
+        response["completion_pending"] = True
+    return JsonResponse(response)
+
+
+@csrf_exempt
+@require_POST
+def update_progress(request):
+    parsed = _parse_progress_request(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    segment_id, percent, sync = parsed
+
     user = request.user
     authenticated = user.is_authenticated
 
-    chapter_completed = False
-    course_completed = False
+    completion = (False, False)
+
+    if authenticated:
+        buffered = _buffer_heartbeat(user, segment_id, percent)
+        if buffered is not None:
+            return buffered
+
+        write = record_segment_progress(user, segment_id, percent)
+        if not write.found:
+            raise Http404("No SegmentPage matches the given query.")
+
+        # A partial heartbeat that raised the stored value can't have
+        # completed anything, so only read completion state otherwise
+        if percent >= COMPLETE_PERCENT or not write.written:
+            completion = completion_status(user, segment_id, sync=sync)
+    elif not SegmentPage.objects.filter(id=segment_id).exists():
+        raise Http404("No SegmentPage matches the given query.")
+
+    return _progress_response(segment_id, percent, authenticated, completion, sync)
+
+
+@csrf_exempt
+@require_POST
+async def update_progress_async(request):
+    """
+    ``async def`` version of update_progress with the same request and
+    response format.
+
+    Under Daphne a sync view costs a thread hop per request through
+    sync_to_async; this one runs on the event loop and only leaves it for
+    the database, so many open video tabs heartbeating at once don't queue
+    for sync worker threads.
+    """
+    parsed = _parse_progress_request(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    segment_id, percent, sync = parsed
+
+    user = await request.auser()
+    authenticated = user.is_authenticated
+
+    completion = (False, False)
 
     if authenticated:
-        # Save or update SegmentProgress.
-        # The post_save signal (courses/signals.py) automatically reconciles
-        # ChapterProgress and CourseProgress after this save.
-        sp, _ = SegmentProgress.objects.get_or_create(
-            user=user,
-            segment=segment,
+        if settings.PROGRESS_WRITE_BEHIND:
+            # Its segment check may have to query the database
+            buffered = await sync_to_async(_buffer_heartbeat)(
+                user, segment_id, percent
+            )
+            if buffered is not None:
+                return buffered
+
+        write = await arecord_segment_progress(user, segment_id, percent)
+        if not write.found:
+            raise Http404("No SegmentPage matches the given query.")
+
+        if percent >= COMPLETE_PERCENT or not write.written:
+            completion = await acompletion_status(user, segment_id, sync=sync)
+    elif not await SegmentPage.objects.filter(id=segment_id).aexists():
+        raise Http404("No SegmentPage matches the given query.")
+
+    return _progress_response(segment_id, percent, authenticated, completion, sync)
+
+
+@require_GET
+def segment_overlay_view(request, segment_id):
+    """
+    The signed-in user's state on a segment page as JSON (see
+    courses/overlay.py); ``{"authenticated": false}`` for anonymous users.
+    """
+    segment = get_object_or_404(
+        SegmentPage.objects.live().only("id", "path", "course_id"), id=segment_id
+    )
+    outline = segment.get_course_outline()
+    if outline is None:
+        raise Http404("No SegmentPage matches the given query.")
+
+    overlay = segment_overlay(request.user, segment, outline)
+    if overlay is None:
+        return JsonResponse({"segment_id": segment.id, "authenticated": False})
+    return JsonResponse({**overlay, "authenticated": True})
+
+
+@csrf_exempt
+@require_POST
+def update_progress_batch(request):
+    """
+    Batch variant of update_progress for clients that queue heartbeats.
+
+    Body: {"entries": [{"segment_id": 1, "percent_watched": 40}, ...]}
+    When a segment appears more than once the last entry wins.
+    """
+    try:
+        data = json.loads(request.body.decode("utf-8") or "{}")
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    raw_entries = data.get("entries") if isinstance(data, dict) else None
+    if not isinstance(raw_entries, list) or not raw_entries:
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    if len(raw_entries) > MAX_BATCH_ENTRIES:
+        return JsonResponse(
+            {"error": f"At most {MAX_BATCH_ENTRIES} entries per request"}, status=400
         )
-        if sp.percent_watched < 100:
-            sp.percent_watched = percent
-            sp.save()
 
-        # Read back completion state (set by the signal) for the API response
-        chapter = segment.get_parent().specific
-        course = chapter.get_parent().specific if chapter else None
+    entries = {}
+    for entry in raw_entries:
+        if not isinstance(entry, dict):
+            return JsonResponse({"error": "Invalid request"}, status=400)
+        try:
+            segment_id = int(entry["segment_id"])
+            entries[segment_id] = float(entry["percent_watched"])
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({"error": "Invalid entry"}, status=400)
 
-        if isinstance(chapter, ChapterPage):
-            chapter_completed = ChapterProgress.objects.filter(
-                user=user, chapter=chapter, completed=True
-            ).exists()
+    user = request.user
+    authenticated = user.is_authenticated
 
-        if isinstance(course, CoursePage):
-            course_completed = CourseProgress.objects.filter(
-                user=user, course=course, completed=True
-            ).exists()
+    saved, chapters, courses = {}, {}, {}
+    if authenticated:
+        saved, chapters, courses = record_progress_batch(user, entries)
 
     # Anonymous users don’t get persisted state or completion inference
     return JsonResponse(
         {
-            "segment_id": segment.id,
             "saved": authenticated,
-            "percent_watched": percent,
-            "chapter_completed": chapter_completed if authenticated else False,
-            "course_completed": course_completed if authenticated else False,
+            "segments": [
+                {
+                    "segment_id": segment_id,
+                    "saved": segment_id in saved,
+                    "percent_watched": saved.get(segment_id, percent),
+                }
+                for segment_id, percent in entries.items()
+            ],
+            "chapters": [
+                {"chapter_id": pk, "completed": completed}
+                for pk, completed in chapters.items()
+            ],
+            "courses": [
+                {"course_id": pk, "completed": completed}
+                for pk, completed in courses.items()
+            ],
         }
     )
 
@@ -6,9 +6,8 @@ from wagtail.snippets.models import register_snippet
 from wagtail.models import Page
 from wagtail.fields import RichTextField, StreamField
 
-from courses.models import CoursesIndexPage, Instructor, build_courses_listing_context
-
-import re
+from courses.catalog import get_people_panels
+from courses.models import CoursesIndexPage, build_courses_listing_context
 
 
 @register_snippet
@@ -74,39 +73,8 @@ class HomePage(Page):
         if courses_index:
             context.update(build_courses_listing_context(courses_index, user))
 
-        # Process social links for instructors or contributors for displaying in UI
-        def clean_social_links(people):
-            # Pre-compile regex for removing links protocol and www.
-            URL_CLEANER = re.compile(r"^(https?://)?(www\.)?", re.IGNORECASE)
-            for person in people:
-                person.processed_social_links = []
-                for link in person.social_links:
-                    processed = {
-                        # Full URL to be used for href
-                        "url": link,
-                        # Clean URL for displaying (no protocol, www, or trailing slash)
-                        "clean": URL_CLEANER.sub("", link).rstrip("/"),
-                    }
-                    person.processed_social_links.append(processed)
-            return people
-
-        # Get list of all instructors
-        instructors = (
-            Instructor.objects.filter(role__name="instructor")
-            .order_by("name")
-            .prefetch_related(
-                "instructor_course__page", "image"  # Prefetch instructor images
-            )
-        )
-        context["instructors"] = clean_social_links(instructors)
-
-        # Get list of all contributors
-        contributors = (
-            Instructor.objects.filter(role__name="contributor")
-            .order_by("name")
-            .prefetch_related("image")  # Prefetch contributor images
-        )
-        context["contributors"] = clean_social_links(contributors)
+        # Instructor and contributor panels, with their social links
+        context.update(get_people_panels())
 
         context["announcements"] = Announcement.objects.filter(active=True).order_by("sort_order")
 
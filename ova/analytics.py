@@ -0,0 +1,274 @@
+"""
+Analytics dashboard metrics
+
+``collect_metrics`` computes everything the admin analytics dashboard shows
+(and its JSON download) as plain, JSON-serializable data: user metrics,
+course engagement metrics and per-course, per-instructor and per-tag
+content metrics.
+
+The dashboard doesn't compute them while staff wait: ``take_snapshot``
+stores the payload as an AnalyticsSnapshot row, run on a schedule by the
+``snapshot_analytics`` management command or in the background by
+``snapshot_worker`` when staff ask for a refresh. The dashboard renders the
+latest snapshot, and the older ones give its trend table.
+
+The 7- and 30-day sign-up and completion counts are sums over the daily
+rollups (see ova/rollups.py), which ``take_snapshot`` brings up to date
+first.
+
+The content metrics are set-based: one grouped query each for enrolments
+and completions per course, average watch percentage per course, course
+instructors and course tags, and the instructor and tag tables are summed
+from the per-course numbers in Python. The number of queries doesn't grow
+with the number of courses, instructors or tags.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from courses.models import (
+    AnalyticsSnapshot,
+    ChapterPage,
+    CourseCategoryTag,
+    CoursePage,
+    CourseProgress,
+    ChapterProgress,
+    InstructorsOrderable,
+    QuizProgress,
+    SegmentPage,
+    SegmentProgress,
+)
+from ova.background import BackgroundWorker
+from ova.rollups import site_window, update_rollups
+from users.models import User
+
+
+# Snapshot values shown in the dashboard's trend table
+TREND_FIELDS = (
+    ("user_metrics", "total_users"),
+    ("user_metrics", "users_with_progress_7d"),
+    ("engagement_metrics", "course_starts"),
+    ("engagement_metrics", "course_completions"),
+    ("engagement_metrics", "segments_completed"),
+)
+
+
+def _rate(part, whole):
+    return round(part / whole * 100, 1) if whole > 0 else 0
+
+
+def user_metrics(now):
+    thirty_days_ago = now - timedelta(days=30)
+    seven_days_ago = now - timedelta(days=7)
+    learners = User.objects.filter(is_staff=False)
+
+    # Distinct learners over a window can't be summed from daily rollups;
+    # those two counts range-scan the last_updated index instead
+    return {
+        "total_users": learners.filter(is_active=True).count(),
+        "new_users_30d": site_window(now, 30)["new_users"],
+        "new_users_7d": site_window(now, 7)["new_users"],
+        "active_users_30d": learners.filter(last_login__gte=thirty_days_ago).count(),
+        "active_users_7d": learners.filter(last_login__gte=seven_days_ago).count(),
+        "users_with_progress": learners.filter(segmentprogress__isnull=False)
+        .distinct()
+        .count(),
+        "users_with_progress_30d": learners.filter(
+            segmentprogress__last_updated__gte=thirty_days_ago
+        )
+        .distinct()
+        .count(),
+        "users_with_progress_7d": learners.filter(
+            segmentprogress__last_updated__gte=seven_days_ago
+        )
+        .distinct()
+        .count(),
+    }
+
+
+def engagement_metrics(now):
+    courses = CourseProgress.objects.aggregate(
+        starts=Count("id"),
+        completions=Count("id", filter=Q(completed=True)),
+    )
+    segments = SegmentProgress.objects.aggregate(
+        total=Count("id"),
+        completed=Count("id", filter=Q(percent_watched__gte=100)),
+        avg_watch=Avg("percent_watched"),
+    )
+    quizzes = QuizProgress.objects.filter(completed=True).aggregate(
+        attempts=Count("id"), avg_score=Avg("score")
+    )
+
+    return {
+        "course_starts": courses["starts"],
+        "course_completions": courses["completions"],
+        "completion_rate": _rate(courses["completions"], courses["starts"]),
+        "chapter_completions": ChapterProgress.objects.filter(completed=True).count(),
+        "avg_watch_percentage": round(segments["avg_watch"] or 0, 1),
+        "segments_completed": segments["completed"],
+        "total_segment_progress": segments["total"],
+        "recent_completions": site_window(now, 30)["completions"],
+        "quiz_attempts": quizzes["attempts"],
+        "avg_quiz_score": round(quizzes["avg_score"] or 0, 1),
+    }
+
+
+def _avg_watch_by_course():
+    rows = (
+        SegmentProgress.objects.filter(segment__live=True)
+        .values("segment__course_id")
+        .annotate(avg=Avg("percent_watched"))
+        .order_by()
+    )
+    return {row["segment__course_id"]: row["avg"] for row in rows}
+
+
+def _summarize(groups, counts):
+    """Instructor or tag rows from ``(name, course ids)`` pairs."""
+    stats = []
+    for label, course_ids in groups:
+        starts = sum(counts[course_id]["starts"] for course_id in course_ids)
+        completions = sum(counts[course_id]["completions"] for course_id in course_ids)
+        stats.append(
+            {
+                "name": label,
+                "courses_count": len(course_ids),
+                "total_starts": starts,
+                "total_completions": completions,
+                "completion_rate": _rate(completions, starts),
+            }
+        )
+    stats.sort(key=lambda x: x["total_starts"], reverse=True)
+    return stats
+
+
+def content_metrics():
+    courses = list(
+        CoursePage.objects.live()
+        .order_by("path")
+        .values("id", "title", "coming_soon")
+    )
+    course_ids = [course["id"] for course in courses]
+
+    counts = defaultdict(lambda: {"starts": 0, "completions": 0})
+    for row in (
+        CourseProgress.objects.filter(course_id__in=course_ids)
+        .values("course_id")
+        .annotate(
+            starts=Count("id"),
+            completions=Count("id", filter=Q(completed=True)),
+        )
+        .order_by()
+    ):
+        counts[row["course_id"]] = row
+
+    avg_watch = _avg_watch_by_course()
+
+    instructors = defaultdict(list)
+    courses_by_instructor = defaultdict(set)
+    for course_id, name, instructor_id in (
+        InstructorsOrderable.objects.filter(page_id__in=course_ids)
+        .order_by("page_id", "sort_order")
+        .values_list("page_id", "instructor__name", "instructor_id")
+    ):
+        instructors[course_id].append(name)
+        courses_by_instructor[instructor_id, name].add(course_id)
+
+    tags = defaultdict(list)
+    courses_by_tag = defaultdict(set)
+    for course_id, name in (
+        CourseCategoryTag.objects.filter(content_object_id__in=course_ids)
+        .order_by("id")
+        .values_list("content_object_id", "tag__name")
+    ):
+        tags[course_id].append(name)
+        courses_by_tag[name].add(course_id)
+
+    course_stats = [
+        {
+            "id": course["id"],
+            "title": course["title"],
+            "starts": counts[course["id"]]["starts"],
+            "completions": counts[course["id"]]["completions"],
+            "completion_rate": _rate(
+                counts[course["id"]]["completions"], counts[course["id"]]["starts"]
+            ),
+            "avg_watch_percentage": round(avg_watch.get(course["id"]) or 0, 1),
+            "instructors": instructors[course["id"]],
+            "tags": tags[course["id"]],
+            "coming_soon": bool(course["coming_soon"]),
+        }
+        for course in courses
+    ]
+    # Most popular first
+    course_stats.sort(key=lambda x: x["starts"], reverse=True)
+
+    return {
+        "course_stats": course_stats,
+        "instructor_stats": _summarize(
+            ((name, ids) for (_, name), ids in sorted(courses_by_instructor.items())),
+            counts,
+        ),
+        "tag_stats": _summarize(sorted(courses_by_tag.items()), counts),
+        "total_courses": len(courses),
+        "total_chapters": ChapterPage.objects.live().count(),
+        "total_segments": SegmentPage.objects.live().count(),
+    }
+
+
+def collect_metrics(now=None):
+    """The complete dashboard payload, as stored in the JSON download."""
+    now = now or timezone.now()
+    return {
+        "generated_at": now.isoformat(),
+        "user_metrics": user_metrics(now),
+        "engagement_metrics": engagement_metrics(now),
+        "content_metrics": content_metrics(),
+    }
+
+
+def take_snapshot():
+    """Compute the dashboard metrics and store them. Returns the snapshot."""
+    now = timezone.now()
+    update_rollups(now)
+    return AnalyticsSnapshot.objects.create(
+        created_at=now, metrics=collect_metrics(now)
+    )
+
+
+def latest_snapshot():
+    return AnalyticsSnapshot.objects.first()
+
+
+def trend(limit=14):
+    """Headline numbers from the latest ``limit`` snapshots, oldest first."""
+    rows = []
+    for created_at, metrics in AnalyticsSnapshot.objects.values_list(
+        "created_at", "metrics"
+    )[:limit]:
+        row = {"created_at": created_at}
+        for section, key in TREND_FIELDS:
+            row[key] = metrics.get(section, {}).get(key)
+        rows.append(row)
+    return rows[::-1]
+
+
+class SnapshotWorker(BackgroundWorker):
+    """
+    Takes a snapshot in a background thread when staff press "Refresh now"
+    on the dashboard. Requests that arrive while one is being taken are
+    covered by one more run.
+    """
+
+    name = "analytics-snapshot"
+    error_message = "Failed to take an analytics snapshot"
+
+    def work(self):
+        take_snapshot()
+
+
+snapshot_worker = SnapshotWorker()
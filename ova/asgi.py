@@ -1,14 +1,20 @@
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 from channels.routing import ProtocolTypeRouter
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ova.settings.dev")
 
-# Initialize Django ASGI application early to ensure the AppRegistry
-# is populated before importing code that may import ORM models.
-django_asgi_app = get_asgi_application()
+# Initialize Django early (as get_asgi_application() does) to ensure the
+# AppRegistry is populated before importing code that may import ORM models.
+django.setup(set_prefix=False)
+
+from ova.serving import get_asgi_handler  # noqa: E402
+
+# Django's ASGIHandler, or the bounded sync-view pool when
+# SYNC_VIEW_THREADS is set
+django_asgi_app = get_asgi_handler()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
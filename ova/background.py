@@ -0,0 +1,121 @@
+"""
+In-process background workers.
+
+A ``BackgroundWorker`` runs ``work()`` on a daemon thread: whenever it is
+woken, and with ``interval`` also every ``interval`` seconds. Wakes that
+arrive while a run is in progress are covered by one more run, and with
+``delay`` the worker waits that long after a wake so a burst of them is
+handled in one run. The thread is started on first use, again in a
+process forked from one that had it running, and again if it died.
+
+``stop_workers`` stops every worker once the run in progress and any
+pending wake are done. The prefork launcher calls it before a worker
+process exits, and it is registered with atexit for other servers.
+"""
+
+import atexit
+import logging
+import os
+import threading
+
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_workers = []
+
+
+class BackgroundWorker:
+    name = "background-worker"
+    error_message = "Background worker failed"
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        _workers.append(self)
+
+    def _reset(self):
+        # Threads and locks don't survive a fork in a usable state
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._wanted = False
+        self._running = False
+
+    @property
+    def interval(self):
+        """Seconds between runs without a wake, or None to only run when
+        woken."""
+        return None
+
+    @property
+    def delay(self):
+        """Seconds to wait after a wake before running."""
+        return 0
+
+    @property
+    def busy(self):
+        return self._running or self._wanted
+
+    def work(self):
+        raise NotImplementedError
+
+    def wake(self):
+        self._wanted = True
+        self._wakeup.set()
+        self.start()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._stopping.is_set():
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the thread once the run in progress, and one more for a
+        pending wake, are done. Returns False if it was still running after
+        ``timeout`` seconds."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is None or thread is threading.current_thread():
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            if self.delay and not self._stopping.is_set():
+                self._stopping.wait(self.delay)
+            self._wakeup.clear()
+            due, self._wanted = self._wanted or self.interval is not None, False
+            if due:
+                self._running = True
+                try:
+                    self.work()
+                except Exception:
+                    logger.exception(self.error_message)
+                finally:
+                    self._running = False
+                    # This thread owns its own connection; don't leave it open
+                    connections.close_all()
+            if self._stopping.is_set() and not self._wanted:
+                return
+
+
+def stop_workers(timeout=None):
+    """Stop every worker in this process, ``timeout`` seconds at most each."""
+    for worker in _workers:
+        if not worker.stop(timeout):
+            logger.warning("%s still running at shutdown", worker.name)
+
+
+atexit.register(stop_workers)
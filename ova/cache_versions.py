@@ -0,0 +1,42 @@
+"""
+Versioned cache keys.
+
+Cached data that goes stale all at once (course outlines, the catalog,
+routes, anonymous pages) is stored under keys that include a version
+number kept in the cache itself. Invalidating it bumps the number instead
+of deleting keys, so a request that is still building the old data can't
+write it back over the new one.
+
+Versions start from the clock in milliseconds rather than from 1. When a
+version key is evicted it comes back higher than any version entries were
+stored under, so those entries can't become valid again.
+"""
+
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+
+
+def _initial_version():
+    return time.time_ns() // 1_000_000
+
+
+def current_version(key, alias=DEFAULT_CACHE_ALIAS):
+    """The version stored under ``key``, starting it if there is none."""
+    cache = caches[alias]
+    version = cache.get(key)
+    if version is None:
+        # add() so concurrent first readers agree on the starting version
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version if version is not None else _initial_version()
+
+
+def bump_version(key, alias=DEFAULT_CACHE_ALIAS):
+    """Make everything stored under the current version of ``key`` stale."""
+    cache = caches[alias]
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted or never read: a fresh start is newer than anything stored
+        cache.add(key, _initial_version(), None)
@@ -0,0 +1,211 @@
+"""
+Full-page cache for anonymous visitors.
+
+``PageCacheMiddleware`` stores the HTML of Wagtail pages served to signed-out
+visitors in the "pages" cache (see CACHES in settings/base.py: local memory,
+a directory on disk or Redis) and serves it to the next anonymous GET for the
+same URL without touching the ORM.
+
+Entries are stamped with a global content version (see
+ova/cache_versions.py). Publishing, unpublishing, moving, saving or
+deleting a page, or editing a snippet the pages show (instructors, topics,
+tags, images, announcements, ...) bumps the version, which makes every
+stored page stale at once. Stale and expired entries stay around for
+PAGE_CACHE_STALE_GRACE more seconds so that, when a popular page needs
+re-rendering, only the request that wins a short lock renders it. The others
+get the stale copy or, when there is none (a page never stored, or stale for
+longer than the grace period), render it themselves without storing it:
+nothing ever waits for the winner, since a waiting request would hold one
+of the worker's sync-view threads while it slept.
+
+Only plain 200 responses are stored. Responses that set a cookie, use a
+CSRF token or are marked private aren't, and neither are redirects or the
+403 "coming soon" page a gated course shows, so gating works as before.
+Requests from signed-in users, or carrying a pending flash message, always
+go through to Wagtail. PAGE_CACHE_TIMEOUT = 0 turns the cache off.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import cc_delim_re
+from wagtail.images import get_image_model_string
+from wagtail.signals import page_published, page_unpublished, post_page_move
+from wagtail.views import serve as wagtail_serve
+
+from ova.cache_versions import bump_version, current_version
+
+CACHE_ALIAS = "pages"
+VERSION_KEY = "ova:page-cache:version"
+
+# Page types whose saves and deletes show up on cached pages. Deleting a
+# page of any type also deletes its wagtailcore.Page row.
+PAGE_MODELS = (
+    "wagtailcore.page",
+    "courses.coursesindexpage",
+    "courses.coursepage",
+    "courses.chapterpage",
+    "courses.segmentpage",
+    "home.homepage",
+    "home.noncoursepage",
+    "home.aboutpage",
+    "home.sponsorspage",
+    "home.accessibilitypage",
+    "home.brandpage",
+)
+
+# Non-page models whose changes show up on cached pages
+CONTENT_MODELS = {
+    "courses.instructor",
+    "courses.instructorsorderable",
+    "courses.role",
+    "courses.topic",
+    "courses.tagsnippet",
+    "courses.quiz",
+    "courses.question",
+    "courses.choice",
+    "courses.coursematerial",
+    "courses.chaptermaterial",
+    "courses.segmentmaterial",
+    "home.announcement",
+    "wagtailcore.site",
+    "taggit.tag",
+    "courses.coursecategorytag",
+    get_image_model_string(),
+}
+
+
+def page_cache():
+    return caches[CACHE_ALIAS]
+
+
+def content_version():
+    return current_version(VERSION_KEY, CACHE_ALIAS)
+
+
+def bump_content_version():
+    """Mark every cached page stale."""
+    bump_version(VERSION_KEY, CACHE_ALIAS)
+
+
+def page_key(request):
+    url = request.get_host() + request.get_full_path()
+    return "ova:page-cache:page:" + hashlib.sha256(url.encode()).hexdigest()
+
+
+def _lock_key(key):
+    return key + ":lock"
+
+
+class PageCacheMiddleware:
+    """Serve and store anonymous Wagtail page responses. Keep it after any
+    middleware that changes responses, so only the page view's own response
+    is stored, and before the route cache so hits skip routing too."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        key = getattr(request, "_page_cache_lock", None)
+        if key is not None:
+            self._store(request, key, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timeout = settings.PAGE_CACHE_TIMEOUT
+        if (
+            timeout <= 0
+            or view_func is not wagtail_serve
+            or request.method != "GET"
+            or getattr(request, "is_dummy", False)
+            or "messages" in request.COOKIES
+            or request.user.is_authenticated
+        ):
+            return None
+
+        cache = page_cache()
+        key = page_key(request)
+        found = cache.get_many([VERSION_KEY, key])
+        version = found.get(VERSION_KEY)
+        entry = found.get(key)
+        if version is None:
+            version = content_version()
+
+        if entry is not None and entry[0] == version and entry[1] > time.time():
+            return self._cached_response(entry, "hit")
+
+        if cache.add(_lock_key(key), 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+            # This request renders the page; see __call__
+            request._page_cache_lock = key
+            request._page_cache_version = version
+            return None
+
+        if entry is not None:
+            return self._cached_response(entry, "stale")
+
+        # Someone else is rendering a page there's no copy of: render it
+        # too rather than sleep on a pool thread until they're done
+        return None
+
+    def _cached_response(self, entry, state):
+        _, _, content_type, content = entry
+        response = HttpResponse(content, content_type=content_type)
+        response["X-Page-Cache"] = state
+        return response
+
+    def _store(self, request, key, response):
+        cache = page_cache()
+        if is_shareable(request, response):
+            timeout = settings.PAGE_CACHE_TIMEOUT
+            entry = (
+                request._page_cache_version,
+                time.time() + timeout,
+                response["Content-Type"],
+                response.content,
+            )
+            cache.set(key, entry, timeout + settings.PAGE_CACHE_STALE_GRACE)
+            response["X-Page-Cache"] = "miss"
+        else:
+            # e.g. the page was unpublished or gated: stop handing out the
+            # old copy
+            cache.delete(key)
+        cache.delete(_lock_key(key))
+
+
+def is_shareable(request, response):
+    """Whether ``response`` can be handed to every anonymous visitor as is."""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+        return False
+    session = getattr(request, "session", None)
+    if session is not None and session.modified:
+        return False
+    cache_control = {
+        directive.split("=", 1)[0].strip().lower()
+        for directive in cc_delim_re.split(response.get("Cache-Control", ""))
+    }
+    return not cache_control & {"private", "no-store", "no-cache"}
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def bump_on_page_change(sender, **kwargs):
+    bump_content_version()
+
+
+def bump_on_content_change(sender, **kwargs):
+    bump_content_version()
+
+
+for _model in (*PAGE_MODELS, *CONTENT_MODELS):
+    post_save.connect(bump_on_content_change, sender=_model)
+    post_delete.connect(bump_on_content_change, sender=_model)
@@ -0,0 +1,239 @@
+"""
+Pre-forking multi-process launcher for Daphne.
+
+    python -m ova.prefork --workers 4 -b 0.0.0.0 -p 8000
+
+The parent imports Django, builds the ASGI application and warms it once:
+URL resolver, middleware and page templates. It then binds the listening
+socket and forks the workers, which share the warmed, copy-on-write
+memory. Each worker runs Daphne on the inherited socket, so the kernel
+spreads connections across processes. A slow analytics page or
+certificate only holds up the process it runs in. Crashed workers are
+restarted; SIGTERM/SIGINT stop them all. A worker that is told to stop
+stops Daphne, then the in-process background workers (ova/background.py),
+which flushes buffered progress, before it exits.
+
+Combine with SYNC_VIEW_THREADS (ova/serving.py) to bound the sync-view
+threads inside each worker. startup.sh uses this launcher when
+WEB_WORKERS > 1.
+
+Publishing invalidates cached course outlines, the catalog, routes and
+pages by bumping version keys in the cache, so several workers must share
+it: the launcher refuses to start more than one on a per-process cache
+(see CACHE_BACKEND and PAGE_CACHE_BACKEND in settings/base.py).
+"""
+
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("ova.prefork")
+
+# Backends whose entries live inside one process
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache",)
+
+# How long a stopping worker waits for each background worker (buffered
+# progress, bakes, snapshots) to finish
+SHUTDOWN_TIMEOUT = 30
+
+# A worker that dies sooner than this after starting is failing on boot;
+# back off instead of fork-looping
+MIN_WORKER_LIFETIME = 5
+
+
+def unshared_caches(workers):
+    """Aliases of the caches that ``workers`` processes wouldn't share."""
+    from django.conf import settings
+
+    if workers < 2:
+        return []
+    aliases = ["default"]
+    if settings.PAGE_CACHE_TIMEOUT:
+        aliases.append("pages")
+    return [
+        alias
+        for alias in aliases
+        if settings.CACHES[alias]["BACKEND"] in PROCESS_LOCAL_CACHES
+    ]
+
+
+def warm_up():
+    """Do the per-process first-request work once, before forking."""
+    from django.db import connections
+    from django.template import TemplateDoesNotExist
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+    from wagtail.models import get_page_models
+
+    # Imports every URLconf and view module and builds the reverse lookup
+    get_resolver()._populate()
+
+    for model in get_page_models():
+        template = getattr(model, "template", None)
+        if not template:
+            continue
+        try:
+            get_template(template)
+        except TemplateDoesNotExist:
+            pass
+
+    # Children must open their own connections
+    connections.close_all()
+
+
+def fresh_daphne_server():
+    """
+    Return daphne's Server class bound to a new reactor.
+
+    The "daphne" app installs Twisted's asyncio reactor when Django loads,
+    so the parent already has one, and its epoll instance would be shared by
+    every forked worker. Each worker installs its own and reloads
+    daphne.server so it picks the new one up.
+    """
+    import asyncio
+    import importlib
+
+    import daphne.server
+    from twisted.internet import asyncioreactor
+
+    sys.modules.pop("twisted.internet.reactor", None)
+    asyncioreactor.install(asyncio.new_event_loop())
+    return importlib.reload(daphne.server).Server
+
+
+def run_worker(application, sock, args):
+    Server = fresh_daphne_server()
+    from twisted.internet import reactor
+
+    def adopt_socket():
+        # Called by run() once the HTTP factory exists
+        port = reactor.adoptStreamPort(sock.fileno(), sock.family, server.http_factory)
+        server.listen_success(port)
+
+    server = Server(
+        application=application,
+        # Daphne insists on an endpoint; the shared socket is adopted below
+        endpoints=["inherited"],
+        http_timeout=args.http_timeout,
+        verbosity=args.verbosity,
+        ready_callable=adopt_socket,
+        signal_handlers=False,
+    )
+    server.endpoints = []
+
+    def stop(signum, frame):
+        # Let run() return, so serve_worker can shut down cleanly
+        reactor.callFromThread(reactor.stop)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.run()
+
+
+def serve_worker(application, sock, args):
+    """Body of a forked worker: serve until told to stop, then stop the
+    background workers and exit. Never returns."""
+    from ova.background import stop_workers
+
+    status = 0
+    try:
+        run_worker(application, sock, args)
+    except BaseException:
+        logger.exception("worker failed")
+        status = 1
+    # os._exit skips atexit, which is where other servers stop them
+    try:
+        stop_workers(SHUTDOWN_TIMEOUT)
+    except Exception:
+        logger.exception("failed to stop background workers")
+        status = 1
+    os._exit(status)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-b", "--bind", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=8000)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_WORKERS", "2")),
+        help="Worker processes (default: $WEB_WORKERS or 2)",
+    )
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--http-timeout", type=int, default=None)
+    parser.add_argument("-v", "--verbosity", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="[prefork %(process)d] %(message)s")
+
+    from ova.asgi import application
+
+    unshared = unshared_caches(args.workers)
+    if unshared:
+        parser.error(
+            f"{args.workers} workers can't share the per-process "
+            f"{' and '.join(repr(alias) for alias in unshared)} cache; set "
+            "CACHE_BACKEND / PAGE_CACHE_BACKEND to database or redis, or run "
+            "one worker"
+        )
+
+    warm_up()
+
+    sock = socket.create_server((args.bind, args.port), backlog=args.backlog)
+    sock.set_inheritable(True)
+    # Twisted accepts until EAGAIN; a blocking socket would stall the worker
+    sock.setblocking(False)
+
+    workers = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # Not the parent's handler: until Daphne runs, die at once
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            serve_worker(application, sock, args)
+        workers[pid] = time.monotonic()
+        logger.info("started worker %s", pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if stopping or started is None:
+            continue
+        logger.warning("worker %s exited (status %s), restarting", pid, status)
+        if time.monotonic() - started < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+        spawn()
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
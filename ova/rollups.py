@@ -0,0 +1,171 @@
+"""
+Daily activity rollups
+
+The dashboard's 7- and 30-day numbers used to be counts over the whole
+User and CourseProgress tables. ``update_rollups`` keeps one
+DailySiteActivity row per day instead, so a window is a sum over at most 30
+rows:
+
+- new users: learners who signed up that day
+- active learners: learners whose segment progress was updated that day
+- completions: courses completed that day
+
+Each run only reads rows timestamped from the day of the previous run (the
+RollupWatermark) on, using the indexes on ``last_updated``,
+``completed_at`` and ``date_joined``, and recounts those days. Days before
+that are left as they were. A recount never lowers a stored number, even
+with ``rebuild``: the source rows only lose activity over time (a learner
+who comes back moves their ``last_updated`` to the new day, rows get
+deleted), so a lower count means activity was overwritten, not that the
+stored count was wrong. Runs hold a lock on the watermark row, so a cron
+run and a snapshot refresh that overlap take turns. Run it with the
+``rollup_activity`` command; ``take_snapshot`` also runs it first.
+
+``site_window`` gives the dashboard's rolling windows, the same "since now
+minus N days" as the live counts it replaced.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from courses.models import (
+    CourseProgress,
+    DailySiteActivity,
+    RollupWatermark,
+    SegmentProgress,
+)
+from users.models import User
+
+WATERMARK_NAME = "daily-activity"
+
+# Counts a recount may only raise
+SITE_COUNTS = ("new_users", "active_learners", "completions")
+
+# Re-read a little before the watermark, for rows whose transaction was
+# still open when the last run started
+OVERLAP = timedelta(minutes=10)
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _first_day():
+    """The earliest day any source has a row for, or None."""
+    candidates = [
+        SegmentProgress.objects.aggregate(first=Min("last_updated"))["first"],
+        CourseProgress.objects.aggregate(first=Min("completed_at"))["first"],
+        User.objects.aggregate(first=Min("date_joined"))["first"],
+    ]
+    candidates = [value for value in candidates if value is not None]
+    return timezone.localdate(min(candidates)) if candidates else None
+
+
+def _site_rows(since):
+    rows = defaultdict(dict)
+
+    for row in (
+        User.objects.filter(is_staff=False, date_joined__gte=since)
+        .annotate(day=TruncDate("date_joined"))
+        .values("day")
+        .annotate(new_users=Count("id"))
+        .order_by()
+    ):
+        rows[row["day"]]["new_users"] = row["new_users"]
+
+    for row in (
+        SegmentProgress.objects.filter(last_updated__gte=since, user__is_staff=False)
+        .annotate(day=TruncDate("last_updated"))
+        .values("day")
+        .annotate(active_learners=Count("user", distinct=True))
+        .order_by()
+    ):
+        rows[row["day"]]["active_learners"] = row["active_learners"]
+
+    for row in (
+        CourseProgress.objects.filter(completed=True, completed_at__gte=since)
+        .annotate(day=TruncDate("completed_at"))
+        .values("day")
+        .annotate(completions=Count("id"))
+        .order_by()
+    ):
+        rows[row["day"]]["completions"] = row["completions"]
+
+    return [DailySiteActivity(day=day, **values) for day, values in rows.items()]
+
+
+def _keep_highest(stored, fresh):
+    """``fresh`` rows merged into the ``stored`` rows of the same days,
+    keeping the higher of each count."""
+    merged = {row.day: row for row in stored}
+    for row in fresh:
+        old = merged.get(row.day)
+        if old is not None:
+            for field in SITE_COUNTS:
+                setattr(row, field, max(getattr(old, field), getattr(row, field)))
+        merged[row.day] = row
+    for row in merged.values():
+        row.pk = None
+    return list(merged.values())
+
+
+def update_rollups(now=None, rebuild=False):
+    """
+    Bring the daily rollups up to date. With ``rebuild`` every day is
+    recounted from the start of the data, still keeping stored counts that
+    are higher. Returns the first day that was recounted, or None when there
+    was nothing to do.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Overlapping runs wait here for the one ahead to commit, and then
+        # start from the watermark it left
+        watermark, created = RollupWatermark.objects.select_for_update().get_or_create(
+            name=WATERMARK_NAME, defaults={"value": now}
+        )
+        if created or rebuild:
+            first_day = _first_day()
+            if first_day is None:
+                return None
+        else:
+            first_day = timezone.localdate(watermark.value - OVERLAP)
+        since = _start_of(first_day)
+
+        stored = DailySiteActivity.objects.filter(day__gte=first_day)
+        rows = _keep_highest(stored, _site_rows(since))
+        stored.delete()
+        DailySiteActivity.objects.bulk_create(rows, batch_size=500)
+        watermark.value = now
+        watermark.save(update_fields=["value"])
+    return first_day
+
+
+def site_window(now, days):
+    """
+    Sign-ups and course completions since ``now`` minus ``days`` days.
+
+    The whole days after that moment are summed from DailySiteActivity.
+    The day it falls on only partly counts, so that part is read from the
+    User and CourseProgress rows themselves, a range scan of less than a
+    day on their indexes.
+    """
+    since = now - timedelta(days=days)
+    next_day = _start_of(timezone.localdate(since) + timedelta(days=1))
+
+    totals = DailySiteActivity.objects.filter(
+        day__gt=timezone.localdate(since), day__lte=timezone.localdate(now)
+    ).aggregate(new_users=Sum("new_users"), completions=Sum("completions"))
+    totals = {key: value or 0 for key, value in totals.items()}
+
+    totals["new_users"] += User.objects.filter(
+        is_staff=False, date_joined__gte=since, date_joined__lt=next_day
+    ).count()
+    totals["completions"] += CourseProgress.objects.filter(
+        completed=True, completed_at__gte=since, completed_at__lt=next_day
+    ).count()
+    return totals
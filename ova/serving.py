@@ -0,0 +1,155 @@
+"""
+Bounded thread pool for sync views under Daphne.
+
+Django's ASGIHandler runs each request's sync code (middleware, Wagtail
+``serve``, template rendering) in a thread-sensitive executor. That executor
+is a new single-thread pool per request, with no limit on how many exist at
+once and no visibility into how long requests wait for them.
+
+``PooledASGIHandler`` keeps SYNC_VIEW_THREADS long-lived worker threads
+instead. Each request that runs sync code borrows one worker for its whole
+life, so the thread-sensitivity guarantees are unchanged: one request, one
+thread, and its DB connection is reused across requests. Requests beyond the
+pool size wait for a free worker. That wait is the queueing delay recorded
+in ``queue_metrics`` and sent back in a ``Server-Timing: queue`` header.
+Requests routed to ``async def`` views skip the pool entirely.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext, iscoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import Resolver404, get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the queue-delay histogram buckets
+QUEUE_DELAY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class QueueDelayMetrics:
+    """Per-process counters for the time requests wait for a sync worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.total_ms = 0.0
+            self.max_ms = 0.0
+            self.in_flight = 0
+            self.waiting = 0
+            self.buckets = [0] * (len(QUEUE_DELAY_BUCKETS_MS) + 1)
+
+    def observe(self, delay_ms):
+        with self._lock:
+            self.requests += 1
+            self.total_ms += delay_ms
+            self.max_ms = max(self.max_ms, delay_ms)
+            self.buckets[bisect.bisect_left(QUEUE_DELAY_BUCKETS_MS, delay_ms)] += 1
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"<={b}ms" for b in QUEUE_DELAY_BUCKETS_MS] + [
+                f">{QUEUE_DELAY_BUCKETS_MS[-1]}ms"
+            ]
+            return {
+                "pid": os.getpid(),
+                "threads": settings.SYNC_VIEW_THREADS,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "mean_ms": round(self.total_ms / self.requests, 2)
+                if self.requests
+                else 0.0,
+                "max_ms": round(self.max_ms, 2),
+                "histogram": dict(zip(labels, self.buckets)),
+            }
+
+
+queue_metrics = QueueDelayMetrics()
+
+
+class PooledASGIHandler(ASGIHandler):
+    def __init__(self, threads=None):
+        super().__init__()
+        self.threads = threads or settings.SYNC_VIEW_THREADS
+        self._workers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sync-view-{i}")
+            for i in range(self.threads)
+        ]
+        # Created lazily: it must belong to the server's event loop
+        self._idle = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._routes_to_async_view(scope["path"]):
+            return await super().__call__(scope, receive, send)
+
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for worker in self._workers:
+                self._idle.put_nowait(worker)
+
+        queued = time.perf_counter()
+        queue_metrics.waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            queue_metrics.waiting -= 1
+        delay_ms = (time.perf_counter() - queued) * 1000
+        queue_metrics.observe(delay_ms)
+        if delay_ms >= settings.SYNC_VIEW_QUEUE_WARN_MS:
+            logger.warning(
+                "%s waited %.0f ms for a sync view thread", scope["path"], delay_ms
+            )
+
+        queue_metrics.in_flight += 1
+        try:
+            async with ThreadSensitiveContext() as context:
+                # Hand the request our worker instead of letting asgiref
+                # create (and later shut down) a fresh one for it
+                SyncToAsync.context_to_thread_executor[context] = worker
+                try:
+                    await self.handle(scope, receive, self._timed(send, delay_ms))
+                finally:
+                    SyncToAsync.context_to_thread_executor.pop(context, None)
+        finally:
+            queue_metrics.in_flight -= 1
+            self._idle.put_nowait(worker)
+
+    def _routes_to_async_view(self, path):
+        try:
+            match = get_resolver().resolve(path)
+        except Resolver404:
+            return False
+        return iscoroutinefunction(match.func)
+
+    @staticmethod
+    def _timed(send, delay_ms):
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", f"queue;dur={delay_ms:.1f}".encode("ascii"))
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        return send_with_timing
+
+
+def get_asgi_handler():
+    """The HTTP handler for ova/asgi.py: pooled when SYNC_VIEW_THREADS is set,
+    Django's default otherwise."""
+    if settings.SYNC_VIEW_THREADS > 0:
+        return PooledASGIHandler()
+    return ASGIHandler()
@@ -72,6 +72,8 @@ MIDDLEWARE = [
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "ova.page_cache.PageCacheMiddleware",
+    "courses.routing.RouteCacheMiddleware",
 ]
 
 ROOT_URLCONF = "ova.urls"
@@ -184,6 +186,22 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    # Pre-rendered public pages (see courses/bake.py)
+    "baked": (
+        {
+            "BACKEND": "storages.backends.azure_storage.AzureStorage",
+            "OPTIONS": {
+                "azure_container": os.getenv("AZURE_CONTAINER_BAKED"),
+                "connection_string": AZURE_STORAGE_CONNECTION,
+                "account_key": AZURE_ACCOUNT_KEY,
+            },
+        }
+        if os.getenv("AZURE_CONTAINER_BAKED")
+        else {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": os.path.join(BASE_DIR, "baked")},
+        }
+    ),
 }
 # https://ovastorageacct.blob.core.windows.net/ovablob
 
@@ -283,3 +301,89 @@ ACCOUNT_ADAPTER = "users.adapter.ACSAccountAdapter"
 CERT_FUNCTION_URL = os.getenv("CERT_FUNCTION_URL")
 
 VIMEO_ACCESS_TOKEN = os.getenv("VIMEO_ACCESS_TOKEN")
+
+# Progress heartbeats
+# When enabled, sub-100% heartbeats are held in memory and flushed in bulk
+# every PROGRESS_WRITE_BEHIND_INTERVAL seconds (see courses/progress.py).
+PROGRESS_WRITE_BEHIND = os.getenv("PROGRESS_WRITE_BEHIND", "").lower() in ("1", "true", "yes")
+PROGRESS_WRITE_BEHIND_INTERVAL = int(os.getenv("PROGRESS_WRITE_BEHIND_INTERVAL", "10"))
+
+# Completion reconciliation: "sync" updates chapter/course completion inside
+# the heartbeat request; "deferred" queues it (PendingCompletion) for a
+# background worker that batches completions arriving within
+# PROGRESS_RECONCILE_WINDOW seconds.
+PROGRESS_RECONCILE_MODE = os.getenv("PROGRESS_RECONCILE_MODE", "sync")
+PROGRESS_RECONCILE_WINDOW = float(os.getenv("PROGRESS_RECONCILE_WINDOW", "1"))
+
+# ASGI serving (see ova/serving.py and ova/prefork.py)
+# SYNC_VIEW_THREADS > 0 runs sync views on that many long-lived worker threads
+# per process and records how long requests queue for one; requests that
+# waited at least SYNC_VIEW_QUEUE_WARN_MS are logged.
+SYNC_VIEW_THREADS = int(os.getenv("SYNC_VIEW_THREADS", "0"))
+SYNC_VIEW_QUEUE_WARN_MS = int(os.getenv("SYNC_VIEW_QUEUE_WARN_MS", "500"))
+
+# Segment pages cache the markup that's the same for every learner (see
+# courses/overlay.py) for up to SEGMENT_SHELL_TIMEOUT seconds; 0 disables it.
+SEGMENT_SHELL_TIMEOUT = int(os.getenv("SEGMENT_SHELL_TIMEOUT", "3600"))
+
+# Cache backends, picked by name below: "locmem" (per process), "file" (a
+# directory shared by the processes on one machine), "database" (the
+# table made by createcachetable) or "redis" (needs the redis package).
+_CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "database": "django.core.cache.backends.db.DatabaseCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+
+# CACHE_BACKEND is the default cache: course outlines, the catalog, routes
+# and segment shells, and the version keys bumped to invalidate them. With
+# several web workers (WEB_WORKERS > 1) it must be shared, or a publish only
+# reaches the worker that handled it; ova.prefork refuses to start with a
+# per-process one. CACHE_LOCATION is the directory, table or redis:// URL.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+# Entries it keeps before culling (Redis evicts by its own maxmemory policy
+# instead). The default fits an outline per course plus a route, a course
+# lookup and a few shell fragments per page, well past Django's 300.
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+_CACHE_LOCATIONS = {
+    "file": os.path.join(BASE_DIR, "django_cache"),
+    "database": "django_cache",
+}
+
+# Full-page cache for anonymous visitors (see ova/page_cache.py)
+# PAGE_CACHE_BACKEND picks where pages are kept, from the same names.
+# PAGE_CACHE_LOCATION is the directory, table or redis:// URL.
+# PAGE_CACHE_TIMEOUT = 0 disables the cache.
+PAGE_CACHE_BACKEND = os.getenv("PAGE_CACHE_BACKEND", "locmem")
+
+CACHES = {
+    "default": {
+        "BACKEND": _CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": os.getenv("CACHE_LOCATION", _CACHE_LOCATIONS.get(CACHE_BACKEND, "")),
+        "OPTIONS": {} if CACHE_BACKEND == "redis" else {"MAX_ENTRIES": CACHE_MAX_ENTRIES},
+    },
+    "pages": {
+        "BACKEND": _CACHE_BACKENDS[PAGE_CACHE_BACKEND],
+        "LOCATION": os.getenv(
+            "PAGE_CACHE_LOCATION",
+            {
+                "file": os.path.join(BASE_DIR, "page_cache"),
+                "database": "page_cache",
+            }.get(PAGE_CACHE_BACKEND, "pages"),
+        ),
+        "TIMEOUT": None,
+    },
+}
+
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "600"))
+# How long stale copies are kept to serve while one request re-renders
+PAGE_CACHE_STALE_GRACE = int(os.getenv("PAGE_CACHE_STALE_GRACE", "60"))
+PAGE_CACHE_LOCK_TIMEOUT = int(os.getenv("PAGE_CACHE_LOCK_TIMEOUT", "10"))
+
+# Static bake of the public pages (see courses/bake.py)
+# BAKE_JOBS is the default number of render processes for bake_pages; with
+# BAKE_ON_PUBLISH, publishing a page runs an incremental bake in the
+# background.
+BAKE_JOBS = int(os.getenv("BAKE_JOBS", "4"))
+BAKE_ON_PUBLISH = os.getenv("BAKE_ON_PUBLISH", "").lower() in ("1", "true", "yes")
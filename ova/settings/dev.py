@@ -31,6 +31,9 @@ if DEBUG:
 # This is for debug toolbar - no need to use in prod
 INTERNAL_IPS = ["127.0.0.1"]
 
+# Don't serve stale pages while editing templates
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "0"))
+
 # STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
@@ -24,3 +24,6 @@ DATABASES = {
 
 # Fast hashing — the auth_client fixture creates a user with a real password.
 PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+# Tests that exercise the page cache turn it on with override_settings
+PAGE_CACHE_TIMEOUT = 0
@@ -1,5 +1,648 @@
+from io import StringIO
+
+import pytest
+from django.test import override_settings
+
+
 def test_asgi_app_loads():
     """Verify the ASGI application (Daphne entry point) can start without errors."""
     from ova.asgi import application
 
-    assert application is not None
\ No newline at end of file
+    assert application is not None
+
+
+def test_prefork_refuses_per_process_caches():
+    """Version bumps in a LocMem cache would only reach one worker."""
+    from ova.prefork import main, unshared_caches
+
+    shared = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "c"}
+    local = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+
+    with override_settings(CACHES={"default": local, "pages": local}, PAGE_CACHE_TIMEOUT=0):
+        assert unshared_caches(1) == []
+        assert unshared_caches(2) == ["default"]
+        with pytest.raises(SystemExit):
+            main(["--workers", "2"])
+    with override_settings(CACHES={"default": shared, "pages": local}, PAGE_CACHE_TIMEOUT=600):
+        assert unshared_caches(2) == ["pages"]
+    with override_settings(CACHES={"default": shared, "pages": shared}, PAGE_CACHE_TIMEOUT=600):
+        assert unshared_caches(2) == []
+
+
+def _asgi_post(application, path):
+    from asgiref.sync import async_to_sync
+    from asgiref.testing import ApplicationCommunicator
+
+    async def run():
+        communicator = ApplicationCommunicator(
+            application,
+            {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "POST",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "headers": [(b"content-type", b"application/json")],
+            },
+        )
+        await communicator.send_input(
+            {"type": "http.request", "body": b"{}", "more_body": False}
+        )
+        start = await communicator.receive_output()
+        await communicator.receive_output()
+        await communicator.wait()
+        return start
+
+    return async_to_sync(run)()
+
+
+def test_pooled_handler_times_sync_views():
+    """Sync views run on the bounded pool and report their queueing delay;
+    async views bypass it."""
+    from ova.serving import PooledASGIHandler, queue_metrics
+
+    queue_metrics.reset()
+    handler = PooledASGIHandler(threads=1)
+
+    start = _asgi_post(handler, "/api/progress/update/")
+    headers = dict(start["headers"])
+
+    assert start["status"] == 400
+    assert headers[b"server-timing"].startswith(b"queue;dur=")
+    assert queue_metrics.snapshot()["requests"] == 1
+
+    start = _asgi_post(handler, "/api/progress/update/async/")
+
+    assert start["status"] == 400
+    assert b"server-timing" not in dict(start["headers"])
+    assert queue_metrics.snapshot()["requests"] == 1
+
+
+def test_queue_delay_histogram():
+    from ova.serving import QueueDelayMetrics
+
+    metrics = QueueDelayMetrics()
+    for delay_ms in (0.5, 3, 3, 7000):
+        metrics.observe(delay_ms)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["requests"] == 4
+    assert snapshot["max_ms"] == 7000
+    assert snapshot["histogram"]["<=1ms"] == 1
+    assert snapshot["histogram"]["<=5ms"] == 2
+    assert snapshot["histogram"][">5000ms"] == 1
+
+
+PAGE_CACHE_SETTINGS = {
+    "PAGE_CACHE_TIMEOUT": 60,
+    "STORAGES": {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    },
+}
+
+
+@pytest.fixture
+def cached_course():
+    from django.core.cache import caches
+    from wagtail.models import Site
+
+    from courses.models import ChapterPage, CoursePage, SegmentPage
+
+    caches["pages"].clear()
+    home = Site.objects.get(is_default_site=True).root_page
+    course = CoursePage(title="Cached Course", live=True)
+    home.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+    return {"course": course, "segment": segment}
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_serves_anonymous_repeats(client, cached_course, django_assert_num_queries):
+    url = cached_course["segment"].url
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first["X-Page-Cache"] == "miss"
+
+    with django_assert_num_queries(0):
+        second = client.get(url)
+    assert second["X-Page-Cache"] == "hit"
+    assert second.content == first.content
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_publish_bumps_version(client, cached_course):
+    from courses.models import SegmentPage
+
+    url = cached_course["segment"].url
+    client.get(url)
+
+    segment = SegmentPage.objects.get(pk=cached_course["segment"].pk)
+    segment.title = "Renamed Segment"
+    segment.save_revision().publish()
+
+    # The rename moved the page; the old URL's copy is no longer served
+    assert client.get(url).status_code == 404
+    new_url = SegmentPage.objects.get(pk=segment.pk).url
+    response = client.get(new_url)
+    assert response["X-Page-Cache"] == "miss"
+    assert b"Renamed Segment" in response.content
+
+    # Snippet edits bump the version too
+    from home.models import Announcement
+
+    Announcement.objects.create(text="New", button_text="Go", button_url="https://example.com")
+    assert client.get(new_url)["X-Page-Cache"] == "miss"
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_version_follows_watched_models_only(django_user_model):
+    from taggit.models import Tag
+    from wagtail.models import get_page_models
+
+    from ova.page_cache import PAGE_MODELS, content_version
+
+    # Every page type is watched, so a new one can't be left out
+    assert set(PAGE_MODELS) == {model._meta.label_lower for model in get_page_models()}
+
+    version = content_version()
+    django_user_model.objects.create_user("unwatched", password="x")
+    assert content_version() == version
+
+    Tag.objects.create(name="Watched", slug="watched")
+    assert content_version() > version
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_skips_signed_in_and_gated(client, cached_course):
+    from users.models import User
+
+    course = cached_course["course"]
+    course.coming_soon = "Spring"
+    course.save_revision().publish()
+
+    url = cached_course["segment"].url
+    for _ in range(2):
+        response = client.get(url)
+        assert response.status_code == 403
+        assert "X-Page-Cache" not in response
+
+    course.coming_soon = ""
+    course.save_revision().publish()
+    client.get(url)
+    client.force_login(User.objects.create_user(email="cache@example.com", password="pass"))
+    assert "X-Page-Cache" not in client.get(url)
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_serves_stale_while_locked(client, cached_course):
+    from django.test import RequestFactory
+
+    from ova.page_cache import _lock_key, bump_content_version, page_cache, page_key
+
+    url = cached_course["segment"].url
+    client.get(url)
+    bump_content_version()
+
+    # Another request is already re-rendering the page
+    key = page_key(RequestFactory().get(url))
+    page_cache().add(_lock_key(key), 1, 10)
+    assert client.get(url)["X-Page-Cache"] == "stale"
+
+    page_cache().delete(_lock_key(key))
+    assert client.get(url)["X-Page-Cache"] == "miss"
+    assert client.get(url)["X-Page-Cache"] == "hit"
+
+
+@pytest.mark.django_db
+@override_settings(**PAGE_CACHE_SETTINGS)
+def test_page_cache_renders_locked_page_without_copy(client, cached_course, monkeypatch):
+    """With nothing to serve, a request that loses the lock renders the page
+    itself instead of sleeping on its thread until the winner is done."""
+    import time
+
+    from django.test import RequestFactory
+
+    from ova.page_cache import _lock_key, page_cache, page_key
+
+    url = cached_course["segment"].url
+    key = page_key(RequestFactory().get(url))
+    page_cache().add(_lock_key(key), 1, 10)
+
+    def no_sleep(seconds):
+        raise AssertionError("waited for the lock")
+
+    monkeypatch.setattr(time, "sleep", no_sleep)
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert "X-Page-Cache" not in response
+    # Only the lock holder stores the page
+    assert page_cache().get(key) is None
+
+
+def _analytics_course(root, n, instructor, tag):
+    from courses.models import ChapterPage, CoursePage, SegmentPage, InstructorsOrderable
+
+    course = CoursePage(title=f"Analytics Course {n}", live=True)
+    root.add_child(instance=course)
+    InstructorsOrderable.objects.create(page=course, instructor=instructor)
+    course.tags.add(tag)
+    course.save()
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+    return course, segment
+
+
+@pytest.mark.django_db
+def test_analytics_queries_do_not_grow_with_catalog(django_user_model):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from wagtail.models import Page
+
+    from courses.models import CourseProgress, Instructor, Role, SegmentProgress
+    from ova.analytics import collect_metrics
+
+    root = Page.get_first_root_node()
+    role = Role.objects.create(name="analytics-instructor")
+    learner = django_user_model.objects.create_user("learner", password="x")
+
+    def add_courses(start, count):
+        for n in range(start, start + count):
+            instructor = Instructor.objects.create(name=f"Instructor {n}", role=role, bio="")
+            course, segment = _analytics_course(root, n, instructor, f"analytics-tag-{n}")
+            CourseProgress.objects.create(user=learner, course=course, completed=n % 2 == 0)
+            SegmentProgress.objects.create(user=learner, segment=segment, percent_watched=40 + n)
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as queries:
+            metrics = collect_metrics()
+        return len(queries), metrics
+
+    add_courses(0, 2)
+    small, _ = count_queries()
+    add_courses(2, 6)
+    large, metrics = count_queries()
+
+    assert large == small
+    content = metrics["content_metrics"]
+    assert content["total_courses"] == 8
+    stats = {stat["title"]: stat for stat in content["course_stats"]}
+    assert stats["Analytics Course 3"]["starts"] == 1
+    assert stats["Analytics Course 3"]["completions"] == 0
+    assert stats["Analytics Course 4"]["completion_rate"] == 100
+    assert stats["Analytics Course 3"]["avg_watch_percentage"] == 43
+    assert stats["Analytics Course 3"]["instructors"] == ["Instructor 3"]
+    assert stats["Analytics Course 3"]["tags"] == ["analytics-tag-3"]
+    instructors = {stat["name"]: stat for stat in content["instructor_stats"]}
+    assert instructors["Instructor 4"]["courses_count"] == 1
+    assert instructors["Instructor 4"]["total_completions"] == 1
+    assert {stat["name"] for stat in content["tag_stats"]} == {
+        f"analytics-tag-{n}" for n in range(8)
+    }
+
+
+@pytest.mark.django_db
+@override_settings(STORAGES=PAGE_CACHE_SETTINGS["STORAGES"])
+def test_analytics_dashboard_renders_latest_snapshot(admin_client, monkeypatch):
+    from django.urls import reverse
+
+    from courses.models import AnalyticsSnapshot
+    from ova import analytics
+
+    url = reverse("admin:analytics-dashboard")
+
+    # The first visit takes a snapshot; later ones reuse the latest
+    response = admin_client.get(url)
+    assert response.status_code == 200
+    assert AnalyticsSnapshot.objects.count() == 1
+    admin_client.get(url)
+    assert AnalyticsSnapshot.objects.count() == 1
+
+    woken = []
+    monkeypatch.setattr(analytics.snapshot_worker, "wake", lambda: woken.append(1))
+    response = admin_client.post(url)
+    assert response.status_code == 302
+    assert woken == [1]
+
+
+@pytest.mark.django_db
+def test_snapshot_command_keeps_history():
+    from datetime import timedelta
+
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from courses.models import AnalyticsSnapshot
+    from ova.analytics import trend
+
+    old = AnalyticsSnapshot.objects.create(
+        created_at=timezone.now() - timedelta(days=400),
+        metrics={"user_metrics": {"total_users": 3}},
+    )
+    call_command("snapshot_analytics", stdout=StringIO())
+
+    rows = trend()
+    assert [row["total_users"] for row in rows][0] == 3
+    assert rows[-1]["course_starts"] == 0
+    latest = AnalyticsSnapshot.objects.first()
+    assert set(latest.metrics) == {
+        "generated_at",
+        "user_metrics",
+        "engagement_metrics",
+        "content_metrics",
+    }
+
+    call_command("snapshot_analytics", keep_days=365, stdout=StringIO())
+    assert not AnalyticsSnapshot.objects.filter(pk=old.pk).exists()
+    assert AnalyticsSnapshot.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_daily_rollups_only_reread_days_since_the_watermark(django_user_model):
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from wagtail.models import Page
+
+    from courses.models import (
+        ChapterPage,
+        CoursePage,
+        CourseProgress,
+        DailySiteActivity,
+        SegmentPage,
+        SegmentProgress,
+    )
+    from ova.rollups import site_window, update_rollups
+
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Rollup Course", live=True)
+    root.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    first = SegmentPage(title="First", live=True)
+    chapter.add_child(instance=first)
+    second = SegmentPage(title="Second", live=True)
+    chapter.add_child(instance=second)
+
+    now = timezone.now()
+    today = timezone.localdate(now)
+    three_days_ago = now - timedelta(days=3)
+    learner = django_user_model.objects.create_user("rollup", password="x")
+    django_user_model.objects.filter(pk=learner.pk).update(date_joined=three_days_ago)
+
+    SegmentProgress.objects.create(user=learner, segment=first, percent_watched=100)
+    SegmentProgress.objects.filter(user=learner).update(last_updated=three_days_ago)
+
+    assert update_rollups(now) == timezone.localdate(three_days_ago)
+    day = DailySiteActivity.objects.get()
+    assert (day.day, day.new_users, day.active_learners, day.completions) == (
+        timezone.localdate(three_days_ago),
+        1,
+        1,
+        0,
+    )
+
+    # Back today on another segment, finishing the course: counted today,
+    # and the earlier day is left alone
+    SegmentProgress.objects.create(user=learner, segment=second, percent_watched=50)
+    CourseProgress.objects.create(
+        user=learner, course=course, completed=True, completed_at=now
+    )
+
+    assert update_rollups(now + timedelta(minutes=1)) == today
+    rows = {row.day: row for row in DailySiteActivity.objects.all()}
+    assert rows[today].active_learners == 1
+    assert rows[today].completions == 1
+    assert rows[timezone.localdate(three_days_ago)].new_users == 1
+
+    assert site_window(now, 7) == {"new_users": 1, "completions": 1}
+    assert site_window(now, 1) == {"new_users": 0, "completions": 1}
+
+
+@pytest.mark.django_db
+def test_rollup_windows_match_the_grouped_query_totals(django_user_model):
+    """site_window is a rolling window, like the live counts it replaced,
+    including activity on the partial day at its start."""
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from wagtail.models import Page
+
+    from courses.models import CoursePage, CourseProgress
+    from ova.rollups import site_window, update_rollups
+
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Window Course", live=True)
+    root.add_child(instance=course)
+
+    now = timezone.now()
+    ages = [
+        timedelta(hours=1),
+        timedelta(days=6, hours=23),
+        timedelta(days=7, hours=1),
+        timedelta(days=7, minutes=-5),
+        timedelta(days=29, hours=20),
+        timedelta(days=30, hours=1),
+        timedelta(days=45),
+    ]
+    for n, age in enumerate(ages):
+        learner = django_user_model.objects.create_user(f"window{n}", password="x")
+        django_user_model.objects.filter(pk=learner.pk).update(date_joined=now - age)
+        CourseProgress.objects.create(
+            user=learner, course=course, completed=True, completed_at=now - age
+        )
+    staff = django_user_model.objects.create_user("window-staff", password="x")
+    django_user_model.objects.filter(pk=staff.pk).update(is_staff=True)
+
+    update_rollups(now)
+
+    learners = django_user_model.objects.filter(is_staff=False)
+    for days in (7, 30):
+        since = now - timedelta(days=days)
+        assert site_window(now, days) == {
+            "new_users": learners.filter(date_joined__gte=since).count(),
+            "completions": CourseProgress.objects.filter(
+                completed=True, completed_at__gte=since
+            ).count(),
+        }
+
+
+@pytest.mark.django_db
+def test_rollup_rebuild_keeps_overwritten_activity(django_user_model):
+    from datetime import timedelta
+
+    from django.utils import timezone
+    from wagtail.models import Page
+
+    from courses.models import (
+        ChapterPage,
+        CoursePage,
+        DailySiteActivity,
+        SegmentPage,
+        SegmentProgress,
+    )
+    from ova.rollups import update_rollups
+
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Rebuild Course", live=True)
+    root.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+
+    now = timezone.now()
+    earlier = now - timedelta(days=3)
+    learner = django_user_model.objects.create_user("rebuild", password="x")
+    SegmentProgress.objects.create(user=learner, segment=segment, percent_watched=40)
+    SegmentProgress.objects.filter(user=learner).update(last_updated=earlier)
+    update_rollups(now)
+
+    # The learner comes back today: their only row moves to today
+    SegmentProgress.objects.filter(user=learner).update(last_updated=now)
+    update_rollups(now + timedelta(minutes=1), rebuild=True)
+
+    active = dict(DailySiteActivity.objects.values_list("day", "active_learners"))
+    assert active == {timezone.localdate(earlier): 1, timezone.localdate(now): 1}
+
+
+def test_background_worker_reruns_for_wakes_during_a_run_and_on_stop():
+    import threading
+
+    from ova.background import BackgroundWorker, _workers
+
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    class Worker(BackgroundWorker):
+        name = "test-worker"
+
+        def work(self):
+            runs.append(len(runs))
+            started.set()
+            release.wait(5)
+
+    worker = Worker()
+    try:
+        worker.wake()
+        assert started.wait(5)
+        # Woken twice mid-run: one more run covers both
+        worker.wake()
+        worker.wake()
+        assert worker.busy
+        release.set()
+        assert worker.stop(5)
+        assert runs == [0, 1]
+        assert not worker.busy
+    finally:
+        release.set()
+        _workers.remove(worker)
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(PROGRESS_WRITE_BEHIND=True, PROGRESS_WRITE_BEHIND_INTERVAL=3600)
+def test_prefork_worker_flushes_buffered_progress_on_sigterm(django_user_model):
+    """A stopped worker exits with os._exit, so it must flush the write-behind
+    buffer itself rather than rely on atexit. The test database lives in
+    memory, so the child reports what it stored through a pipe."""
+    import argparse
+    import http.client
+    import os
+    import signal
+    import socket
+    import time
+
+    from django.db import connections
+    from wagtail.models import Page
+
+    from courses.models import ChapterPage, CoursePage, SegmentPage, SegmentProgress
+    from courses.progress import progress_buffer
+    from ova.asgi import application
+    from ova.prefork import serve_worker
+
+    root = Page.get_first_root_node()
+    course = CoursePage(title="Prefork Course", live=True)
+    root.add_child(instance=course)
+    chapter = ChapterPage(title="Chapter", live=True)
+    course.add_child(instance=chapter)
+    segment = SegmentPage(title="Segment", live=True)
+    chapter.add_child(instance=segment)
+    learner = django_user_model.objects.create_user("prefork", password="x")
+
+    sock = socket.create_server(("127.0.0.1", 0))
+    sock.setblocking(False)
+    port = sock.getsockname()[1]
+    args = argparse.Namespace(http_timeout=None, verbosity=0)
+    connections.close_all()
+    read_fd, write_fd = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        real_exit = os._exit
+
+        def report_and_exit(status):
+            stored = (
+                SegmentProgress.objects.filter(user=learner, segment=segment)
+                .values_list("percent_watched", flat=True)
+                .first()
+            )
+            os.write(write_fd, f"{stored}".encode())
+            real_exit(status)
+
+        try:
+            os.close(read_fd)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            progress_buffer.record(learner.pk, segment.pk, 40)
+            os._exit = report_and_exit
+            serve_worker(application, sock, args)
+        finally:
+            real_exit(1)
+
+    os.close(write_fd)
+
+    try:
+        # Wait until Daphne answers, so its SIGTERM handler is in place
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                conn.request("GET", "/api/progress/update/")
+                conn.getresponse().read()
+                conn.close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+        assert not SegmentProgress.objects.filter(user=learner).exists()
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+    except BaseException:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        raise
+    finally:
+        sock.close()
+        with os.fdopen(read_fd) as pipe:
+            stored = pipe.read()
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert float(stored) == 40
@@ -2,4 +2,11 @@
 set -e
 
 python3 manage.py collectstatic --no-input --settings=ova.settings.production
+# Tables for CACHE_BACKEND / PAGE_CACHE_BACKEND=database (a no-op otherwise)
+python3 manage.py createcachetable --settings=ova.settings.production
+
+# WEB_WORKERS > 1: pre-forked Daphne processes sharing one socket (ova/prefork.py)
+if [ "${WEB_WORKERS:-1}" -gt 1 ]; then
+    exec python3 -m ova.prefork -b 0.0.0.0 -p 8000 --workers "$WEB_WORKERS"
+fi
 exec daphne -b 0.0.0.0 -p 8000 ova.asgi:application
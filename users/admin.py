@@ -7,8 +7,6 @@ from django.shortcuts import render, get_object_or_404
 from .models import User
 from courses.models import (
     CoursePage,
-    ChapterPage,
-    SegmentPage,
     CourseProgress,
     ChapterProgress,
     SegmentProgress,
@@ -78,10 +76,10 @@ class UserAdmin(BaseUserAdmin):
         if course_id:
             selected_course = get_object_or_404(CoursePage, pk=course_id)
 
-            chapters = (
-                selected_course.get_children().type(ChapterPage).live().specific()
-            )
-            total_chapters = chapters.count()
+            outline = selected_course.outline
+            chapters = outline.chapters
+            chapter_ids = [ch.id for ch in chapters]
+            total_chapters = len(chapters)
 
             # course progress (persisted)
             course_progress = CourseProgress.objects.filter(
@@ -89,48 +87,35 @@ class UserAdmin(BaseUserAdmin):
                 course=selected_course,
             ).first()
 
-            completed_chapters = ChapterProgress.objects.filter(
-                user=user,
-                chapter__in=chapters,
-                completed=True,
-            ).count()
-
-            course_percent_complete = (
-                int((completed_chapters / total_chapters) * 100)
-                if total_chapters > 0
-                else 0
-            )
-
             # bulk-load chapter + segment progress
             chapter_progress_map = {
                 cp.chapter_id: cp
                 for cp in ChapterProgress.objects.filter(
                     user=user,
-                    chapter__in=chapters,
+                    chapter_id__in=chapter_ids,
                 )
             }
+            completed_chapters = sum(
+                1 for cp in chapter_progress_map.values() if cp.completed
+            )
 
-            segments = (
-                SegmentPage.objects.filter(path__startswith=selected_course.path)
-                .live()
-                .specific()
+            course_percent_complete = (
+                int((completed_chapters / total_chapters) * 100)
+                if total_chapters > 0
+                else 0
             )
 
             segment_progress_map = {
                 sp.segment_id: sp
                 for sp in SegmentProgress.objects.filter(
                     user=user,
-                    segment__in=segments,
+                    segment_id__in=[s.id for s in outline.segments],
                 )
             }
 
             progress = []
 
             for chapter in chapters:
-                chapter_segments = [
-                    s for s in segments if s.get_parent().id == chapter.id
-                ]
-
                 progress.append(
                     {
                         "chapter": chapter,
@@ -140,7 +125,7 @@ class UserAdmin(BaseUserAdmin):
                                 "segment": seg,
                                 "progress": segment_progress_map.get(seg.id),
                             }
-                            for seg in chapter_segments
+                            for seg in chapter.segments
                         ],
                     }
                 )